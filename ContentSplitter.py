@@ -1,7 +1,10 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import os
-import math
+
+from runProfile import REPORT_SUFFIX, RunProfile
+from scanEngine import ScanError, format_rate, split
+from splitStrategies import BALANCE_MODES, BY_COUNT, ORDERED, PACKING_MODES
 
 class TSXFileSplitter:
     def __init__(self, root):
@@ -46,6 +49,29 @@ class TSXFileSplitter:
         self.pieces_entry = ttk.Entry(self.pieces_frame, textvariable=self.pieces_var, width=10)
         self.pieces_entry.grid(row=0, column=1, padx=5)
         
+        ttk.Label(self.pieces_frame, text="Balance by:").grid(row=0, column=2, padx=5)
+        self.balance_var = tk.StringVar(value=BY_COUNT)
+        self.balance_combo = ttk.Combobox(self.pieces_frame, textvariable=self.balance_var, values=BALANCE_MODES,
+                                          state='readonly', width=8)
+        self.balance_combo.grid(row=0, column=3, padx=5)
+        
+        ttk.Label(self.pieces_frame, text="Packing:").grid(row=0, column=4, padx=5)
+        self.packing_var = tk.StringVar(value=ORDERED)
+        self.packing_combo = ttk.Combobox(self.pieces_frame, textvariable=self.packing_var, values=PACKING_MODES,
+                                          state='readonly', width=8)
+        self.packing_combo.grid(row=0, column=5, padx=5)
+        
+        # A limit replaces the number of pieces when set
+        ttk.Label(self.pieces_frame, text="Max bytes/tokens per part:").grid(row=1, column=0, columnspan=2, padx=5)
+        self.max_per_part_var = tk.StringVar(value="")
+        self.max_per_part_entry = ttk.Entry(self.pieces_frame, textvariable=self.max_per_part_var, width=12)
+        self.max_per_part_entry.grid(row=1, column=2, columnspan=2, padx=5, sticky=tk.W)
+        
+        # Phase timings and the slowest parts, logged and saved next to the parts
+        self.profile_var = tk.BooleanVar(value=False)
+        self.profile_check = ttk.Checkbutton(self.pieces_frame, text="Profile the split", variable=self.profile_var)
+        self.profile_check.grid(row=2, column=0, columnspan=2, padx=5, sticky=tk.W)
+        
         # Output directory selection
         self.output_frame = ttk.LabelFrame(self.main_frame, text="Output Directory", padding="5")
         self.output_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
@@ -76,7 +102,7 @@ class TSXFileSplitter:
     def browse_source(self):
         file_selected = filedialog.askopenfilename(
             title="Select TSX Index File",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=[("Text files", "*.txt"), ("Compressed exports", "*.gz *.zst"), ("All files", "*.*")]
         )
         if file_selected:
             self.source_path.set(file_selected)
@@ -88,72 +114,53 @@ class TSXFileSplitter:
         if folder_selected:
             self.output_path.set(folder_selected)
             
+    def on_progress(self, event, value):
+        if event == 'sections':
+            self.status_text.delete(1.0, tk.END)
+            self.status_text.insert(tk.END, f"Total TSX files found: {value}\n")
+            if self.max_per_part_var.get().strip():
+                self.status_text.insert(tk.END, f"Splitting into parts of at most {self.max_per_part_var.get()} "
+                                                f"{self.balance_var.get()}...\n\n")
+            else:
+                self.status_text.insert(tk.END, f"Splitting into {self.pieces_var.get()} pieces...\n\n")
+        elif event == 'part':
+            output_file, runs, written, seconds = value
+            files = sum(end_idx - start_idx for start_idx, end_idx in runs)
+            self.status_text.insert(tk.END, f"Created: {os.path.basename(output_file)}\n")
+            self.status_text.insert(tk.END, f"Contains {files} files ({format_rate(written, seconds)})\n\n")
+        self.root.update()
+            
     def split_file(self):
         try:
-            source_file = self.source_path.get()
-            output_dir = self.output_path.get()
             num_pieces = int(self.pieces_var.get())
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid number for pieces!")
+            return
+        
+        max_per_part = self.max_per_part_var.get().strip()
+        try:
+            max_per_part = int(max_per_part) if max_per_part else None
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid number for the per-part limit!")
+            return
             
-            if not source_file or not output_dir:
-                messagebox.showerror("Error", "Please select source file and output directory!")
-                return
-                
-            if num_pieces < 2:
-                messagebox.showerror("Error", "Number of pieces must be at least 2!")
-                return
-            
-            # Read the source file and split into file sections
-            with open(source_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Split content by file sections
-            file_sections = content.split("\nFile: ")
-            header = file_sections[0]  # Get the header section
-            file_sections = file_sections[1:]  # Remove header from sections
-            
-            if not file_sections:
-                messagebox.showerror("Error", "No file sections found in the source file!")
-                return
-            
-            # Calculate sections per file
-            total_sections = len(file_sections)
-            sections_per_file = math.ceil(total_sections / num_pieces)
-            
-            self.status_text.delete(1.0, tk.END)
-            self.status_text.insert(tk.END, f"Total TSX files found: {total_sections}\n")
-            self.status_text.insert(tk.END, f"Splitting into {num_pieces} pieces...\n\n")
-            
-            # Create split files
-            base_name = os.path.splitext(os.path.basename(source_file))[0]
-            
-            for i in range(num_pieces):
-                start_idx = i * sections_per_file
-                end_idx = min((i + 1) * sections_per_file, total_sections)
-                
-                if start_idx >= total_sections:
-                    break
-                
-                output_file = os.path.join(output_dir, f"{base_name}_part{i+1}.txt")
-                
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    # Write header to each file
-                    f.write(header)
-                    f.write(f"\nPart {i+1} of {num_pieces}\n")
-                    f.write(f"Contains files {start_idx + 1} to {end_idx} of {total_sections}\n\n")
-                    
-                    # Write file sections
-                    for section in file_sections[start_idx:end_idx]:
-                        f.write("\nFile: " + section)
-                
-                self.status_text.insert(tk.END, f"Created: {os.path.basename(output_file)}\n")
-                self.status_text.insert(tk.END, f"Contains {end_idx - start_idx} files\n\n")
-                self.root.update()
+        profile = RunProfile('split') if self.profile_var.get() else None
+        try:
+            parts = split(self.source_path.get(), self.output_path.get(), num_pieces, self.on_progress,
+                          balance=self.balance_var.get(), packing=self.packing_var.get(),
+                          max_per_part=max_per_part, profile=profile)
             
             self.status_text.insert(tk.END, "\nSplit completed successfully!")
-            messagebox.showinfo("Success", f"File split into {num_pieces} pieces successfully!")
+            if profile is not None:
+                report_path = os.path.join(self.output_path.get(),
+                                           os.path.basename(self.source_path.get()) + ".split" + REPORT_SUFFIX)
+                profile.save(report_path)
+                self.status_text.insert(tk.END, "\n\n" + "\n".join(profile.lines()) +
+                                        f"\nProfile saved to {report_path}\n")
+            messagebox.showinfo("Success", f"File split into {len(parts)} pieces successfully!")
             
-        except ValueError as e:
-            messagebox.showerror("Error", "Please enter a valid number for pieces!")
+        except ScanError as e:
+            messagebox.showerror("Error", str(e))
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
@@ -1,13 +1,33 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+
+from compressedExport import COMPRESSION_SUFFIXES, COMPRESSIONS
+from exportChunks import DEFAULT_CHUNK_BYTES
+from exportWatcher import ExportWatcher
+from fileClassifier import ContentPolicy
+from gitChanges import DEFAULT_REVISION
+from runProfile import REPORT_SUFFIX, RunProfile
+from scanEngine import ScanConfig, ScanError, export, format_rate, token_report
+from splitStrategies import BALANCE_MODES, BY_BYTES
+from tokenEstimate import EstimateTokenizer
+
+# Compression choice for a plain text export
+NO_COMPRESSION = 'none'
+
+# How often the UI drains progress events from the worker thread
+POLL_INTERVAL_MS = 100
+# Oldest log lines are dropped beyond this, so the Text widget never grows unbounded
+MAX_LOG_LINES = 500
 
 class CodeScanner:
     def __init__(self, root):
         self.root = root
         self.root.title("Code File Scanner")
-        self.root.geometry("700x650")  # Increased height for new controls
+        self.root.geometry("720x760")
         
         # Style configuration
         self.style = ttk.Style()
@@ -22,6 +42,18 @@ class CodeScanner:
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         
+        # Progress events sent from the scan worker thread to the UI
+        self.events = queue.Queue()
+        self.worker = None
+        self.scan_config = None
+        # Set while an export is being kept up to date; setting it stops the watcher
+        self.watch_stop = None
+        # RunProfile of the running export, when it is profiled
+        self.run_profile = None
+        self.found_count = 0
+        self.last_found = ""
+        self.sources_done = 0
+        
         # Create widgets
         self.create_widgets()
         
@@ -103,6 +135,39 @@ class CodeScanner:
         )
         self.test_check.grid(row=4, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W)
         
+        # Honour .gitignore / .ignore files found in the sources
+        self.use_ignore_files = tk.BooleanVar(value=True)
+        self.ignore_check = ttk.Checkbutton(
+            self.filetype_frame,
+            text="Respect .gitignore / .ignore files",
+            variable=self.use_ignore_files
+        )
+        self.ignore_check.grid(row=5, column=0, columnspan=2, padx=5, sticky=tk.W)
+        
+        # Extra gitignore-style patterns to leave out, comma separated
+        ttk.Label(self.filetype_frame, text="Exclude patterns:").grid(row=6, column=0, padx=5, sticky=tk.W)
+        self.exclude_patterns = tk.StringVar(value="")
+        self.exclude_entry = ttk.Entry(self.filetype_frame, textvariable=self.exclude_patterns, width=40)
+        self.exclude_entry.grid(row=6, column=1, padx=5, sticky=(tk.W, tk.E))
+        
+        # Review exports: ask git which files changed instead of walking the sources
+        self.changed_only = tk.BooleanVar(value=False)
+        self.changed_frame = ttk.Frame(self.filetype_frame)
+        self.changed_frame.grid(row=7, column=0, columnspan=2, padx=5, sticky=tk.W)
+        self.changed_check = ttk.Checkbutton(
+            self.changed_frame,
+            text="Only files changed in git since",
+            variable=self.changed_only
+        )
+        self.changed_check.grid(row=0, column=0, sticky=tk.W)
+        self.changed_revision = tk.StringVar(value=DEFAULT_REVISION)
+        self.changed_entry = ttk.Entry(self.changed_frame, textvariable=self.changed_revision, width=16)
+        self.changed_entry.grid(row=0, column=1, padx=5)
+        ttk.Label(self.changed_frame, text="plus related files:").grid(row=0, column=2, sticky=tk.W)
+        self.related_files = tk.StringVar(value="0")
+        self.related_entry = ttk.Entry(self.changed_frame, textvariable=self.related_files, width=5)
+        self.related_entry.grid(row=0, column=3, padx=5)
+        
         # Target folder selection
         self.target_frame = ttk.LabelFrame(self.main_frame, text="Target Directory (Output Location)", padding="5")
         self.target_frame.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
@@ -122,9 +187,116 @@ class CodeScanner:
         self.output_entry = ttk.Entry(self.output_frame, textvariable=self.output_name, width=60)
         self.output_entry.grid(row=0, column=0, columnspan=2, padx=5)
         
+        # Reuse unchanged files from the previous export via its manifest
+        self.incremental = tk.BooleanVar(value=False)
+        self.incremental_check = ttk.Checkbutton(
+            self.output_frame,
+            text="Incremental re-export (only re-read changed files)",
+            variable=self.incremental
+        )
+        self.incremental_check.grid(row=1, column=0, columnspan=2, padx=5, sticky=tk.W)
+        
+        # Leave out binary, generated and minified files, and truncate very large ones
+        self.skip_noise = tk.BooleanVar(value=True)
+        self.skip_noise_check = ttk.Checkbutton(
+            self.output_frame,
+            text="Skip binary, generated and minified files; truncate files over 2 MB",
+            variable=self.skip_noise
+        )
+        self.skip_noise_check.grid(row=2, column=0, columnspan=2, padx=5, sticky=tk.W)
+        
+        # Less common output options live in a frame that is only shown on request, so the log keeps its room
+        self.show_advanced = tk.BooleanVar(value=False)
+        self.advanced_check = ttk.Checkbutton(
+            self.output_frame,
+            text="Show advanced options",
+            variable=self.show_advanced,
+            command=self.toggle_advanced
+        )
+        self.advanced_check.grid(row=3, column=0, columnspan=2, padx=5, sticky=tk.W)
+        
+        self.advanced_frame = ttk.LabelFrame(self.main_frame, text="Advanced Options", padding="5")
+        self.advanced_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
+        self.advanced_frame.grid_remove()
+        
+        # Write straight into parts of a limited size instead of one file; leave empty for one file
+        self.parts_frame = ttk.Frame(self.advanced_frame)
+        self.parts_frame.grid(row=0, column=0, padx=5, sticky=tk.W)
+        ttk.Label(self.parts_frame, text="Parts of at most:").grid(row=0, column=0, sticky=tk.W)
+        self.part_limit = tk.StringVar(value="")
+        self.part_limit_entry = ttk.Entry(self.parts_frame, textvariable=self.part_limit, width=12)
+        self.part_limit_entry.grid(row=0, column=1, padx=5)
+        self.part_unit = tk.StringVar(value=BY_BYTES)
+        self.part_unit_combo = ttk.Combobox(self.parts_frame, textvariable=self.part_unit, values=BALANCE_MODES,
+                                            state='readonly', width=8)
+        self.part_unit_combo.grid(row=0, column=2, padx=5)
+        
+        # Compressed output; the suffix is added to the file name
+        self.compression_frame = ttk.Frame(self.advanced_frame)
+        self.compression_frame.grid(row=0, column=1, padx=5, sticky=tk.W)
+        ttk.Label(self.compression_frame, text="Compression:").grid(row=0, column=0, sticky=tk.W)
+        self.compression = tk.StringVar(value=NO_COMPRESSION)
+        self.compression_combo = ttk.Combobox(self.compression_frame, textvariable=self.compression,
+                                              values=(NO_COMPRESSION,) + COMPRESSIONS, state='readonly', width=8)
+        self.compression_combo.grid(row=0, column=1, padx=5)
+        
+        # Section index sidecar used for direct lookups and by the splitter
+        self.write_index = tk.BooleanVar(value=False)
+        self.index_check = ttk.Checkbutton(
+            self.advanced_frame,
+            text="Write section index (.index.json)",
+            variable=self.write_index
+        )
+        self.index_check.grid(row=1, column=0, padx=5, sticky=tk.W)
+        
+        # Token counts in the export header plus a heaviest files report in the log
+        self.count_tokens = tk.BooleanVar(value=False)
+        self.tokens_check = ttk.Checkbutton(
+            self.advanced_frame,
+            text="Count tokens and report the heaviest files",
+            variable=self.count_tokens
+        )
+        self.tokens_check.grid(row=1, column=1, padx=5, sticky=tk.W)
+        
+        # Identical files are written once, later copies refer back to it
+        self.dedupe = tk.BooleanVar(value=False)
+        self.dedupe_check = ttk.Checkbutton(
+            self.advanced_frame,
+            text="Write identical files once",
+            variable=self.dedupe
+        )
+        self.dedupe_check.grid(row=2, column=0, padx=5, sticky=tk.W)
+        
+        # Chunks for embedding pipelines, written in the same pass; incremental runs write only changed chunks
+        self.write_chunks = tk.BooleanVar(value=False)
+        self.chunks_check = ttk.Checkbutton(
+            self.advanced_frame,
+            text="Write chunks for embedding (.chunks.jsonl)",
+            variable=self.write_chunks
+        )
+        self.chunks_check.grid(row=2, column=1, padx=5, sticky=tk.W)
+        
+        # Keep running after the scan and rewrite the export whenever files change
+        self.watch = tk.BooleanVar(value=False)
+        self.watch_check = ttk.Checkbutton(
+            self.advanced_frame,
+            text="Keep the export up to date (watch mode)",
+            variable=self.watch
+        )
+        self.watch_check.grid(row=3, column=0, padx=5, sticky=tk.W)
+        
+        # Phase timings, counters and the slowest files, logged and saved next to the export
+        self.profile_run = tk.BooleanVar(value=False)
+        self.profile_check = ttk.Checkbutton(
+            self.advanced_frame,
+            text="Profile the run (.profile.json)",
+            variable=self.profile_run
+        )
+        self.profile_check.grid(row=3, column=1, padx=5, sticky=tk.W)
+        
         # Status display
         self.status_frame = ttk.LabelFrame(self.main_frame, text="Progress Log", padding="5")
-        self.status_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        self.status_frame.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
         
         self.status_text = tk.Text(self.status_frame, height=12, width=70)
         self.status_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -134,15 +306,26 @@ class CodeScanner:
         self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         self.status_text['yscrollcommand'] = self.scrollbar.set
         
+        # Running counters, updated in place instead of logging every file
+        self.counter_text = tk.StringVar(value="Idle")
+        self.counter_label = ttk.Label(self.status_frame, textvariable=self.counter_text)
+        self.counter_label.grid(row=1, column=0, columnspan=2, sticky=tk.W)
+        
         # Make the main frame and status frame expandable
         self.main_frame.columnconfigure(0, weight=1)
-        self.main_frame.rowconfigure(4, weight=1)
+        self.main_frame.rowconfigure(5, weight=1)
         self.status_frame.columnconfigure(0, weight=1)
         self.status_frame.rowconfigure(0, weight=1)
         
         # Scan button
         self.scan_button = ttk.Button(self.main_frame, text="Scan Code Files", command=self.scan_files)
-        self.scan_button.grid(row=5, column=0, columnspan=3, pady=10)
+        self.scan_button.grid(row=6, column=0, columnspan=3, pady=10)
+    
+    def toggle_advanced(self):
+        if self.show_advanced.get():
+            self.advanced_frame.grid()
+        else:
+            self.advanced_frame.grid_remove()
     
     def add_source_directory(self):
         folder_selected = filedialog.askdirectory(title="Select Source Directory (Code Files)")
@@ -180,11 +363,6 @@ class CodeScanner:
         if folder_selected:
             self.target_path.set(folder_selected)
     
-    def should_skip_directory(self, dir_path):
-        # List of directories to exclude
-        excluded_dirs = {'node_modules', 'dist', '.git'}
-        return os.path.basename(dir_path) in excluded_dirs
-    
     def get_selected_extensions(self):
         extensions = []
         
@@ -207,130 +385,204 @@ class CodeScanner:
             
         return tuple(extensions)
     
-    def get_test_exclusions(self):
-        if not self.exclude_tests.get():
-            return tuple()
-            
-        # Define test file patterns to exclude
-        exclusions = ['.spec.js', '.test.js', '.spec.ts', '.test.ts', 
-                     '.spec.jsx', '.test.jsx', '.spec.tsx', '.test.tsx']
-        return tuple(exclusions)
+    def build_config(self):
+        part_limit = self.part_limit.get().strip()
+        try:
+            part_limit = int(part_limit) if part_limit else None
+        except ValueError:
+            raise ScanError("Please enter a valid number for the part size!")
+        compression = None if self.compression.get() == NO_COMPRESSION else self.compression.get()
+        try:
+            related_files = int(self.related_files.get().strip() or 0)
+        except ValueError:
+            raise ScanError("Please enter a valid number of related files!")
+        # Parts have no single export file to keep a manifest or index for, and a
+        # compressed export cannot be spliced into the next one
+        return ScanConfig(
+            self.source_directories,
+            extensions=self.get_selected_extensions(),
+            exclude_tests=self.exclude_tests.get(),
+            incremental=self.incremental.get() and part_limit is None and compression is None,
+            write_index=self.write_index.get() and part_limit is None,
+            part_limit=part_limit,
+            part_unit=self.part_unit.get(),
+            tokenizer=EstimateTokenizer() if self.count_tokens.get() else None,
+            compression=compression,
+            # A watched export is rewritten section by section, so every body is written out in full
+            dedupe=self.dedupe.get() and not self.watch.get(),
+            exclude_patterns=[p.strip() for p in self.exclude_patterns.get().split(",") if p.strip()],
+            use_ignore_files=self.use_ignore_files.get(),
+            changed_revision=self.changed_revision.get().strip() if self.changed_only.get() else None,
+            # The related files field keeps its value while changed files mode is off
+            related_files=related_files if self.changed_only.get() else 0,
+            # A watched export is rewritten section by section, with nowhere to keep its chunks current
+            chunk_bytes=DEFAULT_CHUNK_BYTES if self.write_chunks.get() and not self.watch.get() else None,
+            content_policy=ContentPolicy() if self.skip_noise.get() else ContentPolicy(
+                max_file_bytes=0, skip_binary=False, skip_generated=False, skip_minified=False),
+        )
+    
+    def log(self, message):
+        self.status_text.insert(tk.END, message)
+        # Trim the oldest lines so the widget stays the same size on any repo
+        line_count = int(self.status_text.index('end-1c').split('.')[0])
+        if line_count > MAX_LOG_LINES:
+            self.status_text.delete(1.0, f"{line_count - MAX_LOG_LINES + 1}.0")
+        self.status_text.see(tk.END)
     
-    def process_source_path(self, source_path, file_extensions, test_exclusions):
-        """Process a single source path (file or directory) and return found code files"""
-        code_files = []
-        
-        # Check if the source path is a file or directory
-        if os.path.isfile(source_path):
-            # Process a single file
-            file_name = os.path.basename(source_path)
-            if file_name.endswith(file_extensions) and not any(file_name.endswith(test_ext) for test_ext in test_exclusions):
-                # For a single file, use the parent directory as base for relative path
-                parent_dir = os.path.dirname(source_path)
-                relative_path = os.path.basename(source_path)
-                code_files.append((relative_path, source_path))
-                self.status_text.insert(tk.END, f"Found file: {relative_path}\n")
-                self.status_text.see(tk.END)
-                self.root.update()
+    def on_progress(self, event, value):
+        # Runs on the worker thread: never touch Tk widgets here
+        if event == 'found':
+            # Per-file events are folded into counters the UI reads on its next poll
+            self.found_count += 1
+            self.last_found = value
+        elif event == 'directory':
+            # Directory listings only matter to a watcher, which takes them before they get here
+            return
         else:
-            # Process a directory
-            for folder_path, dirs, files in os.walk(source_path):
-                # Skip excluded directories
-                dirs[:] = [d for d in dirs if not self.should_skip_directory(os.path.join(folder_path, d))]
-                
-                for file in files:
-                    if file.endswith(file_extensions) and not any(file.endswith(test_ext) for test_ext in test_exclusions):
-                        file_path = os.path.join(folder_path, file)
-                        relative_path = os.path.relpath(file_path, source_path)
-                        code_files.append((relative_path, file_path))
-                        self.status_text.insert(tk.END, f"Found: {relative_path}\n")
-                        self.status_text.see(tk.END)
-                        self.root.update()
-        
-        return code_files
+            self.events.put((event, value))
+    
+    def run_export(self, config, output_path, watcher=None):
+        try:
+            if watcher is None:
+                stats = export(config, output_path, self.on_progress, self.run_profile)
+                self.events.put(('done', (output_path, stats)))
+                return
+            stats = watcher.start(self.run_profile)
+            self.events.put(('done', (output_path, stats)))
+            watcher.run(self.watch_stop)
+            self.events.put(('stopped', None))
+        except Exception as e:
+            self.events.put(('error', e))
+    
+    def update_counters(self):
+        self.counter_text.set(
+            f"Sources: {self.sources_done}/{len(self.scan_config.sources)}    "
+            f"Files found: {self.found_count}    {self.last_found}"
+        )
+    
+    def poll_progress(self):
+        started = time.perf_counter()
+        finished = False
+        while True:
+            try:
+                event, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event == 'source':
+                self.sources_done += 1
+                self.log(f"Processing source: {value}\n")
+            elif event == 'part':
+                output_file, runs, written, seconds = value
+                files = sum(end_idx - start_idx for start_idx, end_idx in runs)
+                self.log(f"Created: {os.path.basename(output_file)} ({files} files, {format_rate(written, seconds)})\n")
+            elif event == 'update':
+                self.log(f"Export updated: {value.total_files} files, {value.read_files} re-read "
+                         f"({value.pipeline.elapsed:.2f}s)\n")
+            elif event == 'done':
+                # A watcher keeps the worker running until it is stopped
+                finished = self.watch_stop is None
+                self.finish_scan(*value)
+                if not finished:
+                    self.log("Watching for changes; click Stop Watching to end.\n")
+                    self.scan_button.configure(text="Stop Watching")
+                    self.scan_button.state(['!disabled'])
+            elif event == 'stopped':
+                finished = True
+                self.log("Stopped watching.\n")
+            elif event == 'error':
+                finished = True
+                messagebox.showerror("Error", f"An error occurred: {str(value)}")
+                self.log(f"ERROR: {str(value)}\n")
+        
+        self.update_counters()
+        if self.run_profile is not None:
+            # Time the UI spends logging and redrawing, which the worker does not see
+            self.run_profile.add_time('ui', time.perf_counter() - started)
+        if finished:
+            self.worker = None
+            self.watch_stop = None
+            self.scan_button.configure(text="Scan Code Files")
+            self.scan_button.state(['!disabled'])
+        else:
+            self.root.after(POLL_INTERVAL_MS, self.poll_progress)
+    
+    def finish_scan(self, output_path, stats):
+        if not stats.total_files:
+            self.log(f"\nNo matching files found in the selected sources.\n")
+            return
+        
+        ext_description = self.scan_config.extension_description
+        if stats.parts:
+            self.log(f"\nDone! {len(stats.parts)} part files created in:\n{os.path.dirname(output_path)}\n")
+        else:
+            self.log(f"\nDone! Output file created at:\n{output_path}\n")
+        self.log(f"Total files processed: {stats.total_files}\n")
+        if self.scan_config.incremental:
+            self.log(f"Re-read: {stats.read_files}, reused from previous export: {stats.reused_files}\n")
+        if stats.skipped_files or stats.truncated_files:
+            self.log(f"Skipped: {stats.skipped_files}, truncated: {stats.truncated_files}\n")
+        if stats.duplicate_files:
+            self.log(f"Identical files written once: {stats.duplicate_files} references, "
+                     f"{stats.bytes_saved} bytes saved\n")
+        if stats.chunks is not None:
+            self.log(f"Chunks: {stats.chunks.written} of {stats.chunks.chunks} written, "
+                     f"{stats.chunks.removed} removed, in {stats.chunks.path}\n")
+        if stats.total_tokens is not None:
+            self.log("\n".join(token_report(stats)) + "\n")
+        self.log("\n".join(stats.pipeline.report()) + "\n")
+        if stats.profile is not None:
+            report_path = output_path + REPORT_SUFFIX
+            stats.profile.save(report_path, stats.pipeline)
+            self.log("\n".join(stats.profile.lines()) + f"\nProfile saved to {report_path}\n")
+            self.run_profile = None
+        if self.watch_stop is None:
+            messagebox.showinfo("Success", f"Scan completed successfully!\nFound {stats.total_files} {ext_description} files.")
             
     def scan_files(self):
-        if not self.source_directories:
-            messagebox.showerror("Error", "Please add at least one source directory or file!")
+        if self.watch_stop is not None:
+            # The button stops a running watcher
+            self.watch_stop.set()
+            self.scan_button.state(['disabled'])
             return
-            
+        if self.worker is not None:
+            return
+        
         target_folder = self.target_path.get()
         output_file = self.output_name.get()
         
-        # Get selected file types
-        file_extensions = self.get_selected_extensions()
-        test_exclusions = self.get_test_exclusions()
-        
-        if not target_folder:
-            messagebox.showerror("Error", "Please select a target folder!")
-            return
-            
-        if not file_extensions:
-            messagebox.showerror("Error", "Please select at least one file type to scan!")
-            return
-            
+        # Create output file in target directory, scanning off the UI thread
+        output_path = os.path.join(target_folder, output_file)
+        watcher = None
         try:
-            self.status_text.delete(1.0, tk.END)
-            
-            ext_description = ", ".join([ext.replace(".", "") for ext in file_extensions])
-            self.status_text.insert(tk.END, f"Scanning for {ext_description} files (excluding node_modules, dist, .git)...\n")
-            if test_exclusions:
-                self.status_text.insert(tk.END, f"Excluding test files: {', '.join(test_exclusions)}\n")
-            self.root.update()
-            
-            # Create output file in target directory
-            output_path = os.path.join(target_folder, output_file)
-            all_code_files = []
-            
-            # Process each source path
-            for source_path in self.source_directories:
-                self.status_text.insert(tk.END, f"\nProcessing source: {source_path}\n")
-                self.status_text.see(tk.END)
-                self.root.update()
-                
-                code_files = self.process_source_path(source_path, file_extensions, test_exclusions)
-                all_code_files.extend([(source_path, rel_path, full_path) for rel_path, full_path in code_files])
-            
-            if not all_code_files:
-                self.status_text.insert(tk.END, f"\nNo matching files found in the selected sources.\n")
-                return
-            
-            # Sort files by source path and then by relative path for better organization
-            all_code_files.sort(key=lambda x: (x[0], x[1]))
-            
-            # Write to output file
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(f"Codebase Export ({ext_description} files)\n{'='*80}\n")
-                f.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Total Files Found: {len(all_code_files)}\n\n")
-                
-                current_source = None
-                
-                for source_path, relative_path, full_path in all_code_files:
-                    # Add source header when source changes
-                    if current_source != source_path:
-                        current_source = source_path
-                        f.write(f"\n\n{'#'*80}\n")
-                        f.write(f"Source: {source_path}\n")
-                        f.write(f"{'#'*80}\n")
-                    
-                    f.write(f"\n\n{'='*80}\n")
-                    f.write(f"File: {relative_path}\n")
-                    f.write(f"{'='*80}\n\n")
-                    try:
-                        with open(full_path, 'r', encoding='utf-8') as code_file:
-                            content = code_file.read()
-                            f.write(f"{content}\n")
-                    except Exception as e:
-                        f.write(f"Error reading file: {str(e)}\n")
-            
-            self.status_text.insert(tk.END, f"\nDone! Output file created at:\n{output_path}\n")
-            self.status_text.insert(tk.END, f"Total files processed: {len(all_code_files)}\n")
-            messagebox.showinfo("Success", f"Scan completed successfully!\nFound {len(all_code_files)} {ext_description} files.")
+            config = self.build_config()
+            config.validate()
+            if not target_folder:
+                raise ScanError("Please select a target folder!")
+            if self.watch.get():
+                watcher = ExportWatcher(config, output_path, self.on_progress)
+        except ScanError as e:
+            messagebox.showerror("Error", str(e))
+            return
             
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
-            self.status_text.insert(tk.END, f"ERROR: {str(e)}\n")
+        self.status_text.delete(1.0, tk.END)
+        self.scan_config = config
+        self.found_count = 0
+        self.last_found = ""
+        self.sources_done = 0
+        
+        ext_description = config.extension_description
+        self.log(f"Scanning for {ext_description} files (excluding {', '.join(sorted(config.excluded_dirs))})...\n")
+        if config.test_exclusions:
+            self.log(f"Excluding test files: {', '.join(config.test_exclusions)}\n")
+        
+        if config.compression and not output_path.endswith(COMPRESSION_SUFFIXES[config.compression]):
+            output_path += COMPRESSION_SUFFIXES[config.compression]
+        self.scan_button.state(['disabled'])
+        self.watch_stop = threading.Event() if watcher is not None else None
+        self.run_profile = RunProfile('export') if self.profile_run.get() else None
+        self.worker = threading.Thread(target=self.run_export, args=(config, output_path, watcher), daemon=True)
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_progress)
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,311 @@
+import gzip
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+from bisect import bisect_right
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+COMPRESSIONS = (GZIP, ZSTD)
+COMPRESSION_SUFFIXES = {GZIP: '.gz', ZSTD: '.zst'}
+DEFAULT_LEVELS = {GZIP: 6, ZSTD: 3}
+
+# Sections are grouped into frames of at least this much text; a reader
+# inflates one frame to get at a section, never the whole archive
+DEFAULT_FRAME_BYTES = 1024 * 1024
+# A frame being built stays in memory up to this size, then spills to a temporary file
+FRAME_SPOOL_BYTES = 16 * 1024 * 1024
+# Frames waiting for the compression thread
+QUEUED_CHUNKS = 8
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZSTD_MAX_BLOCK = 128 * 1024
+
+
+def compression_available(compression):
+    return compression == GZIP or (compression == ZSTD and zstandard is not None)
+
+
+def detect_compression(path):
+    """Return GZIP or ZSTD if ``path`` starts like one of them, else None"""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return GZIP
+    if magic == ZSTD_MAGIC:
+        return ZSTD
+    return None
+
+
+def strip_compression_suffix(path):
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+class GzipCodec:
+    """Each frame is a gzip member; a .gz file of several members is still one valid gzip stream"""
+
+    def __init__(self, level=None):
+        self.level = DEFAULT_LEVELS[GZIP] if level is None else level
+
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def finish(self, compressor):
+        return compressor.flush()
+
+    def stored(self, data):
+        """A frame of ``data`` left uncompressed, whose length depends only on the length of ``data``"""
+        compressor = zlib.compressobj(0, zlib.DEFLATED, 31)
+        return compressor.compress(bytes(data)) + compressor.flush()
+
+    def decompress(self, frame):
+        return zlib.decompress(frame, 31)
+
+
+class ZstdCodec:
+    """Each frame is a zstd frame; zstd readers decode concatenated frames as one stream"""
+
+    def __init__(self, level=None):
+        if zstandard is None:
+            raise ValueError("zstd output needs the zstandard package (pip install zstandard)")
+        self.level = DEFAULT_LEVELS[ZSTD] if level is None else level
+        self.context = zstandard.ZstdCompressor(level=self.level)
+
+    def compressor(self):
+        return self.context.compressobj()
+
+    def finish(self, compressor):
+        return compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+    def stored(self, data):
+        """A frame of raw blocks, whose length depends only on the length of ``data``"""
+        # Single-segment frame with a 4-byte content size and no checksum
+        frame = [ZSTD_MAGIC, bytes([0xA0]), struct.pack('<I', len(data))]
+        blocks = [data[i:i + ZSTD_MAX_BLOCK] for i in range(0, len(data), ZSTD_MAX_BLOCK)] or [b""]
+        for number, block in enumerate(blocks):
+            last = 1 if number == len(blocks) - 1 else 0
+            # Block header: last-block bit, type 0 (raw), then the size
+            frame.append(struct.pack('<I', last | (len(block) << 3))[:3])
+            frame.append(bytes(block))
+        return b"".join(frame)
+
+    def decompress(self, frame):
+        return zstandard.ZstdDecompressor().decompressobj().decompress(frame)
+
+
+def get_codec(compression, level=None):
+    if compression == GZIP:
+        return GzipCodec(level)
+    if compression == ZSTD:
+        return ZstdCodec(level)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+class FrameWriter:
+    """Binary sink that compresses what is written to it as independent frames on a background thread.
+
+    The exporter writes to it like a file and calls end_frame() after
+    every section, so frames always start on a section. Until a frame is
+    handed over (once it holds ``frame_bytes``), anything in it can still be
+    seeked to and rewritten. A frame ended with ``stored=True`` is kept
+    uncompressed and can be patched in place until close(), which is how
+    the header's counts are filled in at the end.
+
+    ``frames`` lists (uncompressed_offset, compressed_offset) for every
+    frame once the writer is closed.
+    """
+
+    def __init__(self, raw, codec, frame_bytes=DEFAULT_FRAME_BYTES):
+        self.raw = raw
+        self.codec = codec
+        self.frame_bytes = frame_bytes
+        self.frames = []
+        self.frame_start = 0
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=FRAME_SPOOL_BYTES)
+        # (uncompressed offset, bytearray) of frames that may still be patched
+        self.stored = []
+        self.patch = None
+        self.error = None
+        self.chunks = queue.Queue(maxsize=QUEUED_CHUNKS)
+        self.thread = threading.Thread(target=self._compress, daemon=True)
+        self.thread.start()
+
+    def _compress(self):
+        compressor = None
+        while True:
+            item = self.chunks.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # Keep draining so the writer never blocks on a dead thread
+                continue
+            try:
+                kind, value = item
+                if kind == 'start':
+                    self.frames.append((value, self.raw.tell()))
+                    compressor = self.codec.compressor()
+                elif kind == 'data':
+                    self.raw.write(compressor.compress(value))
+                elif kind == 'end':
+                    self.raw.write(self.codec.finish(compressor))
+                    compressor = None
+                else:
+                    offset, data = value
+                    self.frames.append((offset, self.raw.tell()))
+                    self.raw.write(self.codec.stored(data))
+            except BaseException as e:
+                self.error = e
+
+    def _put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.chunks.put(item)
+
+    def tell(self):
+        if self.patch is not None:
+            return self.patch
+        return self.frame_start + self.buffer.tell()
+
+    def write(self, data):
+        if self.patch is not None:
+            for offset, frame in self.stored:
+                if offset <= self.patch and self.patch + len(data) <= offset + len(frame):
+                    frame[self.patch - offset:self.patch - offset + len(data)] = data
+                    self.patch += len(data)
+                    return len(data)
+            raise ValueError("Cannot rewrite data that was already compressed")
+        return self.buffer.write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            self.patch = None
+            self.buffer.seek(0, os.SEEK_END)
+        elif offset >= self.frame_start:
+            self.patch = None
+            self.buffer.seek(offset - self.frame_start)
+        else:
+            self.patch = offset
+        return self.tell()
+
+    def truncate(self, size=None):
+        if self.patch is not None:
+            raise ValueError("Cannot truncate data that was already compressed")
+        return self.buffer.truncate(None if size is None else size - self.frame_start)
+
+    def end_frame(self, stored=False):
+        """Mark a section boundary; the frame is handed over once it is big enough"""
+        self.buffer.seek(0, os.SEEK_END)
+        length = self.buffer.tell()
+        if not length or (not stored and length < self.frame_bytes):
+            return
+        self.buffer.seek(0)
+        if stored:
+            frame = bytearray(self.buffer.read())
+            self.stored.append((self.frame_start, frame))
+            self._put(('stored', (self.frame_start, frame)))
+        else:
+            self._put(('start', self.frame_start))
+            while True:
+                data = self.buffer.read(DEFAULT_FRAME_BYTES)
+                if not data:
+                    break
+                self._put(('data', data))
+            self._put(('end', None))
+        self.frame_start += length
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def close(self):
+        """Compress what is left, wait for the thread and write the final stored frames; returns ``frames``"""
+        self.frame_bytes = 0
+        self.end_frame()
+        self.chunks.put(None)
+        self.thread.join()
+        self.buffer.close()
+        if self.error is not None:
+            raise self.error
+        compressed_offsets = dict(self.frames)
+        for offset, frame in self.stored:
+            self.raw.seek(compressed_offsets[offset])
+            self.raw.write(self.codec.stored(frame))
+        self.raw.seek(0, os.SEEK_END)
+        return self.frames
+
+    def abort(self):
+        """Stop the compression thread after a failure, leaving the output incomplete"""
+        if self.thread.is_alive():
+            self.error = self.error or ValueError("Export aborted")
+            self.chunks.put(None)
+            self.thread.join()
+        self.buffer.close()
+
+
+def inflate(path, out):
+    """Decompress all of the compressed export ``path`` into the binary file ``out``"""
+    with open(path, 'rb') as f:
+        if detect_compression(path) == ZSTD:
+            if zstandard is None:
+                raise ValueError("Reading zstd exports needs the zstandard package (pip install zstandard)")
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        else:
+            reader = gzip.GzipFile(fileobj=f)
+        with reader:
+            shutil.copyfileobj(reader, out, DEFAULT_FRAME_BYTES)
+    out.flush()
+
+
+def _read_frame(fd, file_size, frames, codec, number):
+    """The text of frame ``number``"""
+    compressed_start = frames[number][1]
+    compressed_end = frames[number + 1][1] if number + 1 < len(frames) else file_size
+    return codec.decompress(os.pread(fd, compressed_end - compressed_start, compressed_start))
+
+
+def read_range(f, frames, codec, start, end):
+    """Return bytes ``start`` to ``end`` of the text in the framed file ``f``, inflating only the frames around them.
+
+    ``frames`` is the (uncompressed_offset, compressed_offset) table a
+    FrameWriter produced for the file.
+    """
+    if start >= end:
+        return b""
+    first = bisect_right(frames, (start, float('inf'))) - 1
+    last = bisect_right(frames, (end - 1, float('inf'))) - 1
+    # pread leaves the file position alone, so parts can be read from several threads
+    fd = f.fileno()
+    file_size = os.fstat(fd).st_size
+    data = b"".join(_read_frame(fd, file_size, frames, codec, number) for number in range(first, last + 1))
+    skip = start - frames[first][0]
+    return data[skip:skip + end - start]
+
+
+class FramedView:
+    """Read-only, sliceable view of the text of a framed export, for the splitter"""
+
+    def __init__(self, f, frames, codec):
+        self.f = f
+        self.frames = frames
+        self.codec = codec
+
+    def __getitem__(self, key):
+        return read_range(self.f, self.frames, self.codec, key.start or 0, key.stop)
+
+    def iter_frames(self):
+        """Yield the text frame by frame from the start, inflating each frame once"""
+        fd = self.f.fileno()
+        file_size = os.fstat(fd).st_size
+        for number in range(len(self.frames)):
+            yield _read_frame(fd, file_size, self.frames, self.codec, number)
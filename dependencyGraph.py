@@ -0,0 +1,373 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jsonFiles import save_json
+
+GRAPH_SUFFIX = ".graph.json"
+GRAPH_CACHE_VERSION = 1
+# Files handed to a worker thread at a time; one future per file costs more than reading a cached file
+BUILD_BATCH = 256
+
+JS_SUFFIXES = ('.ts', '.tsx', '.mts', '.cts', '.js', '.jsx', '.mjs', '.cjs')
+PY_SUFFIXES = ('.py', '.pyi')
+# Tried in order on an extensionless relative or aliased import, and inside a directory as index.<ext>
+JS_RESOLVE_EXTENSIONS = ('.ts', '.tsx', '.d.ts', '.mts', '.cts', '.js', '.jsx', '.mjs', '.cjs', '.json')
+# ESM-style TypeScript imports name the compiled file: './x.js' is ./x.ts on disk
+JS_OUTPUT_EXTENSIONS = {
+    '.js': ('.ts', '.tsx'),
+    '.jsx': ('.tsx',),
+    '.mjs': ('.mts',),
+    '.cjs': ('.cts',),
+}
+
+# import x from 'y', import {a} from "y", import 'y', import('y'), export * from 'y', require('y')
+_JS_IMPORT = re.compile(
+    rb"""(?:\b(?:import|export)\b[^'";]*?\bfrom\s*|\bimport\s*\(?\s*|\brequire\s*\(\s*)(['"])([^'"\n]+)\1""")
+# import a.b, c as d
+_PY_IMPORT = re.compile(rb"^[ \t]*import[ \t]+([\w. \t,]+)", re.MULTILINE)
+# from .a import b, (c, d)
+_PY_FROM = re.compile(rb"^[ \t]*from[ \t]+(\.+[\w.]*|[\w.]+)[ \t]+import[ \t]+(\([^)]*\)|[^\n#;]+)", re.MULTILINE)
+# Comments and string literals of a tsconfig.json, which is JSON with comments and trailing commas
+_JSONC_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|/\*.*?\*/', re.DOTALL)
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+
+def parse_imports(full_path, data):
+    """The import statements in ``data``, the bytes of ``full_path``, as [specifier, names] pairs.
+
+    ``names`` lists what a Python ``from`` import takes, which may be
+    submodules; it is empty for everything else. Imports are found with
+    regular expressions, so one inside a comment or string counts too:
+    the graph errs towards including a file.
+    """
+    if full_path.endswith(JS_SUFFIXES):
+        return [[match.group(2).decode('utf-8', 'replace'), []] for match in _JS_IMPORT.finditer(data)]
+    if not full_path.endswith(PY_SUFFIXES):
+        return []
+
+    found = []
+    for match in _PY_IMPORT.finditer(data):
+        for part in match.group(1).decode('utf-8', 'replace').split(','):
+            module = part.split()[0] if part.split() else ""
+            if module:
+                found.append((match.start(), [module, []]))
+    for match in _PY_FROM.finditer(data):
+        names = match.group(2).decode('utf-8', 'replace').strip('()\n ')
+        names = [name.split()[0] for name in names.replace('\n', ',').split(',') if name.split()]
+        found.append((match.start(), [match.group(1).decode('utf-8', 'replace'), names]))
+    # In the order they appear in the file
+    found.sort(key=lambda item: item[0])
+    return [item for _, item in found]
+
+
+def load_jsonc(path):
+    """Read a JSON file that may have comments and trailing commas, as tsconfig.json files do"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    text = _JSONC_TOKEN.sub(lambda match: match.group(0) if match.group(0).startswith('"') else "", text)
+    return json.loads(_TRAILING_COMMA.sub(r'\1', text))
+
+
+class PathAliases:
+    """The baseUrl and paths of a tsconfig.json, following relative ``extends``"""
+
+    def __init__(self, base_url=None, paths_base=None, paths=None):
+        self.base_url = base_url
+        self.paths_base = paths_base
+        # (prefix, suffix, targets) with the '*' of each pattern between prefix and suffix
+        self.patterns = []
+        for pattern, targets in (paths or {}).items():
+            prefix, star, suffix = pattern.partition('*')
+            self.patterns.append((prefix, suffix if star else None, targets))
+        # Longest prefix first, as TypeScript matches them
+        self.patterns.sort(key=lambda item: len(item[0]), reverse=True)
+
+    @classmethod
+    def load(cls, tsconfig_path, seen=()):
+        try:
+            data = load_jsonc(tsconfig_path)
+        except (OSError, ValueError):
+            return cls()
+        directory = os.path.dirname(tsconfig_path)
+        inherited = cls()
+        extends = data.get('extends')
+        if isinstance(extends, str) and extends.startswith('.') and tsconfig_path not in seen:
+            parent = os.path.normpath(os.path.join(directory, extends))
+            if not parent.endswith('.json'):
+                parent += '.json'
+            inherited = cls.load(parent, seen + (tsconfig_path,))
+
+        options = data.get('compilerOptions') or {}
+        base_url = inherited.base_url
+        if isinstance(options.get('baseUrl'), str):
+            base_url = os.path.normpath(os.path.join(directory, options['baseUrl']))
+        if isinstance(options.get('paths'), dict):
+            # Paths are relative to baseUrl, or to the tsconfig that declares them without one
+            return cls(base_url, base_url or directory, options['paths'])
+        aliases = cls(base_url, inherited.paths_base)
+        aliases.patterns = inherited.patterns
+        return aliases
+
+    def candidates(self, specifier):
+        """Paths a bare ``specifier`` may map to, best first"""
+        for prefix, suffix, targets in self.patterns:
+            if suffix is None:
+                if specifier != prefix:
+                    continue
+                captured = ""
+            elif specifier.startswith(prefix) and specifier.endswith(suffix) \
+                    and len(specifier) >= len(prefix) + len(suffix):
+                captured = specifier[len(prefix):len(specifier) - len(suffix)]
+            else:
+                continue
+            for target in targets:
+                yield os.path.normpath(os.path.join(self.paths_base, target.replace('*', captured)))
+        if self.base_url is not None:
+            yield os.path.normpath(os.path.join(self.base_url, specifier))
+
+
+class DependencyGraph:
+    """The files reachable from a set of entry points through their imports.
+
+    JavaScript and TypeScript imports are resolved like the TypeScript
+    compiler does for bundlers: relative paths with or without an
+    extension, index files and tsconfig ``baseUrl`` / ``paths`` aliases.
+    Bare package names that no alias maps are external and not followed.
+    Python imports are resolved against ``roots`` and relative to the
+    importing package, and pull in the ``__init__.py`` of every package on
+    the way. Nothing under ``excluded_dirs`` is followed.
+
+    Parsed imports are kept in ``cache_path`` by file size and mtime, so a
+    repeat run only reads the files that changed.
+    """
+
+    def __init__(self, roots, excluded_dirs=frozenset(), cache_path=None, workers=8):
+        # Longest first, so a file belongs to the innermost root holding it
+        self.roots = sorted({os.path.abspath(root) for root in roots}, key=len, reverse=True)
+        self.excluded_dirs = excluded_dirs
+        self.cache_path = cache_path
+        self.workers = max(1, workers)
+        self.started_ns = time.time_ns()
+        self.cache = self._load_cache()
+        # full_path -> [size, mtime_ns, imports] for every file parsed or reused this run
+        self.parsed = {}
+        self.edges = {}
+        self.parsed_files = 0
+        self.cached_files = 0
+        self.lock = threading.Lock()
+        self._is_file = {}
+        self._aliases = {}
+
+    def _load_cache(self):
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != GRAPH_CACHE_VERSION:
+            return {}
+        started_ns = data.get('started_ns', 0)
+        # A file changed in the same clock tick as the last run could still change without its mtime moving
+        return {path: entry for path, entry in data.get('files', {}).items() if entry[1] < started_ns}
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        data = {'version': GRAPH_CACHE_VERSION, 'started_ns': self.started_ns, 'files': self.parsed}
+        save_json(self.cache_path, data)
+
+    def is_file(self, path):
+        result = self._is_file.get(path)
+        if result is None:
+            result = self._is_file[path] = os.path.isfile(path) and not self._excluded(path)
+        return result
+
+    def _excluded(self, path):
+        # Only directories inside a root count: the checkout itself may well live under a 'build' folder
+        for root in self.roots:
+            if path.startswith(root + os.sep):
+                return any(part in self.excluded_dirs for part in path[len(root) + 1:].split(os.sep)[:-1])
+        return False
+
+    def imports_of(self, full_path):
+        """Parse ``full_path`` or take its imports from the cache"""
+        try:
+            stat_result = os.stat(full_path)
+        except OSError:
+            return []
+        entry = self.cache.get(full_path)
+        if entry is not None and entry[0] == stat_result.st_size and entry[1] == stat_result.st_mtime_ns:
+            with self.lock:
+                self.cached_files += 1
+        else:
+            imports = []
+            if full_path.endswith(JS_SUFFIXES + PY_SUFFIXES):
+                try:
+                    with open(full_path, 'rb') as f:
+                        imports = parse_imports(full_path, f.read())
+                except OSError:
+                    pass
+            entry = [stat_result.st_size, stat_result.st_mtime_ns, imports]
+            with self.lock:
+                self.parsed_files += 1
+        self.parsed[full_path] = entry
+        return entry[2]
+
+    def aliases_for(self, directory):
+        """The PathAliases of the tsconfig.json nearest above ``directory``"""
+        aliases = self._aliases.get(directory)
+        if aliases is None:
+            tsconfig = os.path.join(directory, 'tsconfig.json')
+            parent = os.path.dirname(directory)
+            if os.path.isfile(tsconfig):
+                aliases = PathAliases.load(tsconfig)
+            elif parent != directory:
+                aliases = self.aliases_for(parent)
+            else:
+                aliases = PathAliases()
+            self._aliases[directory] = aliases
+        return aliases
+
+    def resolve_js_path(self, base):
+        if self.is_file(base):
+            return base
+        stem, extension = os.path.splitext(base)
+        for replacement in JS_OUTPUT_EXTENSIONS.get(extension, ()):
+            if self.is_file(stem + replacement):
+                return stem + replacement
+        for extension in JS_RESOLVE_EXTENSIONS:
+            if self.is_file(base + extension):
+                return base + extension
+        for extension in JS_RESOLVE_EXTENSIONS:
+            index = os.path.join(base, 'index' + extension)
+            if self.is_file(index):
+                return index
+        return None
+
+    def resolve_js(self, full_path, specifier):
+        directory = os.path.dirname(full_path)
+        if specifier.startswith(('./', '../')) or specifier in ('.', '..'):
+            return [self.resolve_js_path(os.path.normpath(os.path.join(directory, specifier)))]
+        if specifier.startswith('/'):
+            return [self.resolve_js_path(specifier)]
+        for candidate in self.aliases_for(directory).candidates(specifier):
+            resolved = self.resolve_js_path(candidate)
+            if resolved is not None:
+                return [resolved]
+        return []
+
+    def python_module(self, base, parts):
+        """The file of module ``parts`` under ``base`` plus the package __init__ files above it, or None"""
+        found = []
+        path = base
+        for number, part in enumerate(parts):
+            path = os.path.join(path, part)
+            init = os.path.join(path, '__init__.py')
+            if number == len(parts) - 1:
+                for candidate in (path + '.py', path + '.pyi', init):
+                    if self.is_file(candidate):
+                        return found + [candidate]
+                return None
+            if self.is_file(init):
+                found.append(init)
+            elif not os.path.isdir(path):
+                return None
+        return found
+
+    def resolve_python(self, full_path, specifier, names):
+        if specifier.startswith('.'):
+            level = len(specifier) - len(specifier.lstrip('.'))
+            base = os.path.dirname(full_path)
+            for _ in range(level - 1):
+                base = os.path.dirname(base)
+            bases = [base]
+            parts = [part for part in specifier[level:].split('.') if part]
+        else:
+            # Absolute imports are looked up like sys.path: the roots, then the importing file's directory
+            bases = self.roots + [os.path.dirname(full_path)]
+            parts = specifier.split('.')
+
+        for base in bases:
+            module = self.python_module(base, parts) if parts else []
+            if module is None:
+                continue
+            package = os.path.join(base, *parts)
+            if not parts and self.is_file(os.path.join(package, '__init__.py')):
+                module.append(os.path.join(package, '__init__.py'))
+            # 'from package import name' may name a submodule
+            for name in names:
+                if name != '*':
+                    submodule = self.python_module(package, [name])
+                    if submodule:
+                        module.extend(submodule)
+            if module or not parts:
+                return module
+        return []
+
+    def resolve(self, full_path, specifier, names):
+        if full_path.endswith(JS_SUFFIXES):
+            resolved = self.resolve_js(full_path, specifier)
+        else:
+            resolved = self.resolve_python(full_path, specifier, names)
+        return [path for path in resolved if path is not None]
+
+    def dependencies(self, full_path):
+        """The files ``full_path`` imports, in the order of its import statements, without repeats"""
+        seen = set()
+        deps = []
+        for specifier, names in self.imports_of(full_path):
+            for path in self.resolve(full_path, specifier, names):
+                if path != full_path and path not in seen:
+                    seen.add(path)
+                    deps.append(path)
+        return deps
+
+    def _batch_dependencies(self, paths):
+        return [self.dependencies(full_path) for full_path in paths]
+
+    def build(self, entry_points):
+        """Find every file reachable from ``entry_points``; each wave of new files is read on a thread pool"""
+        frontier = [os.path.abspath(path) for path in entry_points]
+        reached = set(frontier)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while frontier:
+                found = []
+                batch = max(1, min(BUILD_BATCH, len(frontier) // self.workers))
+                batches = [frontier[i:i + batch] for i in range(0, len(frontier), batch)]
+                for paths, batch_deps in zip(batches, pool.map(self._batch_dependencies, batches)):
+                    for full_path, deps in zip(paths, batch_deps):
+                        self.edges[full_path] = deps
+                        for dep in deps:
+                            if dep not in reached:
+                                reached.add(dep)
+                                found.append(dep)
+                frontier = found
+        return self
+
+    def order(self, entry_points):
+        """Every reachable file once, each after the files it imports (import cycles are cut where they close)"""
+        ordered = []
+        done = set()
+        for entry in entry_points:
+            entry = os.path.abspath(entry)
+            if entry in done:
+                continue
+            done.add(entry)
+            stack = [(entry, iter(self.edges.get(entry, ())))]
+            while stack:
+                node, deps = stack[-1]
+                for dep in deps:
+                    if dep not in done:
+                        done.add(dep)
+                        stack.append((dep, iter(self.edges.get(dep, ()))))
+                        break
+                else:
+                    stack.pop()
+                    ordered.append(node)
+        return ordered
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import re
+
+CHUNKS_SUFFIX = ".chunks.jsonl"
+# 2: the manifest keeps each chunk's ranges along with its hash
+# 3: a cut never looks at text in front of the chunk it ends, so bodies can be chunked as they stream
+CHUNKS_VERSION = 3
+# About 500 tokens of code, a common size for embedding
+DEFAULT_CHUNK_BYTES = 2048
+# A chunk is only cut short of its target at a boundary past this share of it
+MIN_CHUNK_SHARE = 0.5
+
+# What opens a function, class or other block: its keyword, or a decorator in front of it
+_DEFINITION = (rb"(?:@[\w.]|(?:export[ \t]+)?(?:default[ \t]+)?(?:abstract[ \t]+)?(?:async[ \t]+)?"
+               rb"(?:def|class|function|interface|type|enum|const|let|var|module|namespace)\b)")
+# Lines that belong to whatever follows them
+_ATTACHED = re.compile(rb"[ \t]*(?:#|//|/\*|\*|@[\w.])")
+
+# Boundaries from strongest to weakest: a top-level definition after a blank line; any line after a blank
+# line, or a top-level definition; a nested definition. Failing all of these a chunk ends at the last line
+# end in reach. Each pattern starts with a newline, which the regex engine scans for quickly, and matches
+# up to the start of the line a chunk would begin with; the blank line one stops at its own newline.
+_BLANK_BEFORE_DEFINITION = re.compile(rb"\n[ \t]*\n(?=" + _DEFINITION + rb")")
+_BLANK_LINE = re.compile(rb"\n[ \t]*(?=\n)")
+_DEFINITION_LINE = re.compile(rb"\n(?=" + _DEFINITION + rb")")
+# (?![ \t]) keeps the indentation from being backtracked over, one space at a time, on every line
+_NESTED_DEFINITION_LINE = re.compile(rb"\n(?=[ \t]+(?![ \t])" + _DEFINITION + rb")")
+# Room past a chunk's limit for a pattern to see the line that would start the next chunk
+_LOOKAHEAD = 64
+
+
+def chunk_settings(target_bytes):
+    """A string that changes whenever chunks of the same body would come out differently"""
+    return f"{CHUNKS_VERSION}:{target_bytes}"
+
+
+def chunks_path(output_path):
+    return output_path + CHUNKS_SUFFIX
+
+
+def chunk_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _last_boundary(pattern, data, chunk_start, start, lowest, limit, detached=False, skip=0):
+    """The last line start in [lowest, limit] that ``pattern`` matches up to (``skip`` bytes short of), or None.
+
+    Matching begins at ``start``. With ``detached`` a definition under a
+    comment or decorator does not count: they stay together. Nothing in
+    front of ``chunk_start`` is looked at.
+    """
+    found = None
+    for match in pattern.finditer(data, start, limit + _LOOKAHEAD):
+        line_start = match.end() + skip
+        if line_start > limit:
+            break
+        if line_start < lowest:
+            continue
+        if detached:
+            previous_start = max(chunk_start, data.rfind(b"\n", chunk_start, match.start()) + 1)
+            if _ATTACHED.match(data, previous_start):
+                continue
+        found = line_start
+    return found
+
+
+def _cut(data, start, target_bytes):
+    """Where the chunk starting at ``start`` ends, when more than ``target_bytes`` follow it"""
+    limit = start + target_bytes
+    lowest = start + max(1, int(target_bytes * MIN_CHUNK_SHARE))
+    # Every boundary in reach matches from the line end before ``lowest`` on
+    scan_from = max(start, data.rfind(b"\n", start, lowest - 1))
+    cut = _last_boundary(_BLANK_BEFORE_DEFINITION, data, start, scan_from, lowest, limit)
+    if cut is not None:
+        return cut
+    blank = _last_boundary(_BLANK_LINE, data, start, scan_from, lowest, limit, skip=1)
+    definition = _last_boundary(_DEFINITION_LINE, data, start, scan_from, lowest, limit, detached=True)
+    if blank is not None or definition is not None:
+        return max(cut for cut in (blank, definition) if cut is not None)
+    cut = _last_boundary(_NESTED_DEFINITION_LINE, data, start, scan_from, lowest, limit, detached=True)
+    if cut is not None:
+        return cut
+    newline = data.rfind(b"\n", lowest - 1, limit)
+    if newline != -1:
+        return newline + 1
+    # No line ends in reach: end at the last one before it, or split the long line itself
+    newline = data.rfind(b"\n", start, lowest - 1)
+    if newline != -1:
+        return newline + 1
+    cut = limit
+    # Never split a UTF-8 sequence
+    while cut > start + 1 and data[cut] & 0xC0 == 0x80:
+        cut -= 1
+    return cut
+
+
+def chunk_ranges(data, target_bytes):
+    """Cut an exported body into chunks of at most ``target_bytes``; returns [(start, end, first_line, last_line)].
+
+    Cuts go at line starts, preferring a top-level definition after a
+    blank line, then any line after a blank line or any top-level
+    definition, then a nested definition, and never closer to the
+    previous cut than MIN_CHUNK_SHARE of the target. Only a line longer
+    than the target is split inside. Line numbers start at 1.
+    """
+    ranges = []
+    line = 1
+    for start, end in _cuts(data, 0, target_bytes, final=True):
+        newlines = data.count(b"\n", start, end)
+        ranges.append((start, end, line, _last_line(data, start, end, line, newlines)))
+        line += newlines
+    return ranges
+
+
+def _cuts(data, start, target_bytes, final):
+    """Yield the (start, end) of each chunk of ``data`` from ``start`` on.
+
+    Unless ``final``, more of the body is still to come: only the chunks
+    whose cut is settled by what is there are yielded, and the rest is left
+    for when more arrives. A cut looks at most _LOOKAHEAD bytes past the
+    target, and one byte more is held back so that dropping a trailing
+    newline later cannot change it.
+    """
+    size = len(data)
+    while start < size:
+        if size - start > target_bytes + _LOOKAHEAD + 1:
+            end = _cut(data, start, target_bytes)
+        elif not final:
+            return
+        else:
+            end = _cut(data, start, target_bytes) if size - start > target_bytes else size
+        yield start, end
+        start = end
+
+
+def _last_line(data, start, end, line, newlines):
+    """The last line of the chunk ``data[start:end]`` that starts on ``line`` and holds ``newlines`` line ends"""
+    last_line = line + newlines - (1 if data[end - 1:end] == b"\n" else 0)
+    return max(line, last_line)
+
+
+class ChunkWriter:
+    """Writes the chunks of each exported file to a JSONL file as the export streams.
+
+    Each body is fed to it while it is written, through the BodyChunker
+    open_body() returns. The file opens with a 'run' record. Every chunk
+    is a 'chunk' record with its source, path, index, line range, byte
+    range within the exported body, content hash and text. ``previous``
+    maps the full path of each file of the last run to (source_path,
+    relative_path, chunks), each chunk being [hash, start, end,
+    first_line, last_line] in index order, as BodyChunker.finish() returns
+    them. With it the run record says ``"full":
+    false`` and a file's chunk is only written when its index, ranges or
+    hash differ from the last run; every chunk of the last run that is not
+    kept as it was, including all chunks of files no longer exported, gets
+    a 'removed' record naming its index and hash, written before the
+    records that replace it.
+    """
+
+    def __init__(self, path, target_bytes=DEFAULT_CHUNK_BYTES, previous=None):
+        self.path = path
+        self.target_bytes = target_bytes
+        self.previous = previous
+        self.seen = set()
+        self.temp_path = path + ".partial"
+        self.out = open(self.temp_path, 'wb')
+        # Chunks of the export, chunk records written and chunks reported removed
+        self.chunks = 0
+        self.written = 0
+        self.removed = 0
+        self.write({'type': 'run', 'version': CHUNKS_VERSION, 'full': previous is None, 'target_bytes': target_bytes})
+
+    def write(self, record):
+        # Escaping non-ASCII text is quicker than encoding it, and the file stays plain ASCII
+        self.out.write(json.dumps(record).encode('ascii') + b"\n")
+
+    def keep(self, full_path):
+        """The chunks of an unchanged file as the last run wrote them, or None if it has to be chunked"""
+        if self.previous is None or full_path not in self.previous:
+            return None
+        self.seen.add(full_path)
+        chunks = self.previous[full_path][2]
+        self.chunks += len(chunks)
+        return chunks
+
+    def open_body(self, source_path, relative_path, full_path):
+        """A BodyChunker to feed one exported body to while it is written"""
+        previous = []
+        if self.previous is not None and full_path in self.previous:
+            previous = self.previous[full_path][2]
+        return BodyChunker(self, source_path, relative_path, full_path, previous)
+
+    def mark(self):
+        return self.out.tell(), self.written, self.removed
+
+    def rewind(self, mark):
+        """Take back every record written since ``mark``"""
+        offset, self.written, self.removed = mark
+        self.out.seek(offset)
+        self.out.truncate()
+
+    def remove(self, source_path, relative_path, chunks):
+        """Write a 'removed' record for each (index, hash) of ``chunks``"""
+        for number, digest in chunks:
+            self.write({'type': 'removed', 'source': source_path, 'path': relative_path, 'chunk': number,
+                        'hash': digest})
+            self.removed += 1
+
+    def finish(self):
+        """Report the chunks of files the last run had and this one did not, and move the file into place"""
+        if self.previous is not None:
+            for full_path, (source_path, relative_path, chunks) in self.previous.items():
+                if full_path not in self.seen:
+                    self.remove(source_path, relative_path,
+                                [(number, chunk[0]) for number, chunk in enumerate(chunks)])
+        self.out.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        if not self.out.closed:
+            self.out.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class BodyChunker:
+    """Cuts one body into chunks while it is written, writing each chunk's records as soon as its cut is settled.
+
+    Only the text from the last cut on is kept, which is at most a chunk
+    and its lookahead more than the last piece fed, and the chunks come out
+    as chunk_ranges would cut the whole body. The body is fed with
+    update(); restart() takes back what was fed to start over, discard()
+    gives up on the body and finish() ends it.
+    """
+
+    def __init__(self, writer, source_path, relative_path, full_path, previous):
+        self.writer = writer
+        self.source_path = source_path
+        self.relative_path = relative_path
+        self.full_path = full_path
+        self.previous = previous
+        self.start_mark = writer.mark()
+        self.chunks = []
+        self.restart()
+
+    def restart(self):
+        # Records are only written along with chunks
+        if self.chunks:
+            self.writer.rewind(self.start_mark)
+        self.buffer = bytearray()
+        # Where the buffer starts in the body, and the line it starts on
+        self.offset = 0
+        self.line = 1
+        self.chunks = []
+
+    def update(self, data):
+        self.buffer += data
+        self.cut(final=False)
+
+    def cut(self, final):
+        buffer = self.buffer
+        consumed = 0
+        for start, end in _cuts(buffer, 0, self.writer.target_bytes, final):
+            newlines = buffer.count(b"\n", start, end)
+            self.add_chunk(buffer[start:end], self.offset + start, self.offset + end,
+                           _last_line(buffer, start, end, self.line, newlines))
+            self.line += newlines
+            consumed = end
+        del buffer[:consumed]
+        self.offset += consumed
+
+    def add_chunk(self, data, start, end, last_line):
+        number = len(self.chunks)
+        chunk = [chunk_digest(data), start, end, self.line, last_line]
+        self.chunks.append(chunk)
+        if number < len(self.previous) and self.previous[number] == chunk:
+            return
+        if number < len(self.previous):
+            self.writer.remove(self.source_path, self.relative_path, [(number, self.previous[number][0])])
+        self.writer.write({
+            'type': 'chunk',
+            'source': self.source_path,
+            'path': self.relative_path,
+            'chunk': number,
+            'lines': [self.line, last_line],
+            'bytes': [start, end],
+            'hash': chunk[0],
+            'text': data.decode('utf-8', 'replace'),
+        })
+        self.writer.written += 1
+
+    def finish(self, trim=0):
+        """Chunk the rest of the body, less its last ``trim`` bytes; returns its chunks, for the next run"""
+        if trim:
+            del self.buffer[len(self.buffer) - trim:]
+        self.cut(final=True)
+        self.writer.remove(self.source_path, self.relative_path,
+                           [(number, chunk[0]) for number, chunk in enumerate(self.previous)
+                            if number >= len(self.chunks)])
+        self.writer.seen.add(self.full_path)
+        self.writer.chunks += len(self.chunks)
+        return self.chunks
+
+    def discard(self):
+        """Take back the records of a body that could not be written; the last run's chunks of it are removed"""
+        if self.chunks:
+            self.writer.rewind(self.start_mark)
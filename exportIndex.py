@@ -0,0 +1,126 @@
+import json
+import os
+
+from compressedExport import get_codec, read_range
+from jsonFiles import save_json
+
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 2
+INDEX_FIELDS = ('source', 'path', 'offset', 'content_offset', 'content_length', 'lines', 'hash', 'tokens')
+
+
+def index_path(export_path):
+    return export_path + INDEX_SUFFIX
+
+
+class IndexEntry:
+    """Where one file's section sits in an export.
+
+    ``offset`` is the position of the newline in front of the section's
+    "File: " line, which is where the splitter cuts. ``content_offset`` and
+    ``content_length`` cover the file's content alone, without the newline
+    the exporter adds after it.
+    """
+
+    __slots__ = INDEX_FIELDS
+
+    def __init__(self, source, path, offset, content_offset, content_length, lines, hash, tokens=None):
+        self.source = source
+        self.path = path
+        self.offset = offset
+        self.content_offset = content_offset
+        self.content_length = content_length
+        self.lines = lines
+        self.hash = hash
+        # None unless the export counted tokens
+        self.tokens = tokens
+
+    def as_row(self):
+        return [getattr(self, field) for field in INDEX_FIELDS]
+
+
+class ExportIndex:
+    """Table of contents of an export, kept in a sidecar so the export text itself is unchanged.
+
+    Offsets are always positions in the export's text. For a compressed
+    export ``frames`` maps them to the file: (text_offset, file_offset) of
+    every independently compressed frame, and ``text_size`` is the length
+    of the text.
+    """
+
+    def __init__(self, entries=None, compression=None, frames=None, text_size=None):
+        self.entries = entries if entries is not None else []
+        self.compression = compression
+        self.frames = frames
+        self.text_size = text_size
+
+    @property
+    def header_length(self):
+        """Bytes before the first section, which the splitter repeats at the top of every part"""
+        return self.entries[0].offset if self.entries else 0
+
+    def add(self, source, path, offset, content_offset, content_length, lines, hash, tokens=None):
+        self.entries.append(IndexEntry(source, path, offset, content_offset, content_length, lines, hash, tokens))
+
+    def extend(self, entries, shift=0):
+        """Append ``entries`` of another export whose sections were spliced in ``shift`` bytes further on in this one"""
+        self.entries.extend(IndexEntry(entry.source, entry.path, entry.offset + shift, entry.content_offset + shift,
+                                       entry.content_length, entry.lines, entry.hash, entry.tokens)
+                            for entry in entries)
+
+    def find(self, path, source=None):
+        """Return the entry for ``path`` (optionally within ``source``), or None"""
+        for entry in self.entries:
+            if entry.path == path and (source is None or entry.source == source):
+                return entry
+        return None
+
+    @classmethod
+    def load(cls, export_path):
+        """Return the index of ``export_path``, or None if it is missing or was written for another file"""
+        try:
+            with open(index_path(export_path), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            export_stat = os.stat(export_path)
+        except (OSError, ValueError):
+            return None
+
+        if (data.get('version') != INDEX_VERSION
+                or data.get('export_size') != export_stat.st_size
+                or data.get('export_mtime_ns') != export_stat.st_mtime_ns):
+            return None
+        fields = data['fields']
+        entries = [IndexEntry(**dict(zip(fields, row))) for row in data['sections']]
+        frames = [tuple(frame) for frame in data['frames']] if data.get('frames') is not None else None
+        return cls(entries, data.get('compression'), frames, data.get('text_size'))
+
+    def save(self, export_path):
+        """Write the index next to ``export_path``, which must already be in its final place"""
+        export_stat = os.stat(export_path)
+        data = {
+            'version': INDEX_VERSION,
+            'export_size': export_stat.st_size,
+            'export_mtime_ns': export_stat.st_mtime_ns,
+            'header_length': self.header_length,
+            'fields': list(INDEX_FIELDS),
+            'sections': [entry.as_row() for entry in self.entries],
+            'compression': self.compression,
+            'frames': self.frames,
+            'text_size': self.text_size,
+        }
+        save_json(index_path(export_path), data, separators=(',', ':'))
+
+
+def read_content(export_path, entry, index=None):
+    """Return one file's content from an export as bytes, seeking straight to it.
+
+    For a compressed export pass its ``index``; only the frames holding the
+    content are inflated.
+    """
+    with open(export_path, 'rb') as f:
+        if index is not None and index.compression is not None:
+            codec = get_codec(index.compression)
+            return read_range(f, index.frames, codec, entry.content_offset,
+                              entry.content_offset + entry.content_length)
+        f.seek(entry.content_offset)
+        return f.read(entry.content_length)
@@ -0,0 +1,104 @@
+import json
+import os
+
+from fileClassifier import DUPLICATE
+from jsonFiles import save_json
+
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 4
+
+
+def manifest_path(output_path):
+    return output_path + MANIFEST_SUFFIX
+
+
+class ExportManifest:
+    """Per-file record of an export: the stat data each file was read with and where its body sits.
+
+    ``offset`` and ``length`` are the byte range of a file's body (its
+    content plus trailing newline) inside the export, so an unchanged file
+    can be copied straight out of the previous export on the next run.
+    """
+
+    def __init__(self, started_ns, body_settings, entries=None, chunk_settings=None):
+        self.started_ns = started_ns
+        # Settings that shape exported bodies; a change invalidates every entry
+        self.body_settings = body_settings
+        # How the 'chunks' of the entries were cut, when the export wrote chunks (see ChunkWriter)
+        self.chunk_settings = chunk_settings
+        self.entries = entries if entries is not None else []
+        self.by_path = {entry['full_path']: entry for entry in self.entries}
+
+    @classmethod
+    def load(cls, output_path, body_settings):
+        """Return the manifest of an existing export, or None if it is missing or out of date"""
+        try:
+            with open(manifest_path(output_path), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            export_stat = os.stat(output_path)
+        except (OSError, ValueError):
+            return None
+
+        # The export must be exactly the file the manifest was written for
+        if (data.get('version') != MANIFEST_VERSION
+                or data.get('export_size') != export_stat.st_size
+                or data.get('export_mtime_ns') != export_stat.st_mtime_ns
+                or data.get('body_settings') != body_settings):
+            return None
+        return cls(data['started_ns'], body_settings, data['entries'], data.get('chunk_settings'))
+
+    def reusable(self, full_path, stat_result):
+        """Return the entry for ``full_path`` if the file is unchanged since it was exported"""
+        entry = self.by_path.get(full_path)
+        if entry is None or entry['hash'] is None:
+            return None
+        # A reference to another file is only right while that file is unchanged too
+        if entry['decision'] == DUPLICATE:
+            return None
+        # A file modified in the same clock tick as the last scan could still
+        # change without its mtime moving, so only trust older timestamps
+        if entry['mtime_ns'] >= self.started_ns:
+            return None
+        if entry['size'] != stat_result.st_size or entry['mtime_ns'] != stat_result.st_mtime_ns:
+            return None
+        return entry
+
+    def add(self, source_path, relative_path, full_path, size, mtime_ns, digest, offset, length, decision, lines,
+            tokens=None, chunks=None):
+        entry = {
+            'source': source_path,
+            'path': relative_path,
+            'full_path': full_path,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'hash': digest,
+            'offset': offset,
+            'length': length,
+            'decision': decision,
+            'lines': lines,
+            'tokens': tokens,
+            'chunks': chunks,
+        }
+        self.entries.append(entry)
+        self.by_path[full_path] = entry
+
+    def extend(self, entries, shift=0):
+        """Append ``entries`` of another export whose bodies were spliced in ``shift`` bytes further on in this one"""
+        for entry in entries:
+            entry = dict(entry, offset=entry['offset'] + shift)
+            self.entries.append(entry)
+            self.by_path[entry['full_path']] = entry
+
+    def save(self, output_path):
+        """Write the manifest next to ``output_path``, which must already be in its final place"""
+        export_stat = os.stat(output_path)
+        data = {
+            'version': MANIFEST_VERSION,
+            'started_ns': self.started_ns,
+            'body_settings': self.body_settings,
+            'chunk_settings': self.chunk_settings,
+            'export_size': export_stat.st_size,
+            'export_mtime_ns': export_stat.st_mtime_ns,
+            'entries': self.entries,
+        }
+        save_json(manifest_path(output_path), data)
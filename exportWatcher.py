@@ -0,0 +1,585 @@
+import copy
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from contextlib import ExitStack
+
+from exportIndex import ExportIndex
+from exportManifest import ExportManifest
+from fileFilters import IGNORE_FILE_NAMES
+from scanEngine import (ExportStats, ReadAhead, SectionWriter, export, fill_field, load_file_body,
+                        scan_directory, splice_file, write_export_header)
+
+# Seconds between stat sweeps when the tree is polled
+DEFAULT_POLL_INTERVAL = 1.0
+# Quiet time after the last change before the export is rewritten, so a burst of saves is one rewrite
+DEFAULT_DEBOUNCE = 0.2
+# A burst that never goes quiet is still written out this often
+MAX_BATCH_SECONDS = 2.0
+# How often a blocked inotify read looks at the stop flag
+STOP_CHECK_SECONDS = 0.5
+# File systems stamp times from a coarse clock (FAT to 2 s), so a change can carry a time this much before it
+MTIME_GRANULARITY_NS = 2 * 10**9
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Events that add or remove directory entries, and events that change a file in place
+ENTRY_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+CONTENT_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def stat_key(path, dir_fd=None):
+    """(size, mtime_ns) of ``path``, or None if it cannot be stat'ed"""
+    try:
+        stat_result = os.stat(path, dir_fd=dir_fd)
+    except OSError:
+        return None
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+def stat_keys(dir_path, names):
+    """stat_key of every one of ``names`` in ``dir_path``, resolving the directory once for the batch"""
+    if not names:
+        return {}
+    if os.stat not in os.supports_dir_fd:
+        return {name: stat_key(os.path.join(dir_path, name)) for name in names}
+    try:
+        dir_fd = os.open(dir_path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    except OSError:
+        return {name: None for name in names}
+    try:
+        return {name: stat_key(name, dir_fd) for name in names}
+    finally:
+        os.close(dir_fd)
+
+
+class WatchedDirectory:
+    """One listed directory: the matched files it held, with their stat keys, and the rules it was listed with"""
+
+    __slots__ = ('source_path', 'relative_dir', 'parent_stack', 'child_stack', 'mtime_ns', 'files', 'subdirs',
+                 'ignore_files')
+
+    def __init__(self, source_path, relative_dir, parent_stack, child_stack, mtime_ns, files, subdirs, ignore_files):
+        self.source_path = source_path
+        self.relative_dir = relative_dir
+        # Rules to list this directory with, and the rules it hands down to its subdirectories
+        self.parent_stack = parent_stack
+        self.child_stack = child_stack
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.subdirs = subdirs
+        # Stat keys of the ignore files here; editing one in place does not touch the directory's mtime
+        self.ignore_files = ignore_files
+
+
+class SourceTree:
+    """In-memory copy of the files a scan would export, kept current by listing single directories again.
+
+    It starts out from the listings of the export's own walk, passed to
+    add_listing(). ``monitor``, when given, is told about every directory that is listed
+    or forgotten so it can watch it. ``version`` goes up whenever the set
+    of files or one of their stat keys changes.
+    """
+
+    def __init__(self, config, monitor=None):
+        self.config = config
+        self.file_filter = config.file_filter
+        self.monitor = monitor
+        self.directories = {}
+        # Sources that are single files -> stat key
+        self.single_files = {}
+        self.version = 0
+
+    def add_file_sources(self):
+        """Track the sources that are single files; directories come in through add_listing()"""
+        for source_path in sorted(set(self.config.sources)):
+            if os.path.isfile(source_path) and self.file_filter.single_file_selected(os.path.basename(source_path)):
+                if self.monitor is not None:
+                    self.monitor.add(source_path)
+                self.single_files[source_path] = stat_key(source_path)
+
+    def add_listing(self, source_path, relative_dir, dir_path, parent_stack, listing):
+        """Record a directory a walk has just listed (see walk_source) instead of listing it again.
+
+        Its watch is only added now, so anything that changed in between is
+        caught by settle().
+        """
+        if self.monitor is not None:
+            self.monitor.add(dir_path)
+        key = stat_key(dir_path)
+        if key is not None:
+            self._record(source_path, relative_dir, dir_path, parent_stack, listing, key[1])
+
+    def settle(self, started_ns):
+        """List again every directory changed since ``started_ns``, when a walk that recorded it began"""
+        for dir_path, node in list(self.directories.items()):
+            if self.directories.get(dir_path) is node and node.mtime_ns >= started_ns - MTIME_GRANULARITY_NS:
+                self.relist(dir_path)
+
+    def _list(self, source_path, relative_dir, dir_path, parent_stack):
+        """List one directory and record it; returns the WatchedDirectory, or None if it is gone"""
+        if self.monitor is not None:
+            # Watch before listing, so nothing created in between goes unnoticed
+            self.monitor.add(dir_path)
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            self._forget(dir_path)
+            return None
+        listing = scan_directory(self.file_filter, dir_path, relative_dir, parent_stack)
+        return self._record(source_path, relative_dir, dir_path, parent_stack, listing, mtime_ns)
+
+    def _record(self, source_path, relative_dir, dir_path, parent_stack, listing, mtime_ns):
+        matched, subdirs, child_stack = listing
+        ignore_names = []
+        if self.config.use_ignore_files:
+            ignore_names = [name for name in IGNORE_FILE_NAMES if os.path.isfile(os.path.join(dir_path, name))]
+        node = WatchedDirectory(source_path, relative_dir, parent_stack, child_stack, mtime_ns,
+                                stat_keys(dir_path, matched), subdirs, stat_keys(dir_path, ignore_names))
+        self.directories[dir_path] = node
+        return node
+
+    def _list_tree(self, source_path, relative_dir, dir_path, parent_stack):
+        pending = [(relative_dir, dir_path, parent_stack)]
+        while pending:
+            relative_dir, dir_path, parent_stack = pending.pop()
+            node = self._list(source_path, relative_dir, dir_path, parent_stack)
+            if node is not None:
+                pending.extend((os.path.join(relative_dir, name), os.path.join(dir_path, name), node.child_stack)
+                               for name in node.subdirs)
+
+    def _forget(self, dir_path):
+        """Drop ``dir_path`` and everything below it"""
+        prefix = dir_path + os.sep
+        for path in [path for path in self.directories if path == dir_path or path.startswith(prefix)]:
+            del self.directories[path]
+            if self.monitor is not None:
+                self.monitor.discard(path)
+
+    def relist(self, dir_path, deep=False):
+        """List ``dir_path`` again after entries were added or removed there.
+
+        Subdirectories that appeared are listed in full and those that went
+        away are dropped. ``deep`` lists the whole subtree again, which is
+        needed when the ignore rules handed down may have changed.
+        """
+        old = self.directories.get(dir_path)
+        if old is None:
+            return
+        if deep:
+            self._forget(dir_path)
+            self._list_tree(old.source_path, old.relative_dir, dir_path, old.parent_stack)
+            self.version += 1
+            return
+        node = self._list(old.source_path, old.relative_dir, dir_path, old.parent_stack)
+        if node is None:
+            self.version += 1
+            return
+        if node.ignore_files != old.ignore_files:
+            self.relist(dir_path, deep=True)
+            return
+        if node.files != old.files or node.subdirs != old.subdirs:
+            self.version += 1
+        kept = set(old.subdirs)
+        for name in kept.difference(node.subdirs):
+            self._forget(os.path.join(dir_path, name))
+        for name in node.subdirs:
+            if name not in kept:
+                self._list_tree(old.source_path, os.path.join(old.relative_dir, name), os.path.join(dir_path, name),
+                                node.child_stack)
+
+    def restat(self, full_path):
+        """Take a fresh stat of a file that may have been written to"""
+        if full_path in self.single_files:
+            key = stat_key(full_path)
+            if key != self.single_files[full_path]:
+                self.single_files[full_path] = key
+                self.version += 1
+            return
+        dir_path, name = os.path.split(full_path)
+        node = self.directories.get(dir_path)
+        if node is None:
+            return
+        if name in node.ignore_files or name in IGNORE_FILE_NAMES and self.config.use_ignore_files:
+            if stat_key(full_path) != node.ignore_files.get(name):
+                self.relist(dir_path, deep=True)
+        elif name in node.files:
+            key = stat_key(full_path)
+            if key != node.files[name]:
+                node.files[name] = key
+                self.version += 1
+
+    def sweep(self):
+        """Stat every known directory and file, relisting directories whose entries changed"""
+        for full_path in list(self.single_files):
+            self.restat(full_path)
+        for dir_path, node in list(self.directories.items()):
+            if self.directories.get(dir_path) is not node:
+                # Relisted or dropped earlier in this sweep
+                continue
+            mtime_ns = stat_key(dir_path)
+            mtime_ns = mtime_ns[1] if mtime_ns is not None else None
+            if mtime_ns != node.mtime_ns:
+                self.relist(dir_path)
+                continue
+            if stat_keys(dir_path, list(node.ignore_files)) != node.ignore_files:
+                self.relist(dir_path, deep=True)
+                continue
+            keys = stat_keys(dir_path, list(node.files))
+            if keys != node.files:
+                node.files = keys
+                self.version += 1
+
+    def files(self):
+        """Every file as (source_path, relative_path, full_path, stat key), in export order"""
+        by_source = {source_path: [(os.path.basename(source_path), source_path, key)]
+                     for source_path, key in self.single_files.items()}
+        for dir_path, node in self.directories.items():
+            found = by_source.setdefault(node.source_path, [])
+            # Plain concatenation; os.path.join is a noticeable cost at 100k files
+            relative_prefix = node.relative_dir + os.sep if node.relative_dir else ""
+            full_prefix = os.path.join(dir_path, "")
+            found.extend((relative_prefix + name, full_prefix + name, key) for name, key in node.files.items())
+        return [(source_path, relative_path, full_path, key)
+                for source_path in sorted(by_source)
+                for relative_path, full_path, key in sorted(by_source[source_path])]
+
+
+class InotifyMonitor:
+    """Watches directories through the Linux inotify API, called with ctypes.
+
+    Raises OSError where inotify is not available. When the kernel's watch
+    limit is reached ``failed`` is set and the caller should fall back to
+    polling.
+    """
+
+    WATCH_MASK = ENTRY_EVENTS | CONTENT_EVENTS
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "this C library has no inotify")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.paths = {}
+        self.watches = {}
+        self.failed = False
+
+    def add(self, path):
+        if path in self.watches:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            # ENOSPC is the max_user_watches limit; anything else means the path went away
+            if ctypes.get_errno() == errno.ENOSPC:
+                self.failed = True
+            return
+        self.paths[wd] = path
+        self.watches[path] = wd
+
+    def discard(self, path):
+        wd = self.watches.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Return [(watched path, entry name, mask), ...] of what arrived within ``timeout`` seconds"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        events = []
+        while ready:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                path = self.paths.get(wd)
+                if mask & IN_IGNORED:
+                    # The kernel dropped the watch (the directory is gone)
+                    self.paths.pop(wd, None)
+                    if path is not None and self.watches.get(path) == wd:
+                        del self.watches[path]
+                    continue
+                events.append((path, os.fsdecode(name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def rewrite_export(config, output_path, files, manifest, index=None):
+    """Write the export of ``files`` again, splicing runs of unchanged sections straight out of the current one.
+
+    ``files`` lists (source_path, relative_path, full_path, stat key) in
+    export order; ``manifest`` and, with ``config.write_index``, ``index``
+    describe the current export, entry for entry. Only new files and files
+    whose stat key no longer matches their entry are read. Returns (stats,
+    manifest, index) of the new export, which the caller saves; as with
+    write_export the export is left alone when no file is left.
+    """
+    stats = ExportStats()
+    tokenizer = config.tokenizer
+    policy = config.content_policy if config.content_policy.enabled else None
+    new_manifest = ExportManifest(time.time_ns(), config.body_settings)
+    new_index = ExportIndex() if config.write_index else None
+    old_entries = manifest.entries
+    numbers = {entry['full_path']: number for number, entry in enumerate(old_entries)}
+    # Changed files are read whole up to the read-ahead's per-file limit, so their sections come out as export writes them
+    size_limit = ReadAhead(config.read_workers, config.read_ahead_bytes, None).file_limit if config.read_workers else -1
+    temp_path = output_path + ".partial"
+
+    try:
+        with ExitStack() as stack:
+            out = stack.enter_context(open(temp_path, 'wb'))
+            previous_export = stack.enter_context(open(output_path, 'rb')) if old_entries else None
+            count_offset, token_offsets = write_export_header(out, config, token_fields=tokenizer is not None)
+            sections = SectionWriter(out, config, stats, new_manifest, new_index)
+            # [first, last] numbers of old entries that follow each other in both exports, copied in one go
+            run = []
+
+            def flush():
+                if not run:
+                    return
+                start, end = run[0], run[1] + 1
+                first, last = old_entries[start], old_entries[end - 1]
+                shift = out.tell() - first['offset']
+                splice_file(previous_export, out, first['offset'], last['offset'] + last['length'] - first['offset'])
+                new_manifest.extend(old_entries[start:end], shift)
+                if new_index is not None:
+                    new_index.extend(index.entries[start:end], shift)
+                for entry in old_entries[start:end]:
+                    stats.count(entry['decision'])
+                    stats.add_tokens(entry['source'], entry['path'], entry['tokens'])
+                stats.total_files += end - start
+                stats.reused_files += end - start
+                sections.current_source = last['source']
+                run.clear()
+
+            for source_path, relative_path, full_path, key in files:
+                number = numbers.get(full_path)
+                entry = old_entries[number] if number is not None else None
+                # Same reuse rules as ExportManifest.reusable, against the stat the tree already holds
+                if (entry is None or entry['hash'] is None or entry['source'] != source_path
+                        or key != (entry['size'], entry['mtime_ns']) or entry['mtime_ns'] >= manifest.started_ns):
+                    flush()
+                    body = load_file_body(full_path, size_limit, policy=policy, tokenizer=tokenizer)
+                    sections.write(source_path, relative_path, full_path, body)
+                    continue
+                if run and number == run[1] + 1:
+                    run[1] = number
+                    continue
+                flush()
+                sections.write_header(source_path, relative_path, entry['tokens'])
+                run[:] = [number, number]
+            flush()
+
+            fill_field(out, count_offset, stats.total_files)
+            if tokenizer is not None:
+                fill_field(out, token_offsets[None], stats.total_tokens)
+                for source_path, offset in token_offsets.items():
+                    if source_path is not None:
+                        fill_field(out, offset, stats.source_tokens.get(source_path, 0))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    stats.pipeline.finish()
+    if not stats.total_files:
+        os.remove(temp_path)
+        return stats, manifest, index
+    os.replace(temp_path, output_path)
+    return stats, new_manifest, new_index
+
+
+class ExportWatcher:
+    """Keeps an export current while its sources change.
+
+    start() writes the export, building the in-memory tree from its walk; run() then
+    waits for changes (inotify where available, else stat sweeps every
+    ``interval`` seconds), lets a burst settle for ``debounce`` seconds and
+    rewrites the export, re-reading only the files that changed. Every
+    rewrite is reported as ``progress('update', stats)``.
+    """
+
+    def __init__(self, config, output_path, progress=None, interval=DEFAULT_POLL_INTERVAL,
+                 debounce=DEFAULT_DEBOUNCE, use_inotify=True):
+        # Rewrites work from the manifest, so the export always keeps one; the caller's config is left as it is
+        config = copy.copy(config)
+        config.incremental = True
+        config.watch = True
+        config.validate()
+        self.config = config
+        self.output_path = output_path
+        self.progress = progress
+        self.interval = interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify
+        self.monitor = None
+        self.tree = None
+        self.manifest = None
+        self.index = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self.monitor is not None else 'polling'
+
+    def start(self, profile=None):
+        """Write the export in full and start tracking the sources; returns its ExportStats.
+
+        ``profile``, a RunProfile, profiles that first full export.
+        """
+        if self.use_inotify:
+            try:
+                self.monitor = InotifyMonitor()
+            except OSError:
+                self.monitor = None
+        self.tree = SourceTree(self.config, self.monitor)
+        self.tree.add_file_sources()
+        started_ns = time.time_ns()
+        stats = export(self.config, self.output_path, self._walk_progress, profile)
+        self.manifest = ExportManifest.load(self.output_path, self.config.body_settings)
+        self.index = ExportIndex.load(self.output_path) if self.config.write_index else None
+        if self.manifest is None or (self.config.write_index and self.index is None):
+            self.manifest = ExportManifest(0, self.config.body_settings)
+            self.index = ExportIndex()
+        version = self.tree.version
+        self.tree.settle(started_ns)
+        self._check_monitor()
+        if self.tree.version != version:
+            # Directories changed while the export listed them; catch up before waiting for changes
+            update_stats = self.update()
+            if self.progress is not None:
+                self.progress('update', update_stats)
+            self.save()
+        return stats
+
+    def _walk_progress(self, event, value):
+        """Progress of the first export: its directory listings seed the tree, the rest goes on"""
+        if event == 'directory':
+            self.tree.add_listing(*value)
+        elif self.progress is not None:
+            self.progress(event, value)
+
+    def _check_monitor(self):
+        """Fall back to polling once inotify runs out of watches"""
+        if self.monitor is not None and self.monitor.failed:
+            self.monitor.close()
+            self.monitor = None
+            self.tree.monitor = None
+            self.tree.sweep()
+
+    def update(self):
+        """Rewrite the export from the tree as it is now; returns the ExportStats of the rewrite.
+
+        The manifest and index are only kept in memory; save() writes them.
+        """
+        stats, self.manifest, self.index = rewrite_export(self.config, self.output_path, self.tree.files(),
+                                                          self.manifest, self.index)
+        return stats
+
+    def save(self):
+        """Write the manifest and index of the export as it is now"""
+        if self.manifest.entries:
+            self.manifest.save(self.output_path)
+            if self.index is not None:
+                self.index.save(self.output_path)
+
+    def run(self, stop=None):
+        """Keep the export current until ``stop`` (a threading.Event) is set"""
+        if stop is None:
+            stop = threading.Event()
+        try:
+            while not stop.is_set():
+                version = self.tree.version
+                if self._wait_for_change(stop) and self.tree.version != version and not stop.is_set():
+                    stats = self.update()
+                    # The export is current now; its sidecars take longer to write than the text on big trees
+                    if self.progress is not None:
+                        self.progress('update', stats)
+                    self.save()
+        finally:
+            self.close()
+
+    def _wait_for_change(self, stop):
+        """Block until something happened and then went quiet; returns True if anything happened"""
+        if self.monitor is None:
+            if stop.wait(self.interval):
+                return False
+            version = self.tree.version
+            self.tree.sweep()
+            if self.tree.version == version:
+                return False
+            deadline = time.monotonic() + MAX_BATCH_SECONDS
+            while time.monotonic() < deadline and not stop.wait(self.debounce):
+                version = self.tree.version
+                self.tree.sweep()
+                if self.tree.version == version:
+                    break
+            return True
+
+        events = self.monitor.read(STOP_CHECK_SECONDS)
+        if not events:
+            return False
+        deadline = time.monotonic() + MAX_BATCH_SECONDS
+        while events:
+            self._apply(events)
+            if time.monotonic() >= deadline or stop.is_set():
+                break
+            events = self.monitor.read(self.debounce)
+        self._check_monitor()
+        return True
+
+    def _apply(self, events):
+        relist = {}
+        restat = set()
+        for path, name, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so look at everything
+                self.tree.sweep()
+                continue
+            if path is None:
+                continue
+            if path in self.tree.single_files:
+                restat.add(path)
+            elif mask & ENTRY_EVENTS:
+                deep = name in IGNORE_FILE_NAMES and self.config.use_ignore_files
+                relist[path] = relist.get(path, False) or deep
+            elif name:
+                restat.add(os.path.join(path, name))
+        for dir_path, deep in relist.items():
+            self.tree.relist(dir_path, deep)
+        for full_path in restat:
+            self.tree.restat(full_path)
+
+    def close(self):
+        if self.monitor is not None:
+            self.monitor.close()
+            self.monitor = None
+            self.tree.monitor = None
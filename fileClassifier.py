@@ -0,0 +1,93 @@
+from textEncoding import is_text_encoding
+
+INCLUDE = 'include'
+TRUNCATE = 'truncate'
+SKIP = 'skip'
+# Set by the exporter, not the policy: the body repeats an earlier file's and is written as a reference
+DUPLICATE = 'duplicate'
+
+# Bytes read from the start of a file to classify it
+SNIFF_BYTES = 8192
+DEFAULT_MAX_FILE_BYTES = 2 * 1024 * 1024
+# A line this long in the first block means the file is minified or bundled
+MINIFIED_LINE_LENGTH = 1000
+# Generated-file markers are only looked for near the top of the file
+GENERATED_HEADER_BYTES = 1024
+
+LOCKFILE_NAMES = frozenset({
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml',
+    'composer.lock', 'Cargo.lock', 'poetry.lock', 'Pipfile.lock', 'Gemfile.lock',
+})
+MINIFIED_SUFFIXES = ('.min.js', '.min.mjs', '.min.css', '.bundle.js', '.chunk.js')
+GENERATED_MARKERS = (b'@generated', b'DO NOT EDIT', b'do not edit', b'auto-generated',
+                     b'autogenerated', b'Code generated by')
+
+
+class ContentPolicy:
+    """Decides from a file's name, size and first block whether to include, truncate or skip it.
+
+    Nothing beyond the first SNIFF_BYTES is looked at, so the decision is
+    made before the file is read in full.
+    """
+
+    def __init__(self, max_file_bytes=DEFAULT_MAX_FILE_BYTES, oversize_action=TRUNCATE, skip_binary=True,
+                 skip_generated=True, skip_minified=True):
+        if oversize_action not in (TRUNCATE, SKIP):
+            raise ValueError(f"Unknown oversize action: {oversize_action}")
+        self.max_file_bytes = max_file_bytes
+        self.oversize_action = oversize_action
+        self.skip_binary = skip_binary
+        self.skip_generated = skip_generated
+        self.skip_minified = skip_minified
+
+    @property
+    def enabled(self):
+        return bool(self.max_file_bytes or self.skip_binary or self.skip_generated or self.skip_minified)
+
+    @property
+    def fingerprint(self):
+        """A string that changes whenever these settings would change an exported body"""
+        return (f"{self.max_file_bytes}:{self.oversize_action}:{int(self.skip_binary)}"
+                f"{int(self.skip_generated)}{int(self.skip_minified)}")
+
+    def classify_name(self, file_name):
+        """Decide on the name alone; returns (decision, reason) or None if the content must be looked at"""
+        if self.skip_generated and file_name in LOCKFILE_NAMES:
+            return SKIP, "lock file"
+        if self.skip_minified and file_name.endswith(MINIFIED_SUFFIXES):
+            return SKIP, "minified file"
+        return None
+
+    def classify(self, file_name, size, head):
+        """Return (decision, reason) for a file of ``size`` bytes whose first block is ``head``"""
+        by_name = self.classify_name(file_name)
+        if by_name is not None:
+            return by_name
+
+        if self.skip_binary and b'\0' in head and not is_text_encoding(head):
+            return SKIP, "binary content"
+
+        if self.skip_generated:
+            top = head[:GENERATED_HEADER_BYTES]
+            for marker in GENERATED_MARKERS:
+                if marker in top:
+                    return SKIP, "generated file"
+
+        if self.skip_minified:
+            lines = head.split(b'\n')
+            if size > len(head):
+                # The last line may continue past the sniffed block
+                lines = lines[:-1] or lines
+            if max(len(line) for line in lines) > MINIFIED_LINE_LENGTH:
+                return SKIP, "minified content"
+
+        if self.max_file_bytes and size > self.max_file_bytes:
+            return self.oversize_action, f"larger than {self.max_file_bytes} bytes"
+
+        return INCLUDE, None
+
+    def skip_note(self, reason, size):
+        return f"[Skipped: {reason}, {size} bytes]\n".encode('utf-8')
+
+    def truncate_note(self, size):
+        return f"[Truncated: showing the first {self.max_file_bytes} bytes of {size} bytes]\n".encode('utf-8')
@@ -0,0 +1,282 @@
+import os
+import re
+
+# Per-directory ignore files, lowest precedence first
+IGNORE_FILE_NAMES = ('.gitignore', '.ignore')
+_IGNORE_FILE_SET = frozenset(IGNORE_FILE_NAMES)
+
+
+def translate_glob(pattern):
+    """Translate a gitignore-style glob into a regular expression string.
+
+    ``*`` and ``?`` never cross a '/', ``**`` does, and ``[...]`` classes
+    are kept (with ``!`` negation).
+    """
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                i += 2
+                if i < n and pattern[i] == '/':
+                    # '**/' matches zero or more leading directories
+                    out.append('(?:.*/)?')
+                    i += 1
+                else:
+                    out.append('.*')
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append('\\[')
+            else:
+                body = pattern[i + 1:end].replace('\\', '\\\\')
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f"[{body}]")
+                i = end + 1
+                continue
+        elif c == '\\' and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+class IgnoreRule:
+    """One compiled line of a .gitignore file"""
+
+    __slots__ = ('regex', 'negate', 'dir_only', 'anchored')
+
+    def __init__(self, regex, negate, dir_only, anchored):
+        self.regex = regex
+        self.negate = negate
+        self.dir_only = dir_only
+        self.anchored = anchored
+
+    @classmethod
+    def parse(cls, line):
+        """Compile one ignore file line, or return None for blanks and comments"""
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('#'):
+            return None
+
+        # Trailing spaces are dropped unless the last one is escaped
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        line = stripped
+
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            return None
+
+        # A slash anywhere but the end ties the pattern to the ignore file's directory
+        anchored = '/' in line
+        line = line.lstrip('/')
+        return cls(re.compile(translate_glob(line), re.S), negate, dir_only, anchored)
+
+
+def parse_ignore_lines(lines):
+    rules = []
+    for line in lines:
+        rule = IgnoreRule.parse(line)
+        if rule is not None:
+            rules.append(rule)
+    return tuple(rules)
+
+
+def read_ignore_file(path):
+    """Return the compiled rules of one ignore file, or an empty tuple if it cannot be read"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return parse_ignore_lines(f)
+    except OSError:
+        return tuple()
+
+
+class IgnoreStack:
+    """The ignore rules in effect for one directory: its own plus all of its parents'.
+
+    Each layer is (rules, strip, prefix): a path relative to the source root
+    becomes relative to the layer's directory by dropping ``strip``
+    characters and prepending ``prefix``. Deeper layers and later rules win,
+    as in git.
+    """
+
+    __slots__ = ('layers',)
+
+    def __init__(self, layers=()):
+        self.layers = layers
+
+    def push(self, rules, relative_dir):
+        """Return a stack with ``rules`` from the ignore file in ``relative_dir`` added on top"""
+        if not rules:
+            return self
+        strip = len(relative_dir) + 1 if relative_dir else 0
+        return IgnoreStack(self.layers + ((rules, strip, ""),))
+
+    def ignored(self, relative_path, name, is_dir):
+        """Whether ``relative_path`` ('/'-separated, relative to the source root) is ignored"""
+        for rules, strip, prefix in reversed(self.layers):
+            layer_path = None
+            for rule in reversed(rules):
+                if rule.dir_only and not is_dir:
+                    continue
+                if rule.anchored:
+                    if layer_path is None:
+                        layer_path = prefix + relative_path[strip:]
+                    matched = rule.regex.fullmatch(layer_path)
+                else:
+                    matched = rule.regex.fullmatch(name)
+                if matched:
+                    return not rule.negate
+        return False
+
+
+def find_repository_root(path):
+    """Return the closest directory at or above ``path`` that contains a .git entry, or None"""
+    current = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(current, '.git')):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+class FileFilter:
+    """Include/exclude decisions for a scan, compiled once up front.
+
+    A file is exported when its name ends with one of ``extensions`` (or
+    matches one of ``include_patterns``), does not end with a test suffix,
+    and is not ignored by ``exclude_patterns`` or, with ``use_ignore_files``,
+    by the .gitignore/.ignore files found on the way down. Directories are
+    pruned by name via ``excluded_dirs`` and by the same ignore rules.
+    """
+
+    def __init__(self, extensions, test_exclusions=(), excluded_dirs=(), include_patterns=(),
+                 exclude_patterns=(), use_ignore_files=True):
+        # str.endswith with a tuple runs entirely in C, no per-suffix Python loop
+        self.extensions = tuple(extensions)
+        self.test_exclusions = tuple(test_exclusions)
+        self.excluded_dirs = frozenset(excluded_dirs)
+        self.include_regex = None
+        if include_patterns:
+            self.include_regex = re.compile('|'.join(f"(?:{translate_glob(p)})" for p in include_patterns), re.S)
+        self.exclude_rules = parse_ignore_lines(exclude_patterns)
+        self.use_ignore_files = use_ignore_files
+
+    def matches_name(self, file_name):
+        """Whether a file name alone selects the file, before any ignore rules"""
+        if self.test_exclusions and file_name.endswith(self.test_exclusions):
+            return False
+        if file_name.endswith(self.extensions):
+            return True
+        return self.include_regex is not None and self.include_regex.fullmatch(file_name) is not None
+
+    def root_stack(self, source_path):
+        """Return the ignore rules that apply at the top of ``source_path``.
+
+        Besides the configured exclude patterns, this picks up ignore files
+        in the parent directories up to the enclosing repository root, so
+        scanning a sub-folder of a repository honours the repository's
+        .gitignore.
+        """
+        stack = IgnoreStack().push(self.exclude_rules, "")
+        if not self.use_ignore_files:
+            return stack
+
+        source_dir = os.path.abspath(source_path)
+        repository_root = find_repository_root(os.path.dirname(source_dir))
+        if repository_root is None:
+            return stack
+
+        ancestors = []
+        current = os.path.dirname(source_dir)
+        while True:
+            ancestors.append(current)
+            if current == repository_root:
+                break
+            current = os.path.dirname(current)
+
+        layers = list(stack.layers)
+        for ancestor in reversed(ancestors):
+            prefix = os.path.relpath(source_dir, ancestor).replace(os.sep, '/') + '/'
+            for ignore_name in IGNORE_FILE_NAMES:
+                rules = read_ignore_file(os.path.join(ancestor, ignore_name))
+                if rules:
+                    layers.append((rules, 0, prefix))
+        return IgnoreStack(tuple(layers))
+
+    def directory_stack(self, parent_stack, dir_path, relative_dir, names):
+        """Return the rules in effect inside ``dir_path``, given the entry ``names`` listed there.
+
+        ``relative_dir`` is the directory's '/'-separated path below the source root.
+        """
+        if not self.use_ignore_files:
+            return parent_stack
+        present = _IGNORE_FILE_SET.intersection(names)
+        if not present:
+            return parent_stack
+        stack = parent_stack
+        for ignore_name in IGNORE_FILE_NAMES:
+            if ignore_name in present:
+                stack = stack.push(read_ignore_file(os.path.join(dir_path, ignore_name)), relative_dir)
+        return stack
+
+    def single_file_selected(self, file_name):
+        """Decide on a source that is a single file, where only the exclude patterns apply"""
+        if not self.matches_name(file_name):
+            return False
+        return not IgnoreStack().push(self.exclude_rules, "").ignored(file_name, file_name, False)
+
+
+class PathSelector:
+    """Applies a FileFilter to single paths below one source, without walking it.
+
+    Gives the walk's answer for each path: excluded and ignored directories
+    on the way down hide the file, and the ignore files of each directory
+    on the way are read once and remembered.
+    """
+
+    def __init__(self, file_filter, source_path):
+        self.file_filter = file_filter
+        self.source_path = source_path
+        # '/'-separated directory -> its IgnoreStack, or None when the walk would not enter it
+        self.stacks = {"": file_filter.root_stack(source_path)}
+
+    def stack(self, relative_dir):
+        if relative_dir in self.stacks:
+            return self.stacks[relative_dir]
+        parent, _, name = relative_dir.rpartition('/')
+        parent_stack = self.stack(parent)
+        stack = None
+        if parent_stack is not None and name not in self.file_filter.excluded_dirs \
+                and not parent_stack.ignored(relative_dir, name, True):
+            dir_path = os.path.join(self.source_path, *relative_dir.split('/'))
+            names = [ignore_name for ignore_name in IGNORE_FILE_NAMES
+                     if os.path.isfile(os.path.join(dir_path, ignore_name))] if self.file_filter.use_ignore_files else ()
+            stack = self.file_filter.directory_stack(parent_stack, dir_path, relative_dir, names)
+        self.stacks[relative_dir] = stack
+        return stack
+
+    def selected(self, relative_path):
+        """Whether the walk would export ``relative_path`` ('/'-separated, relative to the source)"""
+        relative_dir, _, name = relative_path.rpartition('/')
+        if not self.file_filter.matches_name(name):
+            return False
+        stack = self.stack(relative_dir)
+        return stack is not None and not stack.ignored(relative_path, name, False)
@@ -0,0 +1,80 @@
+import os
+import subprocess
+from collections import Counter
+
+# What --changed compares the working tree with when no revision is given
+DEFAULT_REVISION = "HEAD"
+# Recent commits touching the changed files that are searched for files changed along with them
+DEFAULT_HISTORY_COMMITS = 200
+# Commits touching more files than this (mass renames, reformatting) say nothing about which files belong together
+MAX_COMMIT_FILES = 50
+# Changed files named to git log at once, to stay well below command line limits
+MAX_HISTORY_PATHS = 500
+
+_COMMIT_MARK = b"\x01"
+
+
+class GitError(Exception):
+    """Raised when git is missing or cannot answer for a directory"""
+
+
+def run_git(directory, *args):
+    """Run git in ``directory`` and return its standard output as bytes"""
+    try:
+        result = subprocess.run(('git', '-C', directory) + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise GitError("git was not found; install it or add it to PATH")
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise GitError(f"git failed in {directory}: {message[-1] if message else 'exit ' + str(result.returncode)}")
+    return result.stdout
+
+
+def _paths(output):
+    # -z output: NUL-terminated paths, never quoted
+    return [os.fsdecode(path) for path in output.split(b"\0") if path]
+
+
+def is_range(revision):
+    """Whether ``revision`` names two commits ('A..B' or 'A...B') rather than one to compare the working tree with"""
+    return '..' in revision
+
+
+def changed_paths(directory, revision=DEFAULT_REVISION, pathspecs=()):
+    """The files below ``directory`` that changed, as '/'-separated paths relative to it.
+
+    With a single ``revision`` this is everything that differs between it
+    and the working tree, staged or not, plus untracked files that are not
+    ignored. With a range ('main...HEAD') it is what changed between the two
+    commits. Deleted files are left out. Nothing is listed or read from disk
+    besides what git itself looks at.
+    """
+    # Outside a repository git diff would fall back to comparing two plain paths
+    run_git(directory, 'rev-parse', '--show-toplevel')
+    paths = _paths(run_git(directory, 'diff', '--name-only', '-z', '--relative', '--diff-filter=d',
+                           revision, '--', *pathspecs))
+    if not is_range(revision):
+        paths.extend(_paths(run_git(directory, 'ls-files', '-z', '--others', '--exclude-standard',
+                                    '--', *pathspecs)))
+    return sorted(set(paths))
+
+
+def co_changed(directory, paths, commits=DEFAULT_HISTORY_COMMITS):
+    """Count how often each other file below ``directory`` changed in the same commit as one of ``paths``.
+
+    Only the last ``commits`` commits touching ``paths`` are looked at.
+    Paths are '/'-separated and relative to ``directory``, as given.
+    """
+    counts = Counter()
+    if not paths:
+        return counts
+    wanted = set(paths)
+    output = run_git(directory, 'log', f'-n{commits}', '--no-merges', '--full-diff', '--relative', '--name-only',
+                     '-z', '--format=%x01', '--', *sorted(wanted)[:MAX_HISTORY_PATHS])
+    for commit in output.split(_COMMIT_MARK):
+        files = {path.lstrip("\n") for path in _paths(commit)}
+        files.discard("")
+        if len(files) > MAX_COMMIT_FILES or files.isdisjoint(wanted):
+            continue
+        counts.update(files - wanted)
+    return counts
@@ -0,0 +1,13 @@
+import json
+import os
+
+
+def save_json(path, data, **options):
+    """Write ``data`` to ``path`` as JSON through a temporary file, so readers never see half of it.
+
+    ``options`` go to json.dumps.
+    """
+    with open(path + ".partial", 'w', encoding='utf-8') as f:
+        # dumps runs the C encoder; dump to a file would encode in Python, piece by piece
+        f.write(json.dumps(data, **options))
+    os.replace(path + ".partial", path)
@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+
+WALK, READ, WRITE = 'walk', 'read', 'write'
+STAGES = (WALK, READ, WRITE)
+
+# Share of a run a stage may spend waiting on its input before the stage feeding it counts as the limit
+STARVED_SHARE = 0.5
+
+
+class StageStats:
+    """Throughput and backlog of one pipeline stage.
+
+    ``busy`` is time spent working (summed over the stage's threads),
+    ``waiting`` is time the stage sat idle for want of input, and the depth
+    samples describe the queue in front of the next stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.max_depth = 0
+        self.capacity = None
+        self.lock = threading.Lock()
+
+    def add(self, items=1, nbytes=0, busy=0.0):
+        with self.lock:
+            self.items += items
+            self.bytes += nbytes
+            self.busy += busy
+
+    def wait(self, seconds):
+        with self.lock:
+            self.waiting += seconds
+
+    def sample_depth(self, depth):
+        with self.lock:
+            self.depth_total += depth
+            self.depth_samples += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def merge(self, other):
+        """Add the numbers of the same stage run elsewhere, such as in another process"""
+        with self.lock:
+            self.items += other.items
+            self.bytes += other.bytes
+            self.busy += other.busy
+            self.waiting += other.waiting
+            self.depth_total += other.depth_total
+            self.depth_samples += other.depth_samples
+            self.max_depth = max(self.max_depth, other.max_depth)
+            self.capacity = self.capacity or other.capacity
+
+    def __getstate__(self):
+        # Stats come back from worker processes pickled, and locks cannot be
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @property
+    def mean_depth(self):
+        return self.depth_total / self.depth_samples if self.depth_samples else 0.0
+
+    def describe(self, elapsed):
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        mib_rate = self.bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+        capacity = f"/{self.capacity}" if self.capacity else ""
+        return (f"{self.name:<5} {self.items:>8} files {rate:>10.1f} files/s {mib_rate:>8.1f} MiB/s  "
+                f"busy {self.busy:7.2f}s  waiting {self.waiting:7.2f}s  "
+                f"queue out {self.mean_depth:.1f} avg, {self.max_depth}{capacity} max")
+
+
+class PipelineStats:
+    """Per-stage statistics of one export: walk -> read (classify and load) -> ordered write"""
+
+    def __init__(self):
+        self.stages = {name: StageStats(name) for name in STAGES}
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def __getitem__(self, name):
+        return self.stages[name]
+
+    def merge(self, other):
+        for name in STAGES:
+            self.stages[name].merge(other.stages[name])
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def limiting_stage(self):
+        """The stage that most likely set the pace: the first one whose consumer was not starved"""
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        # The writer waits on reads, and reads wait on the walk
+        if self.stages[WRITE].waiting < STARVED_SHARE * elapsed:
+            return WRITE
+        if self.stages[READ].waiting < STARVED_SHARE * elapsed:
+            return READ
+        return WALK
+
+    def report(self):
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        lines = [f"Pipeline ({elapsed:.2f}s):"]
+        lines += ["  " + self.stages[name].describe(elapsed) for name in STAGES]
+        lines.append(f"  Limited by: {self.limiting_stage}")
+        return lines
+
+
+def staged(items, maxsize, stats, consumer_stats=None):
+    """Produce ``items`` on a thread of its own into a queue of ``maxsize``, yielding them to the caller.
+
+    The producer blocks once the queue is full, so it never runs more than
+    ``maxsize`` items ahead. Its working time is added to ``stats`` and the
+    time the caller spends waiting for items to ``consumer_stats``.
+    Exceptions are re-raised in the caller. Closing the generator early
+    stops the producer.
+    """
+    done = object()
+    results = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    stats.capacity = maxsize
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            iterator = iter(items)
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                stats.add(busy=time.perf_counter() - started)
+                if not put((None, item)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((e, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            stats.sample_depth(results.qsize())
+            started = time.perf_counter()
+            error, item = results.get()
+            if consumer_stats is not None:
+                consumer_stats.wait(time.perf_counter() - started)
+            if error is done:
+                return
+            if error is not None:
+                raise error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,175 @@
+import cProfile
+import heapq
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+from jsonFiles import save_json
+
+# Files (or parts) listed as the slowest of a run
+DEFAULT_SLOWEST_FILES = 10
+REPORT_VERSION = 1
+# Suffix of the run report written next to an export
+REPORT_SUFFIX = ".profile.json"
+
+
+class RunProfile:
+    """Phase timers, counters and the slowest files of one export or split.
+
+    A profile only exists when a run is profiled: the engine checks for
+    None before each hook, so an ordinary run does no extra work. Hooks may
+    be called from any thread. ``trace`` additionally runs cProfile on
+    every thread started while it is active.
+    """
+
+    def __init__(self, kind, slowest=DEFAULT_SLOWEST_FILES):
+        self.kind = kind
+        self.slowest = slowest
+        # Seconds per phase, in the order the phases first ran
+        self.phases = {}
+        self.counters = {}
+        # Min-heap of (seconds, path, bytes) holding the slowest files seen
+        self.files = []
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def file_time(self, path, seconds, nbytes=0):
+        """Note that ``path`` took ``seconds``; only the slowest ones are kept"""
+        entry = (seconds, path, nbytes)
+        with self.lock:
+            if len(self.files) < self.slowest:
+                heapq.heappush(self.files, entry)
+            elif entry > self.files[0]:
+                heapq.heapreplace(self.files, entry)
+
+    def timed(self, progress, name='progress'):
+        """Wrap the ``progress`` callback so the time spent in it (UI updates) is a phase of its own"""
+        if progress is None:
+            return None
+
+        def callback(event, value):
+            started = time.perf_counter()
+            try:
+                progress(event, value)
+            finally:
+                self.add_time(name, time.perf_counter() - started)
+        return callback
+
+    def merge(self, other):
+        """Add the numbers of the same run made elsewhere, such as in another process"""
+        for name, seconds in other.phases.items():
+            self.add_time(name, seconds)
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        for seconds, path, nbytes in other.files:
+            self.file_time(path, seconds, nbytes)
+
+    def __getstate__(self):
+        # Profiles come back from worker processes pickled, and locks cannot be
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def slowest_files(self):
+        return sorted(self.files, reverse=True)
+
+    @contextmanager
+    def trace(self, path):
+        """cProfile the calling thread and every thread started inside the block; dump the merged stats to ``path``.
+
+        The stats file opens with ``python -m pstats`` or snakeviz.
+        """
+        profilers = []
+
+        def start_thread(frame, event, arg):
+            # Runs on a new thread's first call and hands the thread over to a profiler of its own
+            profiler = cProfile.Profile()
+            profilers.append(profiler)
+            profiler.enable()
+
+        main = cProfile.Profile()
+        threading.setprofile(start_thread)
+        main.enable()
+        try:
+            yield
+        finally:
+            main.disable()
+            threading.setprofile(None)
+            stats = pstats.Stats(main)
+            for profiler in profilers:
+                stats.add(profiler)
+            stats.dump_stats(path)
+
+    def report(self, pipeline=None, **extra):
+        """The run as a JSON-serialisable dict; ``pipeline`` (a PipelineStats) adds the per-stage numbers"""
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        report = {
+            'version': REPORT_VERSION,
+            'kind': self.kind,
+            'elapsed_seconds': round(elapsed, 6),
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+        if pipeline is not None:
+            report['stages'] = {
+                name: {
+                    'items': stage.items,
+                    'bytes': stage.bytes,
+                    'busy_seconds': round(stage.busy, 6),
+                    'waiting_seconds': round(stage.waiting, 6),
+                    'mean_queue_depth': round(stage.mean_depth, 2),
+                    'max_queue_depth': stage.max_depth,
+                }
+                for name, stage in pipeline.stages.items()
+            }
+            report['limited_by'] = pipeline.limiting_stage
+        report['slowest_files'] = [{'path': path, 'seconds': round(seconds, 6), 'bytes': nbytes}
+                                   for seconds, path, nbytes in self.slowest_files()]
+        report.update(extra)
+        return report
+
+    def lines(self):
+        """The run as text for a log or terminal"""
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        lines = [f"Profile of {self.kind} ({elapsed:.2f}s):"]
+        for name, seconds in self.phases.items():
+            share = 100.0 * seconds / elapsed if elapsed > 0 else 0.0
+            lines.append(f"  {name:<12} {seconds:9.3f}s  {share:5.1f}%")
+        if self.counters:
+            lines.append("  " + ", ".join(f"{name.replace('_', ' ')}: {amount}"
+                                          for name, amount in self.counters.items()))
+        slowest = self.slowest_files()
+        if slowest:
+            lines.append(f"Slowest {len(slowest)}:")
+            for seconds, path, nbytes in slowest:
+                lines.append(f"  {seconds * 1000:9.1f} ms  {nbytes:>10} bytes  {path}")
+        return lines
+
+    def save(self, path, pipeline=None, **extra):
+        """Write report() to ``path`` through a temporary file"""
+        save_json(path, self.report(pipeline, **extra), indent=2)
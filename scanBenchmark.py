@@ -0,0 +1,412 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from scanEngine import (COPY_CHUNK_SIZE, DEFAULT_READ_WORKERS, DEFAULT_WALK_WORKERS, EXCLUDED_DIRS, ScanConfig, export,
+                        scan, split, walk_source)
+from splitStrategies import BALANCE_MODES, BY_BYTES
+from textEncoding import read_utf8
+from tokenEstimate import EstimateTokenizer
+
+BENCH_EXTENSIONS = ('.js', '.ts', '.tsx', '.py')
+# Headless cases of the suite; 'reexport' is an incremental export of an unchanged tree
+CASES = ('scan', 'export', 'reexport', 'split')
+# Largest file the generator writes, whatever the size distribution says
+MAX_GENERATED_BYTES = 4 * 1024 * 1024
+# A case this much slower than the baseline is flagged by --compare
+REGRESSION_SHARE = 0.10
+
+
+def generate_tree(root, num_files=5000, fanout=6, depth=4, seed=0, median_bytes=2048, size_sigma=1.0,
+                  binary_ratio=0.0, noise_dirs=('node_modules', 'dist', '.git'), noise_files=50, unicode_ratio=0.0):
+    """Create a synthetic source tree with code files spread over nested folders.
+
+    File sizes are log-normal around ``median_bytes`` (``size_sigma`` sets
+    the spread), ``binary_ratio`` of the files hold binary data under a
+    code extension, ``unicode_ratio`` of the text files have non-ASCII
+    UTF-8 comments, and every one of ``noise_dirs`` gets ``noise_files``
+    files the scanner must prune. Returns the bytes written outside the
+    noise directories.
+    """
+    rng = random.Random(seed)
+    extensions = ['.js', '.ts', '.tsx', '.py', '.css', '.test.ts', '.md']
+
+    dirs = [root]
+    for level in range(depth):
+        for parent in list(dirs):
+            for i in range(fanout if level < depth - 1 else 2):
+                dirs.append(os.path.join(parent, f"dir{level}_{i}"))
+    for directory in dirs:
+        os.makedirs(directory, exist_ok=True)
+
+    # Noise directories the scanner must prune
+    for noise in noise_dirs:
+        noise_dir = os.path.join(root, noise, 'pkg')
+        os.makedirs(noise_dir, exist_ok=True)
+        for i in range(noise_files):
+            with open(os.path.join(noise_dir, f"noise{i}.js"), 'w') as f:
+                f.write("module.exports = {};\n")
+
+    total_bytes = 0
+    for i in range(num_files):
+        path = os.path.join(rng.choice(dirs), f"file{i}{rng.choice(extensions)}")
+        size = max(1, min(int(rng.lognormvariate(math.log(median_bytes), size_sigma)), MAX_GENERATED_BYTES))
+        if rng.random() < binary_ratio:
+            data = b"\x00" + rng.randbytes(size - 1)
+        else:
+            comment = "généré — ✓" if rng.random() < unicode_ratio else "generated"
+            line = f"export const value{i} = compute({i}, 'item');  // {comment}\n".encode('utf-8')
+            data = (line * (size // len(line) + 1))[:size - 1] + b"\n"
+        with open(path, 'wb') as f:
+            f.write(data)
+        total_bytes += size
+    return total_bytes
+
+
+def legacy_matches(file_name, file_extensions, test_exclusions):
+    """The original per-file predicate from process_source_path"""
+    return file_name.endswith(file_extensions) and not any(file_name.endswith(test_ext) for test_ext in test_exclusions)
+
+
+def legacy_should_skip_directory(dir_path):
+    """The original directory check, which rebuilt its set on every call"""
+    excluded_dirs = {'node_modules', 'dist', '.git'}
+    return os.path.basename(dir_path) in excluded_dirs
+
+
+def legacy_walk(config, source_path):
+    """The original single-threaded os.walk traversal, kept as the baseline"""
+    code_files = []
+    test_exclusions = config.test_exclusions
+    for folder_path, dirs, files in os.walk(source_path):
+        dirs[:] = [d for d in dirs if d not in config.excluded_dirs]
+        for file in files:
+            if file.endswith(config.extensions) and not any(file.endswith(test_ext) for test_ext in test_exclusions):
+                file_path = os.path.join(folder_path, file)
+                code_files.append((os.path.relpath(file_path, source_path), file_path))
+    return code_files
+
+
+def time_best(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_walk(sources, workers, repeat):
+    config = ScanConfig(sources, extensions=('.js', '.ts', '.tsx', '.py'), use_ignore_files=False)
+
+    def run_legacy():
+        return sorted((source_path, rel_path, full_path)
+                      for source_path in sources
+                      for rel_path, full_path in legacy_walk(config, source_path))
+
+    legacy_time, expected = time_best(run_legacy, repeat)
+    print(f"{'os.walk (legacy)':<24} {legacy_time * 1000:9.1f} ms  {len(expected)} files")
+
+    for worker_count in workers:
+        config.walk_workers = worker_count
+
+        def run_scandir():
+            return sorted((source_path, rel_path, full_path)
+                          for source_path in sources
+                          for rel_path, full_path in walk_source(config, source_path))
+
+        elapsed, result = time_best(run_scandir, repeat)
+        status = "ok" if result == expected else "MISMATCH"
+        print(f"{f'scandir x{worker_count}':<24} {elapsed * 1000:9.1f} ms  "
+              f"{legacy_time / elapsed:5.2f}x  {status}")
+
+
+def bench_filter(sources, repeat):
+    """Time the per-file and per-directory predicates alone on every name found in ``sources``"""
+    file_names = []
+    dir_paths = []
+    for source_path in sources:
+        for folder_path, dirs, files in os.walk(source_path):
+            file_names.extend(files)
+            dir_paths.extend(os.path.join(folder_path, d) for d in dirs)
+
+    config = ScanConfig(sources, extensions=('.js', '.ts', '.tsx', '.py'), use_ignore_files=False)
+    file_extensions = config.extensions
+    test_exclusions = config.test_exclusions
+    file_filter = config.file_filter
+
+    def run_legacy_files():
+        return [name for name in file_names if legacy_matches(name, file_extensions, test_exclusions)]
+
+    def run_compiled_files():
+        matches_name = file_filter.matches_name
+        return [name for name in file_names if matches_name(name)]
+
+    def run_legacy_dirs():
+        return [path for path in dir_paths if not legacy_should_skip_directory(path)]
+
+    def run_compiled_dirs():
+        excluded_dirs = EXCLUDED_DIRS
+        return [path for path in dir_paths if os.path.basename(path) not in excluded_dirs]
+
+    legacy_time, expected = time_best(run_legacy_files, repeat)
+    compiled_time, result = time_best(run_compiled_files, repeat)
+    status = "ok" if result == expected else "MISMATCH"
+    print(f"file predicate, {len(file_names)} names")
+    print(f"  {'endswith + any (legacy)':<26} {legacy_time * 1000:9.2f} ms")
+    print(f"  {'FileFilter.matches_name':<26} {compiled_time * 1000:9.2f} ms  "
+          f"{legacy_time / compiled_time:5.2f}x  {status}")
+
+    legacy_time, _ = time_best(run_legacy_dirs, repeat)
+    compiled_time, _ = time_best(run_compiled_dirs, repeat)
+    print(f"directory check, {len(dir_paths)} directories")
+    print(f"  {'set rebuilt per call':<26} {legacy_time * 1000:9.2f} ms")
+    print(f"  {'prebuilt frozenset':<26} {compiled_time * 1000:9.2f} ms  {legacy_time / compiled_time:5.2f}x")
+
+
+def legacy_read_text(full_path):
+    """The original body read: decode as UTF-8 text, then encode again for the output"""
+    with open(full_path, 'r', encoding='utf-8') as code_file:
+        return code_file.read().encode('utf-8')
+
+
+def bench_read(sources, repeat):
+    """Time reading every matching file as the original text path did against the byte passthrough"""
+    config = ScanConfig(sources, extensions=BENCH_EXTENSIONS, use_ignore_files=False)
+    paths = [full_path for _, _, full_path in scan(config)]
+    # The text path cannot read files that are not UTF-8, so both paths are compared on the ones it can
+    readable = []
+    for full_path in paths:
+        try:
+            legacy_read_text(full_path)
+            readable.append(full_path)
+        except (UnicodeDecodeError, OSError):
+            pass
+    total_bytes = sum(os.path.getsize(full_path) for full_path in readable)
+
+    def run_legacy():
+        return [legacy_read_text(full_path) for full_path in readable]
+
+    def run_bytes():
+        contents = []
+        for full_path in readable:
+            with open(full_path, 'rb') as raw_file:
+                contents.append(read_utf8(raw_file, COPY_CHUNK_SIZE))
+        return contents
+
+    legacy_time, expected = time_best(run_legacy, repeat)
+    bytes_time, result = time_best(run_bytes, repeat)
+    status = "ok" if result == expected else "MISMATCH"
+    mib = total_bytes / (1024 * 1024)
+    print(f"file bodies, {len(readable)} UTF-8 files of {len(paths)}, {mib:.1f} MiB")
+    print(f"  {'decode + encode (legacy)':<26} {legacy_time * 1000:9.1f} ms  {mib / legacy_time:8.1f} MiB/s")
+    print(f"  {'byte passthrough':<26} {bytes_time * 1000:9.1f} ms  {mib / bytes_time:8.1f} MiB/s  "
+          f"{legacy_time / bytes_time:5.2f}x  {status}")
+
+
+def peak_rss():
+    """Peak resident set size of this process or any of its finished children, in bytes; None where unknown"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_case(case, sources, work_dir, settings):
+    """Run one case of the suite and return (seconds, files, bytes written, peak RSS).
+
+    Called in a fresh process, so the peak RSS belongs to this case alone.
+    Anything a case needs first (the export to split or re-export) is
+    written before the clock starts.
+    """
+    tokenizer = EstimateTokenizer() if settings['tokens'] else None
+    config = ScanConfig(sources, extensions=BENCH_EXTENSIONS, read_workers=settings['read_workers'],
+                        processes=settings['processes'], tokenizer=tokenizer, incremental=case == 'reexport')
+    export_path = os.path.join(work_dir, f"{case}.txt")
+    if case in ('reexport', 'split'):
+        export(config, export_path)
+
+    started = time.perf_counter()
+    if case == 'scan':
+        files = len(scan(config))
+        written = None
+    elif case in ('export', 'reexport'):
+        files = export(config, export_path).total_files
+        written = os.path.getsize(export_path)
+    else:
+        parts_dir = os.path.join(work_dir, 'parts')
+        os.makedirs(parts_dir, exist_ok=True)
+        parts = split(export_path, parts_dir, settings['pieces'], balance=settings['balance'])
+        files = sum(end - start for part in parts for start, end in part[1])
+        written = sum(part[2] for part in parts)
+    seconds = time.perf_counter() - started
+    return seconds, files, written, peak_rss()
+
+
+def bench_suite(sources, cases, settings, repeat):
+    """Run ``cases`` headlessly, each ``repeat`` times in a fresh process; returns one result dict per case"""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for case in cases:
+        best = None
+        peak = None
+        for _ in range(repeat):
+            work_dir = tempfile.mkdtemp(prefix=f"scan-bench-{case}-")
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    seconds, files, written, rss = pool.submit(run_case, case, sources, work_dir, settings).result()
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            if best is None or seconds < best[0]:
+                best = (seconds, files, written)
+            if rss is not None:
+                peak = max(peak or 0, rss)
+
+        seconds, files, written = best
+        result = {
+            'case': case,
+            'wall_seconds': round(seconds, 4),
+            'files': files,
+            'files_per_second': round(files / seconds, 1) if seconds else None,
+            'bytes_written': written,
+            'mb_per_second': round(written / (1024 * 1024) / seconds, 2) if written is not None and seconds else None,
+            'peak_rss_mb': round(peak / (1024 * 1024), 1) if peak is not None else None,
+        }
+        results.append(result)
+        mb_rate = f"{result['mb_per_second']:8.2f} MB/s" if result['mb_per_second'] is not None else " " * 13
+        rss = f"{result['peak_rss_mb']:7.1f} MB peak" if result['peak_rss_mb'] is not None else ""
+        print(f"{case:<10} {seconds * 1000:9.1f} ms  {result['files_per_second']:10.1f} files/s  {mb_rate}  {rss}")
+    return results
+
+
+def git_commit():
+    """The commit the benchmarked code is at, or None outside a git checkout"""
+    try:
+        completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+
+def compare_results(baseline, results):
+    """Print each case's wall time against ``baseline`` (a results file); returns the regressed cases"""
+    previous = {result['case']: result for result in baseline['results']}
+    regressed = []
+    print(f"against {baseline.get('commit') or 'baseline'}:")
+    for result in results:
+        old = previous.get(result['case'])
+        if old is None or not old['wall_seconds']:
+            continue
+        change = result['wall_seconds'] / old['wall_seconds'] - 1
+        flag = ""
+        if change > REGRESSION_SHARE:
+            flag = "  SLOWER"
+            regressed.append(result['case'])
+        print(f"  {result['case']:<10} {old['wall_seconds'] * 1000:9.1f} ms -> "
+              f"{result['wall_seconds'] * 1000:9.1f} ms  {change * 100:+6.1f}%{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scanner, exporter and splitter.")
+    parser.add_argument('benchmark', choices=['walk', 'filter', 'read', 'suite'] + list(CASES),
+                        help="what to measure; 'suite' runs every headless case")
+    parser.add_argument('sources', nargs='*', help="existing trees to benchmark (default: a generated tree)")
+    parser.add_argument('--files', type=int, default=5000, help="files in the generated tree")
+    parser.add_argument('--depth', type=int, default=4, help="folder depth of the generated tree")
+    parser.add_argument('--fanout', type=int, default=6, help="subfolders per folder in the generated tree")
+    parser.add_argument('--median-bytes', type=int, default=2048, help="median generated file size")
+    parser.add_argument('--size-sigma', type=float, default=1.0,
+                        help="spread of the log-normal file sizes, 0 for equal sizes (default: %(default)s)")
+    parser.add_argument('--binary-ratio', type=float, default=0.0, help="share of generated files that are binary")
+    parser.add_argument('--unicode-ratio', type=float, default=0.0,
+                        help="share of generated text files with non-ASCII comments")
+    parser.add_argument('--noise-files', type=int, default=50,
+                        help="files in each noise directory (node_modules, dist, .git)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the generated tree")
+    parser.add_argument('--keep', action='store_true', help="keep the generated tree and print where it is")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per variant, best time is reported")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, DEFAULT_WALK_WORKERS],
+                        help="thread counts to try for the scandir walker")
+    parser.add_argument('--read-workers', type=int, default=DEFAULT_READ_WORKERS, help="export read-ahead threads")
+    parser.add_argument('--processes', type=int, default=1, help="export processes")
+    parser.add_argument('--tokens', action='store_true', help="count tokens while exporting")
+    parser.add_argument('--pieces', type=int, default=4, help="parts the split case writes")
+    parser.add_argument('--balance', choices=BALANCE_MODES, default=BY_BYTES, help="balance of the split case")
+    parser.add_argument('--json', metavar='PATH', help="write the suite's results to PATH")
+    parser.add_argument('--compare', metavar='PATH', help="compare against results written earlier with --json")
+    args = parser.parse_args(argv)
+
+    temp_dir = None
+    sources = args.sources
+    tree = {'sources': sources}
+    if not sources:
+        temp_dir = tempfile.mkdtemp(prefix="scan-bench-")
+        sources = [os.path.join(temp_dir, 'src_a'), os.path.join(temp_dir, 'src_b')]
+        settings = dict(num_files=args.files // 2, fanout=args.fanout, depth=args.depth,
+                        median_bytes=args.median_bytes, size_sigma=args.size_sigma,
+                        binary_ratio=args.binary_ratio, noise_files=args.noise_files,
+                        unicode_ratio=args.unicode_ratio)
+        total_bytes = sum(generate_tree(source_path, seed=args.seed + offset, **settings)
+                          for offset, source_path in enumerate(sources))
+        tree = dict(settings, num_files=args.files, seed=args.seed, bytes=total_bytes)
+        if args.keep:
+            print(f"generated tree: {temp_dir}", file=sys.stderr)
+
+    regressed = []
+    try:
+        if args.benchmark == 'walk':
+            bench_walk(sources, args.workers, args.repeat)
+        elif args.benchmark == 'filter':
+            bench_filter(sources, args.repeat)
+        elif args.benchmark == 'read':
+            bench_read(sources, args.repeat)
+        else:
+            cases = CASES if args.benchmark == 'suite' else (args.benchmark,)
+            settings = {'read_workers': args.read_workers, 'processes': args.processes, 'tokens': args.tokens,
+                        'pieces': args.pieces, 'balance': args.balance}
+            results = bench_suite(sources, cases, settings, args.repeat)
+            report = {
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'tree': tree,
+                'settings': settings,
+                'repeat': args.repeat,
+                'results': results,
+            }
+            if args.json:
+                with open(args.json, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2)
+            if args.compare:
+                with open(args.compare, 'r', encoding='utf-8') as f:
+                    regressed = compare_results(json.load(f), results)
+    finally:
+        if temp_dir and not args.keep:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
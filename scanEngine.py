@@ -0,0 +1,2051 @@
+import argparse
+import functools
+import hashlib
+import heapq
+import io
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import ExitStack, nullcontext
+from datetime import datetime
+
+from dependencyGraph import GRAPH_SUFFIX, DependencyGraph
+from exportChunks import DEFAULT_CHUNK_BYTES, ChunkWriter, chunk_settings, chunks_path
+from exportIndex import ExportIndex, read_content
+from exportManifest import ExportManifest
+from fileClassifier import DEFAULT_MAX_FILE_BYTES, DUPLICATE, INCLUDE, SKIP, SNIFF_BYTES, TRUNCATE, ContentPolicy
+from compressedExport import (COMPRESSION_SUFFIXES, COMPRESSIONS, FrameWriter, FramedView, compression_available,
+                              detect_compression, get_codec, inflate, strip_compression_suffix)
+from fileFilters import FileFilter, PathSelector
+from gitChanges import DEFAULT_REVISION, GitError, changed_paths, co_changed
+from pipelineStages import READ, WALK, WRITE, PipelineStats, staged
+from runProfile import RunProfile
+from textEncoding import SAMPLE_BYTES, candidate_encodings, iter_utf8, read_utf8
+from splitStrategies import (BALANCE_MODES, BY_BYTES, BY_COUNT, BY_TOKENS, ORDERED, PACKING_MODES,
+                             partition_by_count, plan_parts)
+from tokenEstimate import EstimateTokenizer, estimate_tokens, get_tokenizer
+
+# File type groups offered by the scanner, keyed by the short name used on the CLI
+EXTENSION_GROUPS = {
+    'js': ('.js',),
+    'jsx': ('.jsx',),
+    'ts': ('.ts',),
+    'tsx': ('.tsx',),
+    'json': ('.json',),
+    'py': ('.py',),
+    'html': ('.html', '.htm'),
+    'css': ('.css',),
+}
+DEFAULT_GROUPS = ('js', 'ts')
+
+# Directories that are never descended into: dependencies, build output, VCS and tool caches
+EXCLUDED_DIRS = frozenset({
+    'node_modules', 'dist', 'build', 'target', 'coverage', '.next', '.nuxt',
+    '.git', '.hg', '.svn',
+    '.venv', 'venv', '__pycache__', '.tox', '.mypy_cache', '.pytest_cache',
+})
+
+# Test file patterns to exclude
+TEST_EXCLUSIONS = ('.spec.js', '.test.js', '.spec.ts', '.test.ts',
+                   '.spec.jsx', '.test.jsx', '.spec.tsx', '.test.tsx')
+
+DEFAULT_OUTPUT_NAME = "codebase_export.txt"
+
+# What every file section in an export starts with; the splitter cuts here
+SECTION_MARKER = b"\nFile: "
+
+# Directory listing is dominated by stat latency, so use more threads than cores
+DEFAULT_WALK_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Bytes (or characters, when transcoding) read at a time when copying a file body into the export
+COPY_CHUNK_SIZE = 1024 * 1024
+# Bumped whenever the way a file's bytes become its exported body changes, so older manifests are not reused
+BODY_FORMAT = 3
+# Room reserved in the header for the file count, which is written last
+COUNT_FIELD_WIDTH = 10
+
+# Files read ahead of the writer, and the most file data they may hold in memory
+DEFAULT_READ_WORKERS = 8
+DEFAULT_READ_AHEAD_BYTES = 64 * 1024 * 1024
+# Room reserved for the "Part i of n / Contains files a to b of N" lines of a part
+# written during the export, whose numbers are only known at the end
+PART_LABEL_WIDTH = len("Part  of \nContains files  to  of ") + 5 * COUNT_FIELD_WIDTH
+# Files the walk may run ahead of the readers
+WALK_QUEUE_FILES = 4096
+# Largest slice of an export copied into a part in one write
+PART_SLICE_BYTES = 16 * 1024 * 1024
+# Files listed in the heaviest files report
+DEFAULT_TOP_FILES = 10
+# Parts written at once by the splitter
+DEFAULT_WRITE_WORKERS = 4
+# Shards handed to each process of a multi-process export, so a slow shard does not hold up the rest
+SHARDS_PER_PROCESS = 4
+
+
+class ScanError(Exception):
+    """Raised when a scan or split cannot be started with the given settings"""
+
+
+class ScanConfig:
+    """Everything a scan needs to know, independent of any user interface"""
+
+    def __init__(self, sources, extensions=None, exclude_tests=True, excluded_dirs=EXCLUDED_DIRS,
+                 walk_workers=DEFAULT_WALK_WORKERS, read_workers=DEFAULT_READ_WORKERS,
+                 read_ahead_bytes=DEFAULT_READ_AHEAD_BYTES, incremental=False, include_patterns=(),
+                 exclude_patterns=(), use_ignore_files=True, content_policy=None, write_index=False,
+                 part_limit=None, part_unit=BY_BYTES, tokenizer=None, compression=None, compression_level=None,
+                 dedupe=False, processes=1, watch=False, entry_points=(), graph_cache=None, changed_revision=None,
+                 related_files=0, chunk_bytes=None):
+        self.sources = list(sources)
+        if extensions is None:
+            extensions = extensions_for_groups(DEFAULT_GROUPS)
+        self.extensions = tuple(extensions)
+        self.exclude_tests = exclude_tests
+        self.excluded_dirs = frozenset(excluded_dirs)
+        self.walk_workers = max(1, walk_workers)
+        self.read_workers = max(0, read_workers)
+        self.read_ahead_bytes = read_ahead_bytes
+        self.incremental = incremental
+        self.include_patterns = tuple(include_patterns)
+        self.exclude_patterns = tuple(exclude_patterns)
+        self.use_ignore_files = use_ignore_files
+        self.content_policy = content_policy if content_policy is not None else ContentPolicy()
+        self.write_index = write_index
+        # With a limit the export is written straight into parts of at most this many part_unit
+        self.part_limit = part_limit
+        self.part_unit = part_unit
+        # Counts tokens while bodies are read or copied; parts limited in tokens always need one, but only
+        # a tokenizer that was asked for puts its counts into the export
+        self.count_tokens = tokenizer is not None
+        if tokenizer is None and part_limit is not None and part_unit == BY_TOKENS:
+            tokenizer = EstimateTokenizer()
+        self.tokenizer = tokenizer
+        # 'gzip' or 'zstd' to write the export compressed, in frames that start on a section
+        self.compression = compression
+        self.compression_level = compression_level
+        # Write byte-identical bodies once and refer back to the first copy
+        self.dedupe = dedupe
+        # With more than one, files are read and written in contiguous shards on a process pool
+        self.processes = max(1, processes)
+        # Kept up to date by an ExportWatcher, which splices unchanged sections into every rewrite
+        self.watch = watch
+        # With entry points only the files they reach through imports are exported, in dependency order;
+        # the sources are then the roots files are named relative to and Python imports are looked up in
+        self.entry_points = tuple(entry_points)
+        # Where the parsed imports are kept between runs (see DependencyGraph)
+        self.graph_cache = graph_cache
+        # With a revision (or an 'A..B' range) only the files git reports changed are exported, found
+        # without walking the sources, plus up to related_files unchanged files they import or change with
+        self.changed_revision = changed_revision
+        self.related_files = max(0, related_files)
+        # With a size, every exported body is also cut into chunks of at most that many bytes, written as
+        # JSONL next to the export in the same pass; an incremental run writes only the chunks that changed
+        self.chunk_bytes = chunk_bytes
+        # Compiled once here, so change the settings above before building the config, not after
+        self.file_filter = FileFilter(
+            self.extensions,
+            test_exclusions=self.test_exclusions,
+            excluded_dirs=self.excluded_dirs,
+            include_patterns=self.include_patterns,
+            exclude_patterns=self.exclude_patterns,
+            use_ignore_files=use_ignore_files,
+        )
+
+    @property
+    def test_exclusions(self):
+        return TEST_EXCLUSIONS if self.exclude_tests else tuple()
+
+    @property
+    def body_settings(self):
+        """A string that changes whenever these settings would change an exported body or its manifest entry"""
+        settings = f"{BODY_FORMAT}:{self.content_policy.fingerprint}"
+        if self.tokenizer is not None:
+            settings += f":{self.tokenizer.name}"
+        return settings
+
+    @property
+    def extension_description(self):
+        return ", ".join([ext.replace(".", "") for ext in self.extensions])
+
+    def validate(self):
+        if not self.sources:
+            raise ScanError("Please add at least one source directory or file!")
+        if not self.extensions:
+            raise ScanError("Please select at least one file type to scan!")
+        if self.watch and (self.dedupe or self.compression is not None or self.part_limit is not None):
+            raise ScanError("Watch mode keeps a single plain export; "
+                            "turn off deduplication, compression and parts to use it!")
+        if self.part_limit is not None:
+            if self.part_unit not in BALANCE_MODES:
+                raise ScanError(f"Unknown part unit: {self.part_unit}")
+            if self.part_limit < 1:
+                raise ScanError("The per-part limit must be at least 1!")
+            if self.incremental or self.write_index:
+                raise ScanError("Incremental exports and section indexes need a single export file!")
+        if self.compression is not None:
+            if self.compression not in COMPRESSIONS:
+                raise ScanError(f"Unknown compression: {self.compression}")
+            if not compression_available(self.compression):
+                raise ScanError(f"{self.compression} output needs the zstandard package (pip install zstandard)")
+            if self.incremental or self.part_limit is not None:
+                raise ScanError("Compressed output cannot be combined with incremental or split exports!")
+        if self.processes > 1 and (self.dedupe or self.compression is not None or self.part_limit is not None):
+            raise ScanError("Multi-process exports cannot be combined with deduplication, compression or parts!")
+        if self.chunk_bytes is not None:
+            if self.chunk_bytes < 1:
+                raise ScanError("The chunk size must be at least 1 byte!")
+            if self.processes > 1 or self.watch:
+                raise ScanError("Chunks are written by single-process exports only, not in watch mode!")
+        if self.entry_points:
+            if self.watch:
+                raise ScanError("Watch mode exports whole sources and cannot start from entry points!")
+            for entry in self.entry_points:
+                if not os.path.isfile(entry):
+                    raise ScanError(f"Entry point not found: {entry}")
+                if source_of(os.path.abspath(entry), self.sources) is None:
+                    raise ScanError(f"Entry point {entry} is not inside any of the sources!")
+        if self.changed_revision is not None:
+            if self.watch or self.entry_points:
+                raise ScanError("Changed files mode cannot be combined with watch mode or entry points!")
+            if not self.changed_revision.strip():
+                raise ScanError("Please enter the revision to compare with (such as HEAD or main...HEAD)!")
+        elif self.related_files:
+            raise ScanError("Related files are only added to changed files; turn on changed files mode to use them!")
+
+    def matches(self, file_name):
+        return self.file_filter.matches_name(file_name)
+
+
+def extensions_for_groups(groups):
+    """Expand short group names (js, html, ...) into a tuple of extensions"""
+    extensions = []
+    for group in groups:
+        try:
+            extensions.extend(EXTENSION_GROUPS[group])
+        except KeyError:
+            raise ScanError(f"Unknown file type: {group}")
+    return tuple(extensions)
+
+
+def _notify(progress, event, value):
+    if progress is not None:
+        progress(event, value)
+
+
+def _phase(profile, name):
+    """Time a phase of the run in ``profile``, when there is one"""
+    return profile.phase(name) if profile is not None else nullcontext()
+
+
+def scan_directory(file_filter, dir_path, relative_dir, ignore_stack):
+    """List one directory and apply the filter to its entries.
+
+    Returns (matching file names, subdirectory names to descend into, ignore
+    rules in effect for those subdirectories). Mirrors os.walk: unreadable
+    directories are silently skipped and symlinked directories are neither
+    descended into nor treated as files.
+    """
+    matched = []
+    subdirs = []
+    try:
+        with os.scandir(dir_path) as iterator:
+            entries = list(iterator)
+    except OSError:
+        return matched, subdirs, ignore_stack
+
+    posix_dir = relative_dir.replace(os.sep, '/')
+    ignore_stack = file_filter.directory_stack(ignore_stack, dir_path, posix_dir,
+                                               (entry.name for entry in entries))
+    check_ignores = bool(ignore_stack.layers)
+    prefix = posix_dir + '/' if posix_dir else ""
+    excluded_dirs = file_filter.excluded_dirs
+    matches_name = file_filter.matches_name
+
+    for entry in entries:
+        name = entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            # Prune whole subtrees before they are ever listed
+            if entry.is_symlink() or name in excluded_dirs:
+                continue
+            if check_ignores and ignore_stack.ignored(prefix + name, name, True):
+                continue
+            subdirs.append(name)
+        elif matches_name(name):
+            if check_ignores and ignore_stack.ignored(prefix + name, name, False):
+                continue
+            matched.append(name)
+    return matched, subdirs, ignore_stack
+
+
+def walk_source(config, source_path, progress=None, profile=None):
+    """Walk one source and return its matching files as [(relative_path, full_path), ...].
+
+    With more than one worker, each directory listing is a task on a thread
+    pool, so sibling subtrees are listed at the same time. The list comes
+    back in completion order; callers sort it. ``profile`` (a RunProfile)
+    counts the directories listed. Every listing is also sent to
+    ``progress`` as a 'directory' event with (source_path, relative_dir,
+    dir_path, ignore rules it was listed with, scan_directory's result),
+    from the walking thread.
+    """
+    _notify(progress, 'source', source_path)
+    file_filter = config.file_filter
+    found = []
+
+    if os.path.isfile(source_path):
+        # For a single file, the relative path is just its name
+        file_name = os.path.basename(source_path)
+        if file_filter.single_file_selected(file_name):
+            found.append((file_name, source_path))
+            _notify(progress, 'found', file_name)
+        return found
+
+    def collect(relative_dir, dir_path, parent_stack, result):
+        matched, subdirs, ignore_stack = result
+        if profile is not None:
+            profile.count('dirs_visited')
+        _notify(progress, 'directory', (source_path, relative_dir, dir_path, parent_stack, result))
+        for name in matched:
+            relative_path = os.path.join(relative_dir, name)
+            found.append((relative_path, os.path.join(dir_path, name)))
+            _notify(progress, 'found', relative_path)
+        return [(os.path.join(relative_dir, name), os.path.join(dir_path, name), ignore_stack) for name in subdirs]
+
+    root_task = ("", source_path, file_filter.root_stack(source_path))
+
+    if config.walk_workers == 1:
+        # A pool only adds overhead on local disks with a single worker
+        stack = [root_task]
+        while stack:
+            relative_dir, dir_path, ignore_stack = stack.pop()
+            result = scan_directory(file_filter, dir_path, relative_dir, ignore_stack)
+            stack.extend(collect(relative_dir, dir_path, ignore_stack, result)[::-1])
+        return found
+
+    with ThreadPoolExecutor(max_workers=config.walk_workers) as pool:
+        def submit(task):
+            relative_dir, dir_path, ignore_stack = task
+            pending[pool.submit(scan_directory, file_filter, dir_path, relative_dir, ignore_stack)] = task
+
+        pending = {}
+        submit(root_task)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                relative_dir, dir_path, parent_stack = pending.pop(future)
+                for task in collect(relative_dir, dir_path, parent_stack, future.result()):
+                    submit(task)
+
+    return found
+
+
+def iter_sources(config, progress=None, profile=None):
+    """Yield (source_path, sorted [(relative_path, full_path), ...]) for each source in export order.
+
+    Sources are exported sorted by path, each one walked and sorted on its
+    own. The next source is walked in the background while the caller is
+    still consuming the current one.
+    """
+    sources = sorted(set(config.sources))
+    if not sources:
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as lookahead:
+        future = lookahead.submit(walk_source, config, sources[0], progress, profile)
+        for index, source_path in enumerate(sources):
+            code_files = future.result()
+            if index + 1 < len(sources):
+                future = lookahead.submit(walk_source, config, sources[index + 1], progress, profile)
+            code_files.sort()
+            if profile is not None:
+                profile.count('files_matched', len(code_files))
+            yield source_path, code_files
+
+
+def scan(config, progress=None):
+    """Find every matching file in the configured sources.
+
+    Returns a list of (source_path, relative_path, full_path) tuples sorted by
+    source and then by relative path. ``progress``, when given, is called as
+    ``progress(event, value)`` for the 'source' and 'found' events.
+    """
+    config.validate()
+    return [(source_path, rel_path, full_path)
+            for source_path, code_files in iter_sources(config, progress)
+            for rel_path, full_path in code_files]
+
+
+class ExportStats:
+    """Counters describing one export run"""
+
+    def __init__(self):
+        self.total_files = 0
+        self.reused_files = 0
+        self.skipped_files = 0
+        self.truncated_files = 0
+        # Files written as a reference to an identical earlier file, and the bytes that saved
+        self.duplicate_files = 0
+        self.bytes_saved = 0
+        # Per-stage throughput and queue depths of the run
+        self.pipeline = PipelineStats()
+        # RunProfile of the run, when it is profiled
+        self.profile = None
+        # Part files written, when exporting straight into parts
+        self.parts = []
+        # ChunkWriter of the run, when it writes chunks
+        self.chunks = None
+        # Filled in when the export counts tokens
+        self.total_tokens = None
+        self.source_tokens = {}
+        self.file_tokens = []
+
+    @property
+    def read_files(self):
+        return self.total_files - self.reused_files
+
+    def count(self, decision):
+        if decision == SKIP:
+            self.skipped_files += 1
+        elif decision == TRUNCATE:
+            self.truncated_files += 1
+        elif decision == DUPLICATE:
+            self.duplicate_files += 1
+
+    def add_tokens(self, source_path, relative_path, tokens):
+        if tokens is None:
+            return
+        self.total_tokens = (self.total_tokens or 0) + tokens
+        self.source_tokens[source_path] = self.source_tokens.get(source_path, 0) + tokens
+        self.file_tokens.append((tokens, source_path, relative_path))
+
+    def heaviest_files(self, count=DEFAULT_TOP_FILES):
+        """The ``count`` files with the most tokens as (tokens, source_path, relative_path), heaviest first"""
+        return heapq.nlargest(count, self.file_tokens)
+
+    def merge(self, other):
+        """Add the counts of ``other``, the stats of files exported after these"""
+        self.total_files += other.total_files
+        self.reused_files += other.reused_files
+        self.skipped_files += other.skipped_files
+        self.truncated_files += other.truncated_files
+        self.duplicate_files += other.duplicate_files
+        self.bytes_saved += other.bytes_saved
+        if other.total_tokens is not None:
+            self.total_tokens = (self.total_tokens or 0) + other.total_tokens
+            for source_path, tokens in other.source_tokens.items():
+                self.source_tokens[source_path] = self.source_tokens.get(source_path, 0) + tokens
+            self.file_tokens.extend(other.file_tokens)
+        self.pipeline.merge(other.pipeline)
+        if self.profile is not None and other.profile is not None:
+            self.profile.merge(other.profile)
+
+
+class FileBody:
+    """What the writer emits for one file.
+
+    Exactly one of these applies: ``reused`` is a manifest entry whose byte
+    range is copied from the previous export, ``data`` holds the prefetched
+    bytes, or neither is set and the writer streams the file itself, keeping
+    at most ``keep_bytes`` bytes of it and then appending ``trailer``.
+    """
+
+    def __init__(self, size=None, mtime_ns=None, data=None, digest=None, reused=None, decision=INCLUDE, lines=None,
+                 tokens=None):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.data = data
+        self.digest = digest
+        self.lines = lines
+        self.tokens = tokens
+        self.reused = reused
+        self.decision = decision
+        self.keep_bytes = None
+        self.trailer = b""
+        # Time spent classifying and loading the file
+        self.seconds = 0.0
+
+
+def new_digest():
+    return hashlib.blake2b(digest_size=16)
+
+
+class BodyMeter:
+    """Hash, line count, token count and tail of one file's body, fed as it is written.
+
+    Tokens are only counted when a ``tokenizer`` is given; ``tokens`` is
+    None otherwise. A ``chunker`` (a BodyChunker) is fed the body too.
+    """
+
+    def __init__(self, tokenizer=None, chunker=None):
+        self.digest = new_digest()
+        self.newlines = 0
+        self.tail = b""
+        self.tokenizer = tokenizer
+        self.tokens = 0 if tokenizer is not None else None
+        self.chunker = chunker
+
+    def update(self, data):
+        self.digest.update(data)
+        self.newlines += data.count(b"\n")
+        self.tail = (self.tail + data[-2:])[-2:]
+        if self.tokenizer is not None:
+            self.tokens += self.tokenizer.count(data)
+        if self.chunker is not None:
+            self.chunker.update(data)
+
+    @property
+    def lines(self):
+        # The body ends with the newline the exporter adds, which is not a line of its own
+        return self.newlines - 1 + (1 if len(self.tail) > 1 and self.tail[:1] != b"\n" else 0)
+
+    @classmethod
+    def of(cls, data, tokenizer=None):
+        meter = cls(tokenizer)
+        meter.update(data)
+        return meter
+
+
+def copy_file_body(full_path, out, keep_bytes=None, trailer=b"", tokenizer=None, chunker=None):
+    """Append one file's content plus a newline (and ``trailer``) to the binary stream ``out``.
+
+    The file is copied in fixed-size chunks, so memory does not depend on
+    its size: valid UTF-8 as it is, anything else transcoded to UTF-8 (see
+    textEncoding). With ``keep_bytes`` only that many bytes are copied,
+    ending on a whole character. If the file is not the encoding it first
+    looked like, what was copied is cut off and the next candidate is
+    tried; if it cannot be read, an error line is written in its place. Returns (content hash or
+    None on error, line count, token count or None without ``tokenizer``).
+    A ``chunker`` is fed what is copied, and restarted along with the copy.
+    """
+    body_start = out.tell()
+    try:
+        with open(full_path, 'rb') as raw_file:
+            encodings = candidate_encodings(raw_file.read(SAMPLE_BYTES))
+            for encoding in encodings:
+                raw_file.seek(0)
+                if chunker is not None:
+                    chunker.restart()
+                meter = BodyMeter(tokenizer, chunker)
+                try:
+                    for data in iter_utf8(raw_file, encoding, COPY_CHUNK_SIZE, keep_bytes):
+                        meter.update(data)
+                        out.write(data)
+                    break
+                except UnicodeDecodeError:
+                    if encoding == encodings[-1]:
+                        raise
+                    out.seek(body_start)
+                    out.truncate()
+        out.write(b"\n" + trailer)
+        meter.update(b"\n" + trailer)
+        return meter.digest.hexdigest(), meter.lines, meter.tokens
+    except Exception as e:
+        out.seek(body_start)
+        out.truncate()
+        error_line = f"Error reading file: {str(e)}\n".encode('utf-8')
+        out.write(error_line)
+        error_meter = BodyMeter.of(error_line, tokenizer)
+        return None, error_meter.lines, error_meter.tokens
+
+
+def copy_range(source, out, offset, length, chunker=None):
+    """Copy ``length`` bytes starting at ``offset`` of the binary file ``source`` into ``out``, feeding ``chunker``"""
+    source.seek(offset)
+    while length > 0:
+        data = source.read(min(COPY_CHUNK_SIZE, length))
+        if not data:
+            raise ScanError("Previous export is shorter than its manifest says")
+        out.write(data)
+        if chunker is not None:
+            chunker.update(data)
+        length -= len(data)
+
+
+def splice_file(source, out, offset=0, length=None):
+    """Append ``length`` bytes from ``offset`` of the binary file ``source`` (all of it by default) to ``out``.
+
+    copy_file_range can even share the blocks on filesystems that support
+    it; sendfile still saves the trip through user space. Whatever neither
+    managed is copied the ordinary way.
+    """
+    out.flush()
+    source_fd = source.fileno()
+    out_fd = out.fileno()
+    if length is None:
+        length = os.fstat(source_fd).st_size - offset
+    end = offset + length
+    for call in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, call):
+            continue
+        try:
+            while offset < end:
+                if call == 'copy_file_range':
+                    copied = os.copy_file_range(source_fd, out_fd, end - offset, offset)
+                else:
+                    copied = os.sendfile(out_fd, source_fd, offset, end - offset)
+                if not copied:
+                    break
+                offset += copied
+        except OSError:
+            # Not supported between these files (or on this kernel); try the next way from where this one stopped
+            continue
+        if offset >= end:
+            break
+    if offset < end:
+        copy_range(source, out, offset, end - offset)
+    # The bytes went around the buffered writer, so let it find the new end
+    out.seek(0, os.SEEK_END)
+
+
+def load_file_body(full_path, size_limit, previous=None, policy=None, tokenizer=None):
+    """Work out how to export one file, reading it whole if it fits in ``size_limit``.
+
+    Files that ``previous`` (the last run's manifest) shows as unchanged are
+    not opened at all. With a ContentPolicy only the first block is read to
+    decide whether the file is skipped, truncated or included.
+    """
+    try:
+        stat_result = os.stat(full_path)
+        if previous is not None:
+            entry = previous.reusable(full_path, stat_result)
+            if entry is not None:
+                return FileBody(entry['size'], entry['mtime_ns'], digest=entry['hash'], reused=entry,
+                                decision=entry['decision'], lines=entry['lines'], tokens=entry['tokens'])
+
+        size = stat_result.st_size
+        body = FileBody(size, stat_result.st_mtime_ns)
+        if policy is None and size > size_limit:
+            return body
+
+        with open(full_path, 'rb') as raw_file:
+            if policy is not None:
+                by_name = policy.classify_name(os.path.basename(full_path))
+                if by_name is None:
+                    body.decision, reason = policy.classify(os.path.basename(full_path), size,
+                                                            raw_file.read(SNIFF_BYTES))
+                    raw_file.seek(0)
+                else:
+                    body.decision, reason = by_name
+
+                if body.decision == SKIP:
+                    body.data = policy.skip_note(reason, size)
+                elif body.decision == TRUNCATE:
+                    body.keep_bytes = policy.max_file_bytes
+                    body.trailer = policy.truncate_note(size)
+
+            kept_size = size if body.keep_bytes is None else min(size, body.keep_bytes)
+            if body.data is None and kept_size <= size_limit:
+                body.data = read_utf8(raw_file, COPY_CHUNK_SIZE, body.keep_bytes) + b"\n" + body.trailer
+
+        if body.data is not None:
+            meter = BodyMeter.of(body.data, tokenizer)
+            body.digest = meter.digest.hexdigest()
+            body.lines = meter.lines
+            body.tokens = meter.tokens
+        return body
+    except Exception as e:
+        error_line = f"Error reading file: {str(e)}\n".encode('utf-8')
+        error_meter = BodyMeter.of(error_line, tokenizer)
+        return FileBody(data=error_line, lines=error_meter.lines, tokens=error_meter.tokens)
+
+
+class ReadAhead:
+    """Prefetch file bodies on a thread pool while handing them back in their original order.
+
+    ``load(full_path, size_limit)`` runs on the pool and returns a FileBody.
+    Every file in flight reserves an equal share of ``budget_bytes`` as its
+    ``size_limit``; files bigger than that share are not buffered and are
+    left for the writer to stream. Buffered data therefore never exceeds the
+    budget, and about twice ``workers`` files are kept in flight.
+    """
+
+    def __init__(self, workers, budget_bytes, load, pipeline=None):
+        self.workers = workers
+        self.budget_bytes = budget_bytes
+        self.file_limit = max(1, budget_bytes // (2 * workers))
+        self.load = load
+        # PipelineStats to record the read queue's depth and the writer's waits in
+        self.pipeline = pipeline
+
+    def iter_bodies(self, items):
+        """Yield (key, full_path, body) for each (key, full_path) in ``items``"""
+        items = iter(items)
+        window = deque()
+        reserved = 0
+        exhausted = False
+        if self.pipeline is not None:
+            self.pipeline[READ].capacity = self.budget_bytes // self.file_limit
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while not exhausted and (not window or reserved + self.file_limit <= self.budget_bytes):
+                    try:
+                        key, full_path = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    window.append((key, full_path, pool.submit(self.load, full_path, self.file_limit)))
+                    reserved += self.file_limit
+
+                if not window:
+                    break
+
+                if self.pipeline is not None:
+                    self.pipeline[READ].sample_depth(len(window))
+                key, full_path, future = window.popleft()
+                started = time.perf_counter()
+                body = future.result()
+                if self.pipeline is not None:
+                    self.pipeline[WRITE].wait(time.perf_counter() - started)
+                reserved -= self.file_limit
+                yield key, full_path, body
+
+
+def source_of(full_path, sources):
+    """The innermost of ``sources`` holding the absolute ``full_path`` (or being it), or None"""
+    found = None
+    for source_path in sources:
+        root = os.path.abspath(source_path)
+        if full_path == root or full_path.startswith(root.rstrip(os.sep) + os.sep):
+            if found is None or len(root) > len(os.path.abspath(found)):
+                found = source_path
+    return found
+
+
+def iter_graph_files(config, progress=None, profile=None):
+    """Yield ((source_path, relative_path), full_path) for the files ``config.entry_points`` reach, in dependency order.
+
+    Every file comes after the files it imports. Reachable files outside
+    all sources are left out. The file type and name filters do not apply:
+    the imports decide what is exported.
+    """
+    with _phase(profile, 'graph'):
+        graph = DependencyGraph(config.sources, config.excluded_dirs, config.graph_cache, config.walk_workers)
+        ordered = graph.build(config.entry_points).order(config.entry_points)
+        graph.save()
+    if profile is not None:
+        profile.count('graph_files', len(ordered))
+        profile.count('graph_parsed', graph.parsed_files)
+        profile.count('graph_cached', graph.cached_files)
+
+    for full_path in ordered:
+        source_path = source_of(full_path, config.sources)
+        if source_path is None:
+            continue
+        root = os.path.abspath(source_path)
+        if full_path == root:
+            # For a single file, the relative path is just its name
+            yield (source_path, os.path.basename(source_path)), source_path
+            continue
+        relative_path = os.path.relpath(full_path, root)
+        _notify(progress, 'found', relative_path)
+        yield (source_path, relative_path), os.path.join(source_path, relative_path)
+
+
+def related_files(config, changed, limit):
+    """Up to ``limit`` unchanged files most related to the ``changed`` ones, as {full_path: (source_path, relative_path)}.
+
+    ``changed`` maps full paths the same way. A file ranks by how many
+    changed files import it, then by how often it was committed together
+    with them. Candidates go through the same filters as changed files.
+    """
+    graph = DependencyGraph(config.sources, config.excluded_dirs, config.graph_cache, config.walk_workers)
+    imported = {}
+    for full_path in changed:
+        for dep in graph.dependencies(os.path.abspath(full_path)):
+            imported[dep] = imported.get(dep, 0) + 1
+    graph.save()
+
+    history = {}
+    by_source = {}
+    for source_path, relative_path in changed.values():
+        by_source.setdefault(source_path, []).append(relative_path.replace(os.sep, '/'))
+    for source_path, paths in by_source.items():
+        if os.path.isdir(source_path):
+            for path, count in co_changed(source_path, paths).items():
+                history[os.path.abspath(os.path.join(source_path, path))] = count
+
+    known = {os.path.abspath(full_path) for full_path in changed}
+    candidates = sorted((set(imported) | set(history)) - known,
+                        key=lambda path: (-imported.get(path, 0), -history.get(path, 0), path))
+    selectors = {}
+    related = {}
+    for full_path in candidates:
+        if len(related) >= limit:
+            break
+        source_path = source_of(full_path, config.sources)
+        if full_path in known or source_path is None or not os.path.isfile(full_path):
+            continue
+        if full_path == os.path.abspath(source_path):
+            if config.file_filter.single_file_selected(os.path.basename(source_path)):
+                related[source_path] = (source_path, os.path.basename(source_path))
+            continue
+        relative_path = os.path.relpath(full_path, os.path.abspath(source_path))
+        if source_path not in selectors:
+            selectors[source_path] = PathSelector(config.file_filter, source_path)
+        if selectors[source_path].selected(relative_path.replace(os.sep, '/')):
+            related[os.path.join(source_path, relative_path)] = (source_path, relative_path)
+    return related
+
+
+def iter_changed_files(config, progress=None, profile=None):
+    """Yield ((source_path, relative_path), full_path) for the files git reports changed, in export order.
+
+    Each source is asked of git on its own, so sources from different
+    repositories mix freely. The filters apply as in a walk, but no source
+    is walked. With ``config.related_files`` the most related unchanged
+    files (see related_files) are exported among them.
+    """
+    files = {}
+    with _phase(profile, 'git'):
+        try:
+            for source_path in sorted(set(config.sources)):
+                _notify(progress, 'source', source_path)
+                if os.path.isfile(source_path):
+                    file_name = os.path.basename(source_path)
+                    if changed_paths(os.path.dirname(os.path.abspath(source_path)), config.changed_revision,
+                                     (file_name,)) and config.file_filter.single_file_selected(file_name):
+                        files[source_path] = (source_path, file_name)
+                    continue
+                selector = PathSelector(config.file_filter, source_path)
+                for path in changed_paths(source_path, config.changed_revision):
+                    full_path = os.path.join(source_path, *path.split('/'))
+                    # A range names files that may since have been deleted
+                    if selector.selected(path) and os.path.isfile(full_path):
+                        files[full_path] = (source_path, os.path.join(*path.split('/')))
+            if profile is not None:
+                profile.count('files_changed', len(files))
+            if config.related_files and files:
+                related = related_files(config, files, config.related_files)
+                if profile is not None:
+                    profile.count('files_related', len(related))
+                files.update(related)
+        except GitError as e:
+            raise ScanError(str(e))
+
+    # Sorted like a walk, so the export reads the same as a full one with the other files left out
+    for full_path, key in sorted(files.items(), key=lambda item: item[1]):
+        _notify(progress, 'found', key[1])
+        yield key, full_path
+
+
+def iter_export_files(config, progress=None, profile=None):
+    """Yield ((source_path, relative_path), full_path) for every file in export order"""
+    if config.entry_points:
+        yield from iter_graph_files(config, progress, profile)
+        return
+    if config.changed_revision is not None:
+        yield from iter_changed_files(config, progress, profile)
+        return
+    for source_path, code_files in iter_sources(config, progress, profile):
+        for relative_path, full_path in code_files:
+            yield (source_path, relative_path), full_path
+
+
+def iter_file_bodies(config, progress=None, previous=None, pipeline=None, files=None, profile=None):
+    """Yield (source_path, relative_path, full_path, body) in export order, ``body`` being a FileBody.
+
+    The walk runs on a thread of its own at most WALK_QUEUE_FILES ahead of
+    the readers, the read-ahead pool classifies and loads files, and the
+    caller writes them; all three run at once. ``pipeline`` (a
+    PipelineStats) collects the walk and read stages' numbers; the caller
+    adds its own as the writer. ``files``, as iter_export_files yields
+    them, replaces the walk. Each body's ``seconds`` is its load time.
+    """
+    if pipeline is None:
+        pipeline = PipelineStats()
+    if files is None:
+        files = staged(iter_export_files(config, progress, profile), WALK_QUEUE_FILES, pipeline[WALK],
+                       pipeline[READ])
+    policy = config.content_policy if config.content_policy.enabled else None
+    load_body = functools.partial(load_file_body, previous=previous, policy=policy, tokenizer=config.tokenizer)
+    read_stage = pipeline[READ]
+
+    def load(full_path, size_limit):
+        started = time.perf_counter()
+        body = load_body(full_path, size_limit)
+        body.seconds = time.perf_counter() - started
+        read_stage.add(nbytes=len(body.data) if body.data is not None else 0, busy=body.seconds)
+        return body
+
+    if config.read_workers:
+        bodies = ReadAhead(config.read_workers, config.read_ahead_bytes, load, pipeline).iter_bodies(files)
+    else:
+        # Without read-ahead only classify here and let the writer stream every file
+        bodies = ((key, full_path, load(full_path, -1)) for key, full_path in files)
+
+    for (source_path, relative_path), full_path, body in bodies:
+        yield source_path, relative_path, full_path, body
+
+
+def file_body_digest(full_path):
+    """The digest copy_file_body would give a fully included file, without writing it anywhere"""
+    try:
+        with open(full_path, 'rb') as raw_file:
+            encodings = candidate_encodings(raw_file.read(SAMPLE_BYTES))
+            for encoding in encodings:
+                raw_file.seek(0)
+                meter = BodyMeter()
+                try:
+                    for data in iter_utf8(raw_file, encoding, COPY_CHUNK_SIZE):
+                        meter.update(data)
+                    break
+                except UnicodeDecodeError:
+                    if encoding == encodings[-1]:
+                        raise
+    except Exception:
+        return None
+    meter.update(b"\n")
+    return meter.digest.hexdigest()
+
+
+class Deduplicator:
+    """Spots files whose exported body repeats an earlier one, so it is written only once.
+
+    Bodies are compared by the digest the meter already takes while they
+    are read, and only among files of the same size. A streamed file has
+    no digest until it is written, so it is hashed up front, but only when
+    an earlier file has its size.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+        # size -> {digest: (source_path, relative_path)} of the first file with that body
+        self.by_size = {}
+
+    def check(self, source_path, full_path, body):
+        """Return (body to write, bytes saved): a reference body if this one was seen before"""
+        if body.decision != INCLUDE:
+            return body, 0
+        candidates = self.by_size.get(body.size)
+        if not candidates:
+            return body, 0
+        if body.digest is None and body.data is None and body.reused is None:
+            body.digest = file_body_digest(full_path)
+        original = candidates.get(body.digest)
+        if original is None:
+            return body, 0
+
+        original_source, original_path = original
+        label = original_path if original_source == source_path else os.path.join(original_source, original_path)
+        data = f"[Identical to {label}]\n".encode('utf-8')
+        if body.data is not None:
+            full_length = len(body.data)
+        elif body.reused is not None:
+            full_length = body.reused['length']
+        else:
+            full_length = body.size + 1
+        # Tiny files are cheaper to repeat than to refer to
+        if full_length <= len(data):
+            return body, 0
+        meter = BodyMeter.of(data, self.tokenizer)
+        reference = FileBody(body.size, body.mtime_ns, data=data, digest=body.digest, decision=DUPLICATE,
+                             lines=meter.lines, tokens=meter.tokens)
+        return reference, full_length - len(data)
+
+    def remember(self, source_path, relative_path, body, digest):
+        """Record a body that was written in full"""
+        if body.decision == INCLUDE and digest is not None:
+            self.by_size.setdefault(body.size, {}).setdefault(digest, (source_path, relative_path))
+
+
+def start_chunks(chunks, source_path, relative_path, full_path, body):
+    """How one body about to be written goes into ``chunks`` (a ChunkWriter, or None); returns (kept, chunker).
+
+    An unchanged file keeps the chunks of the last run without being
+    chunked again; any other included or truncated body gets a BodyChunker
+    to feed while it is written. Skip notes and references to identical
+    files are not chunked.
+    """
+    if chunks is None or body.decision not in (INCLUDE, TRUNCATE):
+        return None, None
+    if body.reused is not None:
+        kept = chunks.keep(full_path)
+        if kept is not None:
+            return kept, None
+    return None, chunks.open_body(source_path, relative_path, full_path)
+
+
+def finish_chunks(kept, chunker, body, digest):
+    """The chunks of a written body as start_chunks() set it up, or None if it has none"""
+    if chunker is None:
+        return kept
+    if digest is None:
+        # It could not be read and an error line went out in its place
+        chunker.discard()
+        return None
+    # Leave out the newline the exporter adds, so line and byte ranges are the file's own
+    return chunker.finish(1 if body.decision == INCLUDE else 0)
+
+
+def previous_chunks(manifest, settings):
+    """{full_path: (source_path, relative_path, chunks)} of the last run, when its chunks were cut with ``settings``"""
+    if manifest is None or manifest.chunk_settings != settings:
+        return None
+    return {entry['full_path']: (entry['source'], entry['path'], entry['chunks'])
+            for entry in manifest.entries if entry.get('chunks') is not None}
+
+
+def profile_file(profile, full_path, body, write_seconds):
+    """Record one exported file in ``profile``: its load plus write time and the bytes read for it"""
+    if body.reused is not None:
+        profile.count('files_reused')
+    elif body.decision != SKIP:
+        profile.count('files_read')
+        profile.count('bytes_read', body.size or 0)
+    profile.file_time(full_path, body.seconds + write_seconds, body.size or 0)
+
+
+def write_export_header(out, config, token_fields=False):
+    """Write the header every export starts with.
+
+    Returns the offset of its file count field and, with ``token_fields``,
+    a dict of the offsets of the total (key None) and per-source token
+    count fields.
+    """
+    out.write(f"Codebase Export ({config.extension_description} files)\n{'='*80}\n".encode('utf-8'))
+    out.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n".encode('utf-8'))
+    out.write(b"Total Files Found: ")
+    # The count is only known at the end, so reserve room for it and fill it in last
+    count_offset = out.tell()
+    out.write(b" " * COUNT_FIELD_WIDTH + b"\n")
+    token_offsets = {}
+    if token_fields:
+        labels = [(None, f"Total Tokens ({config.tokenizer.name}): ")]
+        labels += [(source_path, f"  Tokens in {source_path}: ") for source_path in sorted(set(config.sources))]
+        for key, label in labels:
+            out.write(label.encode('utf-8'))
+            token_offsets[key] = out.tell()
+            out.write(b" " * COUNT_FIELD_WIDTH + b"\n")
+    out.write(b"\n")
+    return count_offset, token_offsets
+
+
+def fill_field(out, offset, value):
+    """Write ``value`` into the field reserved at ``offset`` and return to the end of ``out``"""
+    out.seek(offset)
+    out.write(str(value).ljust(COUNT_FIELD_WIDTH).encode('utf-8'))
+    out.seek(0, os.SEEK_END)
+
+
+def source_header(source_path):
+    return f"\n\n{'#'*80}\nSource: {source_path}\n{'#'*80}\n".encode('utf-8')
+
+
+def file_header(relative_path, tokens=None):
+    """The lines in front of a file's body; ``tokens`` adds a token count line"""
+    tokens_line = "" if tokens is None else f"Tokens: {tokens}\n"
+    return f"\n\n{'='*80}\nFile: {relative_path}\n{tokens_line}{'='*80}\n\n".encode('utf-8')
+
+
+def write_body(out, full_path, body, previous_export=None, tokenizer=None, chunker=None):
+    """Write one file's body to ``out`` from wherever ``body`` says it comes from; returns (digest, lines, tokens).
+
+    A ``chunker`` is fed the body as it is written.
+    """
+    if body.reused is not None:
+        copy_range(previous_export, out, body.reused['offset'], body.reused['length'], chunker)
+        return body.digest, body.lines, body.tokens
+    if body.data is not None:
+        out.write(body.data)
+        if chunker is not None:
+            chunker.update(body.data)
+        return body.digest, body.lines, body.tokens
+    return copy_file_body(full_path, out, body.keep_bytes, body.trailer, tokenizer, chunker)
+
+
+class SectionWriter:
+    """Writes file sections to an export, keeping its stats, manifest and index up to date.
+
+    Offsets recorded in the manifest and index are positions in ``out``.
+    ``current_source`` is the source of the section just before the first
+    one written here, whose header is then not repeated. With ``chunks``, a
+    ChunkWriter, each body is chunked as it is written.
+    """
+
+    def __init__(self, out, config, stats, manifest, index=None, previous_export=None, current_source=None,
+                 chunks=None):
+        self.out = out
+        self.tokenizer = config.tokenizer
+        self.stats = stats
+        self.manifest = manifest
+        self.index = index
+        self.previous_export = previous_export
+        self.current_source = current_source
+        self.dedup = Deduplicator(config.tokenizer) if config.dedupe else None
+        self.chunks = chunks
+
+    def write_header(self, source_path, relative_path, tokens=None):
+        """Write the headers in front of a file's body; returns (section_offset, tokens_offset).
+
+        When the export counts tokens and ``tokens`` is None, room is left
+        for the count at ``tokens_offset``.
+        """
+        out = self.out
+        # Add source header when source changes
+        if self.current_source != source_path:
+            self.current_source = source_path
+            out.write(source_header(source_path))
+
+        # The splitter cuts on the newline in front of "File: "
+        section_offset = out.tell() + 2 + 80
+        tokens_offset = None
+        if self.tokenizer is None:
+            header = file_header(relative_path)
+        elif tokens is not None:
+            header = file_header(relative_path, tokens)
+        else:
+            # A streamed file is only counted while it is copied, so fill its count in afterwards
+            header = file_header(relative_path, " " * COUNT_FIELD_WIDTH)
+            tokens_offset = out.tell() + header.rindex(b"Tokens: ") + len(b"Tokens: ")
+        out.write(header)
+        return section_offset, tokens_offset
+
+    def write(self, source_path, relative_path, full_path, body):
+        out = self.out
+        stats = self.stats
+        if self.dedup is not None:
+            body, saved = self.dedup.check(source_path, full_path, body)
+            stats.bytes_saved += saved
+
+        section_offset, tokens_offset = self.write_header(source_path, relative_path, body.tokens)
+        kept, chunker = start_chunks(self.chunks, source_path, relative_path, full_path, body)
+        body_offset = out.tell()
+        digest, lines, tokens = write_body(out, full_path, body, self.previous_export, self.tokenizer, chunker)
+        if tokens_offset is not None:
+            fill_field(out, tokens_offset, tokens)
+        if self.dedup is not None:
+            self.dedup.remember(source_path, relative_path, body, digest)
+        if body.reused is not None:
+            stats.reused_files += 1
+        body_length = out.tell() - body_offset
+        body_chunks = finish_chunks(kept, chunker, body, digest)
+        self.manifest.add(source_path, relative_path, full_path, body.size, body.mtime_ns,
+                          digest, body_offset, body_length, body.decision, lines, tokens, body_chunks)
+        if self.index is not None:
+            # The last byte of every body is the newline the exporter adds
+            self.index.add(source_path, relative_path, section_offset, body_offset, body_length - 1, lines, digest,
+                           tokens)
+        stats.count(body.decision)
+        stats.add_tokens(source_path, relative_path, tokens)
+        stats.total_files += 1
+
+
+def write_export(config, output_path, progress=None, profile=None):
+    """Stream every matching file into ``output_path`` as each source is walked.
+
+    The export is built in a temporary file next to the output and moved
+    into place at the end, so a failed or empty run leaves an existing
+    export untouched. With ``config.incremental`` a manifest is kept next to
+    the export and unchanged files are spliced in from the previous export
+    instead of being read again. With ``config.chunk_bytes`` the chunks of
+    every body go to a JSONL file next to the export, moved into place
+    along with it. Returns an ExportStats.
+    """
+    temp_path = output_path + ".partial"
+    stats = ExportStats()
+    stats.profile = profile
+    body_settings = config.body_settings
+    tokenizer = config.tokenizer
+    codec = get_codec(config.compression, config.compression_level) if config.compression else None
+    framed = None
+    with _phase(profile, 'manifest'):
+        previous = ExportManifest.load(output_path, body_settings) if config.incremental else None
+    manifest = ExportManifest(time.time_ns(), body_settings)
+    index = None
+    chunks = None
+
+    try:
+        if config.chunk_bytes is not None:
+            manifest.chunk_settings = chunk_settings(config.chunk_bytes)
+            chunks = stats.chunks = ChunkWriter(chunks_path(output_path), config.chunk_bytes,
+                                                previous_chunks(previous, manifest.chunk_settings))
+        with ExitStack() as stack:
+            out = stack.enter_context(open(temp_path, 'wb'))
+            previous_export = stack.enter_context(open(output_path, 'rb')) if previous is not None else None
+            if codec is not None:
+                # Compression runs on its own thread while this one reads files
+                framed = FrameWriter(out, codec)
+                stack.callback(framed.abort)
+                out = framed
+
+            count_offset, token_offsets = write_export_header(out, config, token_fields=tokenizer is not None)
+            if framed is not None:
+                # The header's counts are filled in last, so it is kept uncompressed and patched in place
+                framed.end_frame(stored=True)
+
+            index = ExportIndex() if config.write_index else None
+
+            with _phase(profile, 'stream'):
+                if config.processes > 1:
+                    write_segments(config, out, stats, manifest, index, previous, output_path, progress)
+                else:
+                    sections = SectionWriter(out, config, stats, manifest, index, previous_export, chunks=chunks)
+                    write_stage = stats.pipeline[WRITE]
+                    for source_path, relative_path, full_path, body in iter_file_bodies(
+                            config, progress, previous, stats.pipeline, profile=profile):
+                        started = time.perf_counter()
+                        section_start = out.tell()
+                        sections.write(source_path, relative_path, full_path, body)
+                        if framed is not None:
+                            framed.end_frame()
+                        elapsed = time.perf_counter() - started
+                        write_stage.add(nbytes=out.tell() - section_start, busy=elapsed)
+                        if profile is not None:
+                            profile_file(profile, full_path, body, elapsed)
+
+            with _phase(profile, 'finish'):
+                fill_field(out, count_offset, stats.total_files)
+                if tokenizer is not None:
+                    fill_field(out, token_offsets[None], stats.total_tokens)
+                    for source_path, offset in token_offsets.items():
+                        if source_path is not None:
+                            fill_field(out, offset, stats.source_tokens.get(source_path, 0))
+                if framed is not None:
+                    text_size = out.tell()
+                    framed.close()
+                    if index is not None:
+                        index.compression = config.compression
+                        index.frames = framed.frames
+                        index.text_size = text_size
+    except BaseException:
+        if chunks is not None:
+            chunks.discard()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    stats.pipeline.finish()
+    with _phase(profile, 'save'):
+        if stats.total_files:
+            if profile is not None:
+                profile.count('bytes_written', os.path.getsize(temp_path))
+            os.replace(temp_path, output_path)
+            if config.incremental:
+                manifest.save(output_path)
+            if index is not None:
+                index.save(output_path)
+            if chunks is not None:
+                chunks.finish()
+        else:
+            os.remove(temp_path)
+            if chunks is not None:
+                chunks.discard()
+    return stats
+
+
+def write_segment(config, files, segment_path, current_source=None, previous=None, previous_path=None,
+                  profiled=False):
+    """Write the sections of ``files`` to ``segment_path`` as they would appear in the middle of an export.
+
+    Runs in a worker process of a multi-process export. ``current_source``
+    is the source of the file before the first one, ``previous`` the part
+    of the previous export's manifest covering ``files``. Returns (stats,
+    manifest, index) with offsets into the segment; with ``profiled`` the
+    stats carry a RunProfile of the segment.
+    """
+    stats = ExportStats()
+    profile = stats.profile = RunProfile('segment') if profiled else None
+    manifest = ExportManifest(0, config.body_settings)
+    index = ExportIndex() if config.write_index else None
+    write_stage = stats.pipeline[WRITE]
+    with ExitStack() as stack:
+        out = stack.enter_context(open(segment_path, 'wb'))
+        previous_export = stack.enter_context(open(previous_path, 'rb')) if previous is not None else None
+        sections = SectionWriter(out, config, stats, manifest, index, previous_export, current_source)
+        for source_path, relative_path, full_path, body in iter_file_bodies(config, previous=previous,
+                                                                             pipeline=stats.pipeline, files=files):
+            started = time.perf_counter()
+            section_start = out.tell()
+            sections.write(source_path, relative_path, full_path, body)
+            elapsed = time.perf_counter() - started
+            write_stage.add(nbytes=out.tell() - section_start, busy=elapsed)
+            if profile is not None:
+                profile_file(profile, full_path, body, elapsed)
+    stats.pipeline.finish()
+    return stats, manifest, index
+
+
+def write_segments(config, out, stats, manifest, index, previous, output_path, progress=None):
+    """Export every file on a pool of ``config.processes`` processes and splice the segments into ``out``.
+
+    The walk happens here; the sorted file list is cut into contiguous
+    shards that the workers turn into segment files next to the output.
+    Segments are appended in order as soon as each one is done, so the
+    export is byte for byte what a single process writes.
+    """
+    started = time.perf_counter()
+    files = list(iter_export_files(config, progress, stats.profile))
+    stats.pipeline[WALK].add(items=len(files), busy=time.perf_counter() - started)
+    if not files:
+        return
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    prefix = os.path.basename(output_path) + "."
+    with ExitStack() as stack:
+        shards = []
+        for [(start, end)] in partition_by_count(len(files), config.processes * SHARDS_PER_PROCESS):
+            fd, segment_path = tempfile.mkstemp(suffix=".segment", prefix=prefix, dir=directory)
+            os.close(fd)
+            stack.callback(os.remove, segment_path)
+            shards.append((start, end, segment_path))
+
+        # Spawned rather than forked: the parent may be running other threads (the GUI, walk pools)
+        pool = ProcessPoolExecutor(max_workers=config.processes, mp_context=multiprocessing.get_context('spawn'))
+        stack.callback(pool.shutdown, cancel_futures=True)
+        futures = []
+        for start, end, segment_path in shards:
+            shard = files[start:end]
+            current_source = files[start - 1][0][0] if start else None
+            shard_previous = None
+            if previous is not None:
+                entries = [previous.by_path[full_path] for _, full_path in shard if full_path in previous.by_path]
+                shard_previous = ExportManifest(previous.started_ns, previous.body_settings, entries)
+            futures.append((segment_path, pool.submit(write_segment, config, shard, segment_path, current_source,
+                                                      shard_previous, output_path, stats.profile is not None)))
+
+        write_stage = stats.pipeline[WRITE]
+        for segment_path, future in futures:
+            started = time.perf_counter()
+            segment_stats, segment_manifest, segment_index = future.result()
+            write_stage.wait(time.perf_counter() - started)
+            started = time.perf_counter()
+            base = out.tell()
+            with open(segment_path, 'rb') as segment:
+                splice_file(segment, out)
+            write_stage.add(items=0, busy=time.perf_counter() - started)
+            stats.merge(segment_stats)
+            manifest.extend(segment_manifest.entries, base)
+            if index is not None:
+                index.extend(segment_index.entries, base)
+
+
+def part_path(output_path, number):
+    """Name of part ``number`` of an export, as the splitter names its parts"""
+    base_name = os.path.splitext(os.path.basename(output_path))[0]
+    return os.path.join(os.path.dirname(output_path), f"{base_name}_part{number}.txt")
+
+
+class ExportPart:
+    """One part file of an export being written straight into parts"""
+
+    def __init__(self, path, first_index):
+        self.path = path
+        self.temp_path = path + ".partial"
+        self.first_index = first_index
+        self.files = 0
+        self.weight = 0
+        self.count_offset = None
+        self.token_offsets = {}
+        self.label_offset = None
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.size = 0
+
+    @property
+    def runs(self):
+        return [(self.first_index, self.first_index + self.files)]
+
+
+class PartedExportWriter:
+    """Streams export sections into numbered part files, starting a new one at a size limit.
+
+    Each part gets the export header and the part header the splitter
+    writes. Part, file and token totals are only known at the end, so
+    their fields are reserved and filled in by finish(). A section that would
+    take a part over the limit is moved to the next part; a section over
+    the limit on its own gets a part to itself.
+    """
+
+    def __init__(self, config, output_path, progress=None):
+        self.config = config
+        self.output_path = output_path
+        self.progress = progress
+        self.limit = config.part_limit
+        self.unit = config.part_unit
+        self.parts = []
+        self.out = None
+        self.source = None
+
+    def weigh(self, data):
+        if self.unit == BY_BYTES:
+            return len(data)
+        if self.unit == BY_TOKENS:
+            return self.config.tokenizer.count(data)
+        return 0
+
+    def start_part(self, source_path):
+        part = ExportPart(part_path(self.output_path, len(self.parts) + 1), sum(p.files for p in self.parts))
+        self.parts.append(part)
+        self.out = open(part.temp_path, 'w+b')
+        header = io.BytesIO()
+        part.count_offset, part.token_offsets = write_export_header(header, self.config,
+                                                                    token_fields=self.config.count_tokens)
+        header.write(b"\n")
+        part.label_offset = header.tell()
+        header.write(b" " * PART_LABEL_WIDTH + b"\n\n")
+        # Every part names the source its first file comes from
+        header.write(source_header(source_path))
+        self.out.write(header.getvalue())
+        self.source = source_path
+        part.weight = self.weigh(header.getvalue())
+        return part
+
+    def end_part(self, part, out, size):
+        out.truncate(size)
+        out.close()
+        part.size = size
+        part.seconds = time.perf_counter() - part.started
+        _notify(self.progress, 'part', (part.path, part.runs, part.size, part.seconds))
+
+    def add(self, source_path, relative_path, full_path, body, chunker=None):
+        """Write one file's section, feeding its body to ``chunker``; returns (digest, tokens).
+
+        Tokens are None when they are not counted.
+        """
+        if self.out is None:
+            self.start_part(source_path)
+        part = self.parts[-1]
+        section_start = self.out.tell()
+        tokens_offset = None
+        if not self.config.count_tokens:
+            section_header = file_header(relative_path)
+        elif body.tokens is not None:
+            section_header = file_header(relative_path, body.tokens)
+        else:
+            # As in a single export, a streamed file's count is filled in once it has been copied
+            section_header = file_header(relative_path, " " * COUNT_FIELD_WIDTH)
+            tokens_offset = section_header.rindex(b"Tokens: ") + len(b"Tokens: ")
+        headers = section_header
+        if source_path != self.source:
+            self.source = source_path
+            headers = source_header(source_path) + section_header
+        self.out.write(headers)
+        file_start = section_start + len(headers) - len(section_header)
+        body_offset = self.out.tell()
+        digest, _, tokens = write_body(self.out, full_path, body, tokenizer=self.config.tokenizer, chunker=chunker)
+        if tokens_offset is not None:
+            fill_field(self.out, file_start + tokens_offset, tokens)
+        # The body was counted as it was read or copied, so it is never read back to be weighed
+        body_weight = tokens if self.unit == BY_TOKENS else self.out.tell() - body_offset
+        weight = 1 if self.unit == BY_COUNT else self.weigh(headers) + body_weight
+
+        if part.files and part.weight + weight > self.limit:
+            # Move the section to a fresh part, which starts with the source header itself
+            full = self.out
+            section_end = full.tell()
+            try:
+                part = self.start_part(source_path)
+                copy_range(full, self.out, file_start, section_end - file_start)
+                self.end_part(self.parts[-2], full, section_start)
+            except BaseException:
+                full.close()
+                raise
+            weight = 1 if self.unit == BY_COUNT else self.weigh(section_header) + body_weight
+        part.files += 1
+        part.weight += weight
+        return digest, tokens
+
+    def finish(self, stats):
+        """Fill in the totals from ``stats``, an ExportStats, and move every part into place; returns the part paths"""
+        total_files = stats.total_files
+        if self.out is not None:
+            out, self.out = self.out, None
+            self.end_part(self.parts[-1], out, out.tell())
+        for number, part in enumerate(self.parts, 1):
+            last_index = part.first_index + part.files
+            label = (f"Part {number} of {len(self.parts)}\n"
+                     f"Contains files {part.first_index + 1} to {last_index} of {total_files}")
+            with open(part.temp_path, 'r+b') as f:
+                fill_field(f, part.count_offset, total_files)
+                for source_path, offset in part.token_offsets.items():
+                    fill_field(f, offset, stats.total_tokens if source_path is None
+                               else stats.source_tokens.get(source_path, 0))
+                f.seek(part.label_offset)
+                f.write(label.ljust(PART_LABEL_WIDTH).encode('utf-8'))
+        for part in self.parts:
+            os.replace(part.temp_path, part.path)
+        return [part.path for part in self.parts]
+
+    def discard(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+        for part in self.parts:
+            if os.path.exists(part.temp_path):
+                os.remove(part.temp_path)
+
+
+def write_parted_export(config, output_path, progress=None, profile=None):
+    """Stream every matching file straight into part files of at most ``config.part_limit``.
+
+    This writes what exporting and then splitting would, without the
+    intermediate export: parts are named like the splitter's, next to
+    ``output_path``. Returns an ExportStats whose ``parts`` lists them.
+    """
+    stats = ExportStats()
+    stats.profile = profile
+    writer = PartedExportWriter(config, output_path, progress)
+    dedup = Deduplicator(config.tokenizer) if config.dedupe else None
+    write_stage = stats.pipeline[WRITE]
+    chunks = None
+    try:
+        if config.chunk_bytes is not None:
+            chunks = stats.chunks = ChunkWriter(chunks_path(output_path), config.chunk_bytes)
+        with _phase(profile, 'stream'):
+            for source_path, relative_path, full_path, body in iter_file_bodies(config, progress,
+                                                                                 pipeline=stats.pipeline,
+                                                                                 profile=profile):
+                started = time.perf_counter()
+                if dedup is not None:
+                    body, saved = dedup.check(source_path, full_path, body)
+                    stats.bytes_saved += saved
+                kept, chunker = start_chunks(chunks, source_path, relative_path, full_path, body)
+                digest, tokens = writer.add(source_path, relative_path, full_path, body, chunker)
+                if dedup is not None:
+                    dedup.remember(source_path, relative_path, body, digest)
+                finish_chunks(kept, chunker, body, digest)
+                elapsed = time.perf_counter() - started
+                write_stage.add(nbytes=body.size or 0, busy=elapsed)
+                if profile is not None:
+                    profile_file(profile, full_path, body, elapsed)
+                stats.count(body.decision)
+                stats.add_tokens(source_path, relative_path, tokens)
+                stats.total_files += 1
+        with _phase(profile, 'finish'):
+            if stats.total_files:
+                stats.parts = writer.finish(stats)
+                if profile is not None:
+                    profile.count('bytes_written', sum(os.path.getsize(path) for path in stats.parts))
+                if chunks is not None:
+                    chunks.finish()
+    finally:
+        writer.discard()
+        if chunks is not None:
+            chunks.discard()
+    stats.pipeline.finish()
+    return stats
+
+
+def export(config, output_path, progress=None, profile=None):
+    """Scan the configured sources and stream them into ``output_path``.
+
+    With ``config.part_limit`` set the export goes straight into parts named
+    after ``output_path`` instead. Returns an ExportStats; nothing is
+    written when no file matched. ``profile``, a RunProfile, collects phase
+    timers, counters and the slowest files; the stats keep it as ``profile``.
+    """
+    config.validate()
+    if profile is not None:
+        progress = profile.timed(progress)
+    if config.part_limit is not None:
+        stats = write_parted_export(config, output_path, progress, profile)
+    else:
+        stats = write_export(config, output_path, progress, profile)
+    if profile is not None:
+        profile.count('files_exported', stats.total_files)
+        profile.count('files_skipped', stats.skipped_files)
+        profile.count('files_truncated', stats.truncated_files)
+        profile.count('duplicate_files', stats.duplicate_files)
+        if stats.chunks is not None:
+            profile.count('chunks_written', stats.chunks.written)
+        profile.finish()
+    return stats
+
+
+def find_section_offsets(data):
+    """Return the offset of every section marker in an export's bytes, in one pass.
+
+    Works on bytes or an mmap, so the export is never decoded or copied.
+    """
+    offsets = []
+    pos = data.find(SECTION_MARKER)
+    while pos != -1:
+        offsets.append(pos)
+        pos = data.find(SECTION_MARKER, pos + len(SECTION_MARKER))
+    return offsets
+
+
+def split(source_file, output_dir, num_pieces, progress=None, balance=BY_COUNT, packing=ORDERED, max_per_part=None,
+          write_workers=DEFAULT_WRITE_WORKERS, profile=None):
+    """Split an export file into parts on its file sections.
+
+    The export is memory-mapped and each part is written by copying byte
+    ranges out of the mapping, so memory use does not grow with the size of
+    the export. Section boundaries come from the export's index when it has
+    an up-to-date one, otherwise from a scan for "\nFile: " markers. A
+    compressed export with an index is read frame by frame; without one it
+    is inflated to a temporary file first.
+
+    ``balance`` picks what parts are evened out on: section count, bytes or
+    estimated tokens. ``packing`` is 'ordered' for contiguous parts or 'lpt'
+    for the tightest balance. With ``max_per_part`` (bytes or tokens) the
+    number of parts follows from the limit and ``num_pieces`` is ignored.
+
+    Parts are written concurrently by ``write_workers`` threads, each into a
+    temporary file that is renamed into place once complete, so a failed
+    run never leaves a half-written part behind.
+
+    Returns a list of (output_file, runs, bytes, seconds) tuples in part
+    order, where ``runs`` are the (start_index, end_index) section ranges in
+    the part and ``seconds`` is how long the part took to write.
+    ``progress`` receives a 'sections' event with the section count and a
+    'part' event for each part as it finishes. ``profile``, a RunProfile,
+    collects phase timers, counters and the slowest parts.
+    """
+    if not source_file or not output_dir:
+        raise ScanError("Please select source file and output directory!")
+
+    if balance not in BALANCE_MODES:
+        raise ScanError(f"Unknown balance mode: {balance}")
+    if packing not in PACKING_MODES:
+        raise ScanError(f"Unknown packing mode: {packing}")
+    if max_per_part is not None:
+        if balance == BY_COUNT:
+            raise ScanError("A per-part limit needs bytes or tokens balancing!")
+        if max_per_part < 1:
+            raise ScanError("The per-part limit must be at least 1!")
+    elif num_pieces < 2:
+        raise ScanError("Number of pieces must be at least 2!")
+
+    compression = detect_compression(source_file)
+    if compression is not None and not compression_available(compression):
+        raise ScanError(f"Reading {compression} exports needs the zstandard package (pip install zstandard)")
+    if profile is not None:
+        progress = profile.timed(progress)
+    with ExitStack() as stack:
+        source = stack.enter_context(open(source_file, 'rb'))
+        if compression is not None:
+            index = ExportIndex.load(source_file)
+            if index is not None and index.frames is not None:
+                # Each part only inflates the frames its sections are in
+                view = FramedView(source, index.frames, get_codec(compression))
+                return write_parts(source_file, view, index.text_size, output_dir, num_pieces, progress,
+                                   balance, packing, max_per_part, write_workers, profile)
+            # Without the frame table the sections can only be found in the inflated text
+            source = stack.enter_context(tempfile.TemporaryFile())
+            with _phase(profile, 'inflate'):
+                inflate(source_file, source)
+
+        size = os.fstat(source.fileno()).st_size
+        # mmap cannot map an empty file
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        try:
+            with memoryview(mapped) as view:
+                return write_parts(source_file, view, size, output_dir, num_pieces, progress,
+                                   balance, packing, max_per_part, write_workers, profile)
+        finally:
+            if size:
+                mapped.close()
+
+
+def section_weights(view, offsets, balance, index=None):
+    """Weight of each section for ``balance``; ``offsets`` ends with the export size.
+
+    Token weights come from the export's ``index`` when it counted the
+    tokens of every file, plus an estimate for the file header. Otherwise
+    they are estimated from the text; a compressed export is then read
+    once, frame by frame, rather than inflating the frames around each
+    section.
+    """
+    bounds = list(zip(offsets, offsets[1:]))
+    if balance == BY_BYTES:
+        return [end - start for start, end in bounds]
+    if index is not None and index.entries and all(entry.tokens is not None for entry in index.entries):
+        return [entry.tokens + estimate_tokens(file_header(entry.path, entry.tokens)) for entry in index.entries]
+    if not isinstance(view, FramedView):
+        return [estimate_tokens(bytes(view[start:end])) for start, end in bounds]
+    weights = []
+    frames = view.iter_frames()
+    # The text read so far that later sections still need, starting at text offset ``buffer_start``
+    buffer = bytearray()
+    buffer_start = 0
+    for start, end in bounds:
+        while buffer_start + len(buffer) < end:
+            frame = next(frames, None)
+            if frame is None:
+                break
+            buffer += frame
+        weights.append(estimate_tokens(bytes(buffer[start - buffer_start:end - buffer_start])))
+        del buffer[:end - buffer_start]
+        buffer_start = end
+    return weights
+
+
+def write_parts(source_file, view, size, output_dir, num_pieces, progress=None, balance=BY_COUNT,
+                packing=ORDERED, max_per_part=None, write_workers=DEFAULT_WRITE_WORKERS, profile=None):
+    """Write the parts of an export whose bytes are ``view``; see split()"""
+    with _phase(profile, 'sections'):
+        # With an index the section boundaries are known without looking at the text
+        index = ExportIndex.load(source_file)
+        if index is not None and index.entries:
+            offsets = [entry.offset for entry in index.entries]
+        else:
+            offsets = find_section_offsets(view.obj)
+
+    if not offsets:
+        raise ScanError("No file sections found in the source file!")
+
+    total_sections = len(offsets)
+    _notify(progress, 'sections', total_sections)
+
+    offsets.append(size)
+    with _phase(profile, 'plan'):
+        if balance == BY_COUNT:
+            plan = partition_by_count(total_sections, num_pieces)
+            # Parts are numbered out of the requested count, as they always were
+            part_count = num_pieces
+        else:
+            plan = plan_parts(section_weights(view, offsets, balance, index), num_pieces, max_per_part, packing)
+            part_count = len(plan)
+
+    base_name = os.path.splitext(os.path.basename(strip_compression_suffix(source_file)))[0]
+    parts = [None] * len(plan)
+
+    with _phase(profile, 'write'), ThreadPoolExecutor(max_workers=max(1, write_workers)) as pool:
+        futures = {}
+        for i, runs in enumerate(plan):
+            output_file = os.path.join(output_dir, f"{base_name}_part{i+1}.txt")
+            part_header = f"\nPart {i+1} of {part_count}\n"
+            if len(runs) == 1:
+                start_idx, end_idx = runs[0]
+                part_header += f"Contains files {start_idx + 1} to {end_idx} of {total_sections}\n\n"
+            else:
+                files = sum(end_idx - start_idx for start_idx, end_idx in runs)
+                part_header += f"Contains {files} of {total_sections} files\n\n"
+            # Each run of sections is one contiguous byte range of the export
+            ranges = [(0, offsets[0])] + [(offsets[start_idx], offsets[end_idx]) for start_idx, end_idx in runs]
+            future = pool.submit(write_part, output_file, view, ranges, part_header.encode('utf-8'))
+            futures[future] = (i, output_file, runs)
+
+        try:
+            # Report parts as they finish, from this thread, so callers can touch their UI
+            for future in as_completed(futures):
+                i, output_file, runs = futures[future]
+                written, seconds = future.result()
+                part = (output_file, runs, written, seconds)
+                parts[i] = part
+                if profile is not None:
+                    profile.file_time(output_file, seconds, written)
+                _notify(progress, 'part', part)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    if profile is not None:
+        profile.count('sections', total_sections)
+        profile.count('parts', len(parts))
+        profile.count('bytes_written', sum(part[2] for part in parts))
+        profile.finish()
+    return parts
+
+
+def write_part(output_file, view, ranges, part_header):
+    """Write one part through a temporary file so it only appears once complete.
+
+    The part is the first byte range of ``view`` (the export header), then
+    ``part_header``, then the remaining ranges. Returns (bytes, seconds).
+    """
+    started = time.perf_counter()
+    temp_path = output_file + ".partial"
+    f = open(temp_path, 'wb')
+    try:
+        with f:
+            (start, end), *sections = ranges
+            f.write(view[start:end])
+            f.write(part_header)
+            for start, end in sections:
+                # In slices, so a compressed export is never inflated more than a slice at a time
+                for slice_start in range(start, end, PART_SLICE_BYTES):
+                    f.write(view[slice_start:min(slice_start + PART_SLICE_BYTES, end)])
+            written = f.tell()
+        os.replace(temp_path, output_file)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return written, time.perf_counter() - started
+
+
+def show(export_path, path, source=None):
+    """Return one file's content from an indexed export without reading the rest of it"""
+    index = ExportIndex.load(export_path)
+    if index is None:
+        raise ScanError(f"No up-to-date index found for {export_path}")
+    entry = index.find(path, source)
+    if entry is None:
+        raise ScanError(f"{path} is not in {export_path}")
+    if index.compression is not None and not compression_available(index.compression):
+        raise ScanError(f"Reading {index.compression} exports needs the zstandard package (pip install zstandard)")
+    return read_content(export_path, entry, index)
+
+
+def token_report(stats, count=DEFAULT_TOP_FILES):
+    """Lines summarising the token counts of an export: total, per source and the heaviest files"""
+    lines = [f"Total tokens: {stats.total_tokens}"]
+    for source_path, tokens in sorted(stats.source_tokens.items()):
+        lines.append(f"  {source_path}: {tokens}")
+    heaviest = stats.heaviest_files(count)
+    if heaviest:
+        lines.append(f"Heaviest {len(heaviest)} files:")
+        width = len(str(heaviest[0][0]))
+        for tokens, source_path, relative_path in heaviest:
+            share = 100.0 * tokens / stats.total_tokens if stats.total_tokens else 0.0
+            lines.append(f"  {tokens:>{width}}  {share:5.1f}%  {os.path.join(source_path, relative_path)}")
+    return lines
+
+
+def format_rate(written, seconds):
+    """Describe ``written`` bytes taking ``seconds`` as size, time and throughput"""
+    mib = written / (1024 * 1024)
+    rate = mib / seconds if seconds > 0 else 0.0
+    return f"{mib:.2f} MiB in {seconds:.3f}s, {rate:.1f} MiB/s"
+
+
+def _print_progress(event, value):
+    if event == 'source':
+        print(f"Processing source: {value}", file=sys.stderr)
+    elif event == 'part':
+        output_file, runs, written, seconds = value
+        files = sum(end_idx - start_idx for start_idx, end_idx in runs)
+        print(f"Created: {os.path.basename(output_file)} ({files} files, {format_rate(written, seconds)})",
+              file=sys.stderr)
+    elif event == 'update':
+        print(f"Export updated: {value.total_files} files, {value.read_files} re-read "
+              f"({value.pipeline.elapsed:.2f}s)", file=sys.stderr)
+
+
+def report_profile(profile, args, pipeline=None):
+    """Print and save the run profile as the profiling flags ask"""
+    if args.profile:
+        print("\n".join(profile.lines()))
+    if args.report:
+        profile.save(args.report, pipeline)
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help="print phase timings, counters and the slowest files after the run")
+    parser.add_argument('--report', metavar='PATH', help="write the run profile as JSON to PATH")
+    parser.add_argument('--cprofile', metavar='PATH',
+                        help="run under cProfile on every thread and dump the stats to PATH, for pstats or snakeviz")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="scanEngine", description="Export code files into one text file, headless.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="scan sources and write a single export file")
+    export_parser.add_argument('sources', nargs='+', help="source directories or files")
+    export_parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT_NAME, help="output file path")
+    export_parser.add_argument('-t', '--type', dest='types', action='append', choices=sorted(EXTENSION_GROUPS),
+                               help="file type to include (repeatable, default: js and ts)")
+    export_parser.add_argument('--include-tests', action='store_true', help="keep .spec.* and .test.* files")
+    export_parser.add_argument('-e', '--entry', dest='entry_points', action='append', default=[], metavar='FILE',
+                               help="export only the files FILE reaches through its imports, in dependency order "
+                                    "(repeatable); the sources are the roots paths are named relative to")
+    export_parser.add_argument('--graph-cache', metavar='PATH',
+                               help=f"where parsed imports are kept between --entry and --related runs "
+                                    f"(default: the output path plus {GRAPH_SUFFIX})")
+    export_parser.add_argument('--changed', dest='changed_revision', nargs='?', const=DEFAULT_REVISION, metavar='REV',
+                               help=f"export only the files changed since REV (default: {DEFAULT_REVISION}), staged, "
+                                    f"unstaged or untracked, or within a range such as main...HEAD; "
+                                    f"asks git instead of walking the sources")
+    export_parser.add_argument('--related', type=int, default=0, metavar='N',
+                               help="with --changed, add the N unchanged files most related to the changed ones: "
+                                    "the files they import, then the files most often committed with them")
+    export_parser.add_argument('--include', dest='include_patterns', action='append', default=[], metavar='GLOB',
+                               help="also export files whose name matches GLOB (repeatable)")
+    export_parser.add_argument('--exclude', dest='exclude_patterns', action='append', default=[], metavar='PATTERN',
+                               help="gitignore-style pattern to leave out (repeatable)")
+    export_parser.add_argument('--no-ignore-files', action='store_true',
+                               help="do not honour .gitignore and .ignore files")
+    export_parser.add_argument('--max-file-kb', type=int, default=DEFAULT_MAX_FILE_BYTES // 1024,
+                               help="files above this size are truncated, 0 for no limit (default: %(default)s)")
+    export_parser.add_argument('--skip-oversized', action='store_true',
+                               help="skip files above --max-file-kb instead of truncating them")
+    export_parser.add_argument('--keep-all-content', action='store_true',
+                               help="do not skip binary, generated, minified or lock files")
+    export_parser.add_argument('-j', '--workers', type=int, default=DEFAULT_WALK_WORKERS,
+                               help=f"directory listing threads (default: {DEFAULT_WALK_WORKERS})")
+    export_parser.add_argument('--read-workers', type=int, default=DEFAULT_READ_WORKERS,
+                               help=f"threads reading files ahead of the writer, 0 to disable (default: {DEFAULT_READ_WORKERS})")
+    export_parser.add_argument('-p', '--processes', type=int, default=1,
+                               help="processes reading and writing files, for very large trees (default: 1)")
+    export_parser.add_argument('--read-ahead-mb', type=int, default=DEFAULT_READ_AHEAD_BYTES // (1024 * 1024),
+                               help="memory budget for read-ahead file data in MiB (default: %(default)s)")
+    export_parser.add_argument('--index', action='store_true',
+                               help="write a section index next to the output for direct lookups and fast splitting")
+    export_parser.add_argument('--max-per-part', type=int, metavar='N',
+                               help="write parts of at most N --part-unit instead of one file, named like split's")
+    export_parser.add_argument('--part-unit', choices=BALANCE_MODES, default=BY_BYTES,
+                               help="what --max-per-part counts (default: %(default)s)")
+    export_parser.add_argument('--tokens', action='store_true',
+                               help="count tokens per file and source and report the heaviest files")
+    export_parser.add_argument('--tokenizer', default=EstimateTokenizer.name,
+                               help="'estimate' or a tiktoken encoding such as cl100k_base (default: %(default)s)")
+    export_parser.add_argument('--top', type=int, default=DEFAULT_TOP_FILES,
+                               help="files listed in the token report (default: %(default)s)")
+    export_parser.add_argument('--chunks', dest='chunk_bytes', type=int, nargs='?', const=DEFAULT_CHUNK_BYTES,
+                               metavar='BYTES',
+                               help=f"also write every file in chunks of at most BYTES (default: {DEFAULT_CHUNK_BYTES}) "
+                                    f"as JSONL records next to the output, for embedding; with --incremental "
+                                    f"only the chunks that changed are written")
+    export_parser.add_argument('--dedupe', action='store_true',
+                               help="write identical files once and reference the first copy")
+    export_parser.add_argument('--compress', choices=COMPRESSIONS,
+                               help="write the export compressed (zstd needs the zstandard package); "
+                                    "the suffix is added to --output")
+    export_parser.add_argument('--compress-level', type=int, help="compression level (default: codec default)")
+    export_parser.add_argument('-i', '--incremental', action='store_true',
+                               help="keep a manifest next to the output and reuse unchanged files on the next run")
+    export_parser.add_argument('-w', '--watch', action='store_true',
+                               help="keep running and rewrite the changed sections whenever files change")
+    export_parser.add_argument('--poll', action='store_true', help="with --watch, poll instead of using inotify")
+    export_parser.add_argument('--poll-interval', type=float, default=1.0,
+                               help="seconds between polls with --watch --poll (default: %(default)s)")
+    export_parser.add_argument('--stage-stats', action='store_true',
+                               help="report per-stage throughput and queue depths, and which stage limited the run")
+    add_profile_arguments(export_parser)
+    export_parser.add_argument('-q', '--quiet', action='store_true', help="do not print progress")
+
+    split_parser = subparsers.add_parser('split', help="split an export file into parts")
+    split_parser.add_argument('source', help="export file to split")
+    split_parser.add_argument('-n', '--pieces', type=int, default=2, help="number of parts (default: 2)")
+    split_parser.add_argument('--balance', choices=BALANCE_MODES, default=BY_COUNT,
+                              help="what to even out across parts (default: %(default)s)")
+    split_parser.add_argument('--packing', choices=PACKING_MODES, default=ORDERED,
+                              help="'ordered' keeps each part a contiguous run of files, "
+                                   "'lpt' balances tighter but mixes the order (default: %(default)s)")
+    split_parser.add_argument('--max-per-part', type=int, metavar='N',
+                              help="at most N bytes or tokens per part; the number of parts follows from it")
+    split_parser.add_argument('-j', '--workers', type=int, default=DEFAULT_WRITE_WORKERS,
+                              help=f"parts written at once (default: {DEFAULT_WRITE_WORKERS})")
+    split_parser.add_argument('-d', '--output-dir', help="directory for the parts (default: next to the source)")
+    add_profile_arguments(split_parser)
+    split_parser.add_argument('-q', '--quiet', action='store_true', help="do not print progress")
+
+    show_parser = subparsers.add_parser('show', help="print one file from an indexed export")
+    show_parser.add_argument('export', help="export file written with --index")
+    show_parser.add_argument('path', help="relative path of the file, as in its 'File:' line")
+    show_parser.add_argument('--source', help="source root, if the path exists in several")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    progress = None if getattr(args, 'quiet', False) else _print_progress
+    profile = None
+    if getattr(args, 'profile', False) or getattr(args, 'report', None) or getattr(args, 'cprofile', None):
+        profile = RunProfile(args.command)
+
+    tracing = ExitStack()
+    if profile is not None and args.cprofile:
+        tracing.enter_context(profile.trace(args.cprofile))
+
+    try:
+        if args.command == 'export':
+            try:
+                tokenizer = get_tokenizer(args.tokenizer) if args.tokens else None
+            except (ValueError, KeyError) as e:
+                raise ScanError(str(e).strip('"'))
+            config = ScanConfig(
+                args.sources,
+                extensions=extensions_for_groups(args.types or DEFAULT_GROUPS),
+                exclude_tests=not args.include_tests,
+                walk_workers=args.workers,
+                read_workers=args.read_workers,
+                read_ahead_bytes=args.read_ahead_mb * 1024 * 1024,
+                processes=args.processes,
+                incremental=args.incremental,
+                write_index=args.index,
+                part_limit=args.max_per_part,
+                part_unit=args.part_unit,
+                tokenizer=tokenizer,
+                compression=args.compress,
+                dedupe=args.dedupe,
+                compression_level=args.compress_level,
+                include_patterns=args.include_patterns,
+                exclude_patterns=args.exclude_patterns,
+                use_ignore_files=not args.no_ignore_files,
+                entry_points=args.entry_points,
+                graph_cache=args.graph_cache or (args.output + GRAPH_SUFFIX
+                                                 if args.entry_points or args.related else None),
+                changed_revision=args.changed_revision,
+                related_files=args.related,
+                chunk_bytes=args.chunk_bytes,
+                content_policy=ContentPolicy(
+                    max_file_bytes=args.max_file_kb * 1024,
+                    oversize_action=SKIP if args.skip_oversized else TRUNCATE,
+                    skip_binary=not args.keep_all_content,
+                    skip_generated=not args.keep_all_content,
+                    skip_minified=not args.keep_all_content,
+                ),
+            )
+            if args.compress and not args.output.endswith(COMPRESSION_SUFFIXES[args.compress]):
+                args.output += COMPRESSION_SUFFIXES[args.compress]
+            watcher = None
+            if args.watch:
+                # Imported here because the watcher is built on this module
+                from exportWatcher import ExportWatcher
+                watcher = ExportWatcher(config, args.output, progress, interval=args.poll_interval,
+                                        use_inotify=not args.poll)
+                stats = watcher.start(profile)
+            else:
+                stats = export(config, args.output, progress, profile)
+            if not stats.total_files:
+                print("No matching files found in the selected sources.", file=sys.stderr)
+                return 1
+            destination = f"{len(stats.parts)} parts" if stats.parts else args.output
+            print(f"Exported {stats.total_files} files to {destination} "
+                  f"({stats.read_files} read, {stats.reused_files} reused, "
+                  f"{stats.skipped_files} skipped, {stats.truncated_files} truncated)")
+            if stats.chunks is not None:
+                print(f"Wrote {stats.chunks.written} of {stats.chunks.chunks} chunks"
+                      f"{f', {stats.chunks.removed} removed' if stats.chunks.removed else ''} to {stats.chunks.path}")
+            if args.dedupe:
+                print(f"{stats.duplicate_files} duplicate files written as references, {stats.bytes_saved} bytes saved")
+            if args.tokens:
+                print("\n".join(token_report(stats, args.top)))
+            if args.stage_stats:
+                print("\n".join(stats.pipeline.report()))
+            if profile is not None:
+                report_profile(profile, args, stats.pipeline)
+            if watcher is not None:
+                print(f"Watching for changes ({watcher.mode}), press Ctrl+C to stop", file=sys.stderr)
+                try:
+                    watcher.run()
+                except KeyboardInterrupt:
+                    pass
+        elif args.command == 'show':
+            sys.stdout.buffer.write(show(args.export, args.path, args.source))
+        else:
+            output_dir = args.output_dir or os.path.dirname(os.path.abspath(args.source))
+            started = time.perf_counter()
+            parts = split(args.source, output_dir, args.pieces, progress, balance=args.balance,
+                          packing=args.packing, max_per_part=args.max_per_part, write_workers=args.workers,
+                          profile=profile)
+            written = sum(part[2] for part in parts)
+            print(f"Split {args.source} into {len(parts)} parts "
+                  f"({format_rate(written, time.perf_counter() - started)})")
+            if profile is not None:
+                report_profile(profile, args)
+    except (ScanError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        tracing.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import heapq
+import math
+from bisect import bisect_right
+from itertools import accumulate
+
+# What a part is balanced on
+BY_COUNT = 'count'
+BY_BYTES = 'bytes'
+BY_TOKENS = 'tokens'
+BALANCE_MODES = (BY_COUNT, BY_BYTES, BY_TOKENS)
+
+# How sections are packed into parts
+ORDERED = 'ordered'  # every part is a contiguous run of sections, in export order
+LPT = 'lpt'          # largest sections first onto the lightest part; best balance, parts are not contiguous
+PACKING_MODES = (ORDERED, LPT)
+
+# Every function below returns a list of parts, each a list of (start, end)
+# section index ranges in export order.
+
+
+def partition_by_count(total, num_pieces):
+    """The original split: ceil(total / num_pieces) sections per part"""
+    per_part = math.ceil(total / num_pieces)
+    return [[(start, min(start + per_part, total))] for start in range(0, total, per_part)]
+
+
+def _parts_needed(prefix, capacity, limit):
+    """Greedily cut ``prefix`` (running totals) into parts of at most ``capacity``; None once over ``limit``"""
+    total = len(prefix) - 1
+    start = 0
+    parts = 0
+    while start < total:
+        parts += 1
+        if parts > limit:
+            return None
+        # The furthest end whose running total still fits, but always take at least one section
+        end = bisect_right(prefix, prefix[start] + capacity) - 1
+        start = max(end, start + 1)
+    return parts
+
+
+def partition_ordered(weights, num_pieces):
+    """Contiguous parts that minimise the heaviest part.
+
+    Binary-searches the smallest capacity for which a greedy cut needs no
+    more than ``num_pieces`` parts; each probe is O(num_pieces log n).
+    """
+    prefix = [0] + list(accumulate(weights))
+    low, high = max(weights, default=0), prefix[-1]
+    while low < high:
+        middle = (low + high) // 2
+        if _parts_needed(prefix, middle, num_pieces) is None:
+            low = middle + 1
+        else:
+            high = middle
+    return partition_max(weights, low, prefix)
+
+
+def partition_lpt(weights, num_pieces):
+    """Longest-processing-time bin packing: heaviest section first onto the lightest part.
+
+    O(n log n) for the sort plus O(n log num_pieces) for the heap. Sections
+    keep their export order inside each part.
+    """
+    loads = [(0, part) for part in range(min(num_pieces, len(weights)))]
+    members = [[] for _ in loads]
+    for index in sorted(range(len(weights)), key=weights.__getitem__, reverse=True):
+        load, part = heapq.heappop(loads)
+        members[part].append(index)
+        heapq.heappush(loads, (load + weights[index], part))
+
+    parts = []
+    for indices in members:
+        indices.sort()
+        runs = []
+        for index in indices:
+            if runs and runs[-1][1] == index:
+                runs[-1] = (runs[-1][0], index + 1)
+            else:
+                runs.append((index, index + 1))
+        parts.append(runs)
+    # Number the parts in the order their first section appears in the export
+    parts.sort(key=lambda runs: runs[0][0])
+    return parts
+
+
+def partition_max(weights, max_weight, prefix=None):
+    """Contiguous parts of at most ``max_weight`` each; a single heavier section gets a part to itself"""
+    if prefix is None:
+        prefix = [0] + list(accumulate(weights))
+    total = len(weights)
+    parts = []
+    start = 0
+    while start < total:
+        end = max(bisect_right(prefix, prefix[start] + max_weight) - 1, start + 1)
+        parts.append([(start, end)])
+        start = end
+    return parts
+
+
+def plan_parts(weights, num_pieces=None, max_per_part=None, packing=ORDERED):
+    """Assign sections with the given ``weights`` to parts.
+
+    With ``max_per_part`` the number of parts follows from the limit and
+    ``num_pieces`` is ignored; otherwise the sections are balanced over
+    ``num_pieces`` parts with the chosen packing.
+    """
+    if max_per_part:
+        return partition_max(weights, max_per_part)
+    if packing == LPT:
+        return partition_lpt(weights, num_pieces)
+    return partition_ordered(weights, num_pieces)
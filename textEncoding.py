@@ -0,0 +1,174 @@
+import codecs
+import io
+
+UTF8 = 'utf-8'
+# Tried in turn when a file without a BOM is not valid UTF-8. Most "Latin-1"
+# source files are really cp1252; latin-1 decodes any byte, so it always ends the list.
+FALLBACK_ENCODINGS = ('cp1252', 'latin-1')
+
+# Bytes looked at to recognise an encoding
+SAMPLE_BYTES = 4096
+# Share of the odd (or even) bytes of a sample that must be NUL for BOM-less UTF-16
+UTF16_NUL_SHARE = 0.9
+
+# UTF-32 first: its little-endian BOM starts with the UTF-16 one
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, UTF8),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def sniff_encoding(head):
+    """The encoding ``head`` (a file's first bytes) announces by a BOM or by its NUL pattern, or None.
+
+    None means UTF-8 or, when the file turns out not to be valid UTF-8,
+    one of FALLBACK_ENCODINGS. A UTF-8 BOM gives UTF8 and stays part of
+    the content.
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    sample = head[:SAMPLE_BYTES]
+    half = len(sample) // 2
+    if half and b"\0" in sample:
+        # Mostly-ASCII UTF-16 has a NUL in every other byte
+        even_nuls = sample[0::2].count(0)
+        odd_nuls = sample[1::2].count(0)
+        if odd_nuls >= UTF16_NUL_SHARE * half and even_nuls < (1 - UTF16_NUL_SHARE) * half:
+            return 'utf-16-le'
+        if even_nuls >= UTF16_NUL_SHARE * half and odd_nuls < (1 - UTF16_NUL_SHARE) * half:
+            return 'utf-16-be'
+    return None
+
+
+def is_text_encoding(head):
+    """Whether the NULs in ``head`` belong to UTF-16 or UTF-32 text rather than binary data"""
+    encoding = sniff_encoding(head)
+    return encoding is not None and encoding != UTF8
+
+
+def candidate_encodings(head):
+    """Encodings to try in order for a file starting with ``head``; the last one decodes anything"""
+    encoding = sniff_encoding(head)
+    if encoding is not None and encoding != UTF8:
+        # A NUL pattern can mislead, and a UTF-16 file can be cut short
+        return (encoding, UTF8) + FALLBACK_ENCODINGS
+    return (UTF8,) + FALLBACK_ENCODINGS
+
+
+def translate_newlines(data):
+    """What reading ``data`` in text mode gives: \\r\\n and lone \\r become \\n"""
+    if b"\r" not in data:
+        return data
+    return data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+
+def iter_utf8(raw_file, encoding, chunk_size, keep_bytes=None):
+    """Yield the content of the binary file ``raw_file`` as UTF-8 with newlines translated, as text mode reads it.
+
+    UTF-8 content is validated and passed through as the bytes read, never
+    decoded into text and encoded again; any other encoding goes through a
+    text decoder. With ``keep_bytes`` at most that many bytes of UTF-8 are
+    yielded, cut at a character boundary. Raises UnicodeDecodeError when
+    the file is not valid ``encoding``, possibly after some chunks were
+    already yielded.
+    """
+    remaining = keep_bytes
+    if encoding == UTF8:
+        decoder = codecs.getincrementaldecoder(UTF8)()
+        pending_cr = False
+        # With a limit, the start of a character split over two chunks waits for the rest of it
+        carry = b""
+        while True:
+            chunk = raw_file.read(chunk_size)
+            if not chunk:
+                break
+            if pending_cr:
+                chunk = b"\r" + chunk
+            # A \r at the end may be the first half of a \r\n split over two chunks
+            pending_cr = chunk.endswith(b"\r")
+            if pending_cr:
+                chunk = chunk[:-1]
+            chunk = translate_newlines(chunk)
+            last = remaining is not None and len(carry) + len(chunk) >= remaining
+            if last:
+                chunk = chunk[:remaining - len(carry)]
+            # ASCII is valid on its own, unless it has to finish a sequence from the last chunk
+            if not chunk.isascii() or decoder.getstate()[0]:
+                decoder.decode(chunk)
+            if remaining is None:
+                yield chunk
+                continue
+            data = carry + chunk if carry else chunk
+            split = len(data) - len(decoder.getstate()[0])
+            if last:
+                # A character the limit cuts in two is left out
+                yield data[:split]
+                return
+            carry = data[split:]
+            remaining -= split
+            yield data[:split]
+        decoder.decode(b"", True)
+        if pending_cr:
+            yield b"\n"
+        return
+
+    code_file = io.TextIOWrapper(raw_file, encoding=encoding)
+    try:
+        while remaining is None or remaining > 0:
+            # Every character takes at least a byte, so reading no more characters than bytes left is enough
+            chunk = code_file.read(chunk_size if remaining is None else min(chunk_size, remaining)).encode(UTF8)
+            if not chunk:
+                break
+            if remaining is not None and len(chunk) >= remaining:
+                cut = remaining
+                # Never split a UTF-8 sequence
+                while 0 < cut < len(chunk) and chunk[cut] & 0xC0 == 0x80:
+                    cut -= 1
+                yield chunk[:cut]
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        # Leave the binary file open for the caller
+        code_file.detach()
+
+
+def to_utf8(data):
+    """A whole file's bytes as UTF-8 with newlines translated, trying each candidate encoding in turn"""
+    head = data[:SAMPLE_BYTES]
+    if data.isascii() and b"\0" not in head:
+        return translate_newlines(data)
+    encodings = candidate_encodings(head)
+    for encoding in encodings:
+        try:
+            if encoding == UTF8:
+                # Decoding only validates; the bytes themselves are kept
+                data.decode(UTF8)
+                return translate_newlines(data)
+            return translate_newlines(data.decode(encoding).encode(UTF8))
+        except UnicodeDecodeError:
+            if encoding == encodings[-1]:
+                raise
+
+
+def read_utf8(raw_file, chunk_size, keep_bytes=None):
+    """The content of the binary file ``raw_file`` as UTF-8 bytes, trying each candidate encoding in turn.
+
+    Without ``keep_bytes`` the file is read whole, so only call it for files
+    that may be held in memory.
+    """
+    if keep_bytes is None:
+        return to_utf8(raw_file.read())
+    encodings = candidate_encodings(raw_file.read(SAMPLE_BYTES))
+    for encoding in encodings:
+        raw_file.seek(0)
+        try:
+            return b"".join(iter_utf8(raw_file, encoding, chunk_size, keep_bytes))
+        except UnicodeDecodeError:
+            if encoding == encodings[-1]:
+                raise